@@ -0,0 +1,59 @@
+"""
+Benchmark and accuracy of the fast chroma mode against visualize.chromagram
+
+Renders every major and minor triad of the octaves 3 to 5 with the (seeded) numpy backend and compares
+features.chroma(mode='cqt', hpss=True), the computation behind visualize.chromagram, with
+features.chroma(mode='stft', hpss=False), the computation behind visualize.fast_chromagram.
+
+Accuracy is measured as
+    - the cosine similarity of the mean chroma vectors of both modes
+    - the share of chords whose 3 strongest pitch classes are the notes of the chord
+
+Usage: python examples/chroma_benchmark.py [sr]
+"""
+import sys
+from time import time
+
+import numpy as np
+
+from sox_chords.music.chords import triad
+from sox_chords.music.utils import get_core_notes
+from sox_chords.util import features
+from sox_chords.util.synth import NumpyBackend
+
+
+def get_chords(octaves=(3, 4, 5)):
+    return [chord(note) for octave in octaves for note in get_core_notes(octave)
+            for chord in [triad.MajorTriad, triad.MinorTriad]]
+
+
+def top_pitch_classes_match(c, chord):
+    expected = set(semi_tone % 12 for semi_tone in chord.get_semi_tones())
+    return set(np.argsort(c.mean(axis=-1))[-len(expected):]) == expected
+
+
+def benchmark(sr=22050, repeats=3):
+    chords = get_chords()
+    backend = NumpyBackend(seed=0)
+    frames = np.stack([chord.render(duration=1., sr=sr, bits=16, backend=backend) for chord in chords])
+    modes = [("cqt + hpss (chromagram)", dict(mode="cqt", hpss=True)),
+             ("stft (fast_chromagram)", dict(mode="stft", hpss=False))]
+
+    results = {}
+    for name, kwargs in modes:
+        features.chroma(frames[0], sr, **kwargs)
+        start = time()
+        for _ in range(repeats):
+            results[name] = [features.chroma(frame, sr, **kwargs) for frame in frames]
+        per_frame = (time() - start) / repeats / len(frames)
+        accuracy = np.mean([top_pitch_classes_match(c, chord) for c, chord in zip(results[name], chords)])
+        print("%-26s %8.2f ms per frame, chord notes are the strongest pitch classes for %3d%% of the chords" %
+              (name, per_frame * 1000., accuracy * 100.))
+
+    reference, fast = [[c.mean(axis=-1) for c in results[name]] for name, _ in modes]
+    similarity = [np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)) for a, b in zip(reference, fast)]
+    print("cosine similarity of the mean chroma vectors: min %.3f, mean %.3f" % (min(similarity), np.mean(similarity)))
+
+
+if __name__ == "__main__":
+    benchmark(sr=int(sys.argv[1]) if len(sys.argv) > 1 else 22050)
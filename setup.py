@@ -9,7 +9,7 @@ import sox_chords
 
 requirements = [
     "pytest",
-    "numpy",
+    "numpy>=1.20",
     "librosa",
     "matplotlib",
     "requests",
@@ -68,6 +68,7 @@ setuptools.setup(
     namespace_packages=['sox_chords'],
     packages=setuptools.find_packages(exclude=['tests', 'tests.*']),
     install_requires=requirements,
+    python_requires=">=3.8",
     entry_points={
         'console_scripts': [
         ],
@@ -80,10 +81,9 @@ setuptools.setup(
         'Operating System :: POSIX :: Linux',
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
 )
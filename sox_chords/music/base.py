@@ -161,6 +161,14 @@ class NoteCollection(object):
     def get_notes(self):
         return self.notes
 
+    def get_semi_tones(self):
+        """
+        Sounding semi tones of the notes, enharmonic spellings (C#, Db) share the same semi tone
+
+        :return: tuple, sorted semi tones
+        """
+        return tuple(sorted(note.get_semi_tone() for note in self.notes))
+
     def get_root(self):
         return self.root
 
@@ -173,3 +181,12 @@ class NoteCollection(object):
         :return: true, if its created, else false
         """
         pass
+
+    @abstractmethod
+    def render(self):
+        """
+        Render the notes into memory
+
+        :return: np.array float32, samples
+        """
+        pass
@@ -23,12 +23,41 @@ class Chord(NoteCollection):
     def get_name(self):
         return self.root.get_name() + self.name
 
-    def generate(self, output_dir="", extension=".wav", duration=1.0, sr=44100, bits=16, noise=None, freq_shift=0):
+    def generate(self, output_dir="", extension=".wav", duration=1.0, sr=44100, bits=16, noise=None, freq_shift=0,
+                 backend=None, cache=None):
         output = join(output_dir, self.get_name() + extension)
         Sox.create_audio(output=output, notes=self.notes, duration=duration, fade=0, dpn=0, bits=bits, sr=sr,
-                         noise=noise, freq_shift=freq_shift)
+                         noise=noise, freq_shift=freq_shift, backend=backend, cache=cache)
         return output
 
+    async def generate_async(self, output_dir="", extension=".wav", duration=1.0, sr=44100, bits=16, noise=None,
+                             freq_shift=0, backend=None, timeout=None):
+        """
+        Async version of generate, see Sox.call_async
+        """
+        output = join(output_dir, self.get_name() + extension)
+        await Sox.create_audio_async(output=output, notes=self.notes, duration=duration, fade=0, dpn=0, bits=bits,
+                                     sr=sr, noise=noise, freq_shift=freq_shift, backend=backend, timeout=timeout)
+        return output
+
+    def render(self, duration=1.0, sr=44100, bits=16, noise=None, freq_shift=0, backend=None, cache=None):
+        """
+        Render the chord into memory instead of writing it to disk
+
+        :return: np.array float32, samples
+        """
+        return Sox.render_audio(notes=self.notes, duration=duration, fade=0, dpn=0, bits=bits, sr=sr, noise=noise,
+                                freq_shift=freq_shift, backend=backend, cache=cache)
+
+    async def render_async(self, duration=1.0, sr=44100, bits=16, noise=None, freq_shift=0, backend=None, timeout=None):
+        """
+        Async version of render, see Sox.call_async
+
+        :return: np.array float32, samples
+        """
+        return await Sox.render_audio_async(notes=self.notes, duration=duration, fade=0, dpn=0, bits=bits, sr=sr,
+                                            noise=noise, freq_shift=freq_shift, backend=backend, timeout=timeout)
+
     def __eq__(self, other):
         if isinstance(other, Chord):
             return self.notes == other.notes
@@ -37,11 +37,21 @@ class Scale(NoteCollection):
     def get_name(self):
         return "%s_%s" % (self.root.get_name(), self.__class__.__name__)
 
-    def generate(self, output_dir, extension='.wav', bits=16, sr=44100, dpn=1):
+    def generate(self, output_dir, extension='.wav', bits=16, sr=44100, dpn=1, backend=None, cache=None):
         output = os.path.join(output_dir, self.get_name() + extension)
-        Sox.create_audio(notes=self.notes, output=output, dpn=dpn, bits=bits, sr=sr, duration=dpn * len(self.notes))
+        Sox.create_audio(notes=self.notes, output=output, dpn=dpn, bits=bits, sr=sr, duration=dpn * len(self.notes),
+                         backend=backend, cache=cache)
         return output
 
+    def render(self, bits=16, sr=44100, dpn=1, backend=None, cache=None):
+        """
+        Render the scale into memory instead of writing it to disk
+
+        :return: np.array float32, samples
+        """
+        return Sox.render_audio(notes=self.notes, dpn=dpn, bits=bits, sr=sr, duration=dpn * len(self.notes),
+                                backend=backend, cache=cache)
+
 
 class MajorScale(Scale):
 
@@ -3,8 +3,12 @@ from sox_chords.music.base import Note, NoteCollection
 from sox_chords.music.chord import Chord
 from sox_chords.util.sox import Sox, SoxBuilder, SoxException
 from sox_chords.music.utils import note_to_freq
+from sox_chords.util.bank import NoteBank
+from sox_chords.util import synth
 from functools import reduce
 
+import numpy as np
+
 
 class SoxChord(object):
 
@@ -30,7 +34,19 @@ class SoxSong(object):
         freq_shifts = [[chord.freq_shift] * (len(chord.notes)) for chord in self.sox_chords]
         return reduce(lambda x, y: x + y, freq_shifts)
 
-    def generate(self, output, sr=44100, channels=1, norm=-1, bits=8, fade=.1, noise=None):
+    def generate(self, output, sr=44100, channels=1, norm=-1, bits=8, fade=.1, noise=None, backend=None, cache=None):
+        return Sox.synthesize(self.get_builder(output, sr=sr, channels=channels, norm=norm, bits=bits, fade=fade,
+                                               noise=noise), backend, cache)
+
+    async def generate_async(self, output, sr=44100, channels=1, norm=-1, bits=8, fade=.1, noise=None, backend=None,
+                             timeout=None):
+        """
+        Async version of generate, see Sox.call_async
+        """
+        return await Sox.synthesize_async(self.get_builder(output, sr=sr, channels=channels, norm=norm, bits=bits,
+                                                           fade=fade, noise=noise), backend, timeout)
+
+    def get_builder(self, output="", sr=44100, channels=1, norm=-1, bits=8, fade=.1, noise=None):
         
         notes = list(map(lambda x: Sox.check_note(x), self.notes))
         notes = [note_to_freq(note) + self.freq_shifts[k] for k, note in enumerate(notes)]
@@ -47,7 +63,98 @@ class SoxSong(object):
             
             # add missing delay for next note
             curdelay += chord.duration - (chord.dpn * len(chord.notes))
-        print(len(notes), len(delays))
         norm = [norm]
-        return Sox.call(SoxBuilder(notes, delays).set_sampling_rate(sr).set_channels(channels).set_output(output).
-                        set_bits(bits).set_noise(noise).add_effect("fade", fade).add_effect("norm", norm).build())
\ No newline at end of file
+        return SoxBuilder(notes, delays).set_sampling_rate(sr).set_channels(channels).set_output(output).\
+            set_bits(bits).set_noise(noise).add_effect("fade", fade).add_effect("norm", norm)
+
+    def stream(self, sr=44100, norm=-1, fade=.1, noise=None, window=1.0, overlap=.01, note_length=4.0, backend=None,
+               seed=0):
+        """
+        Render the song window by window, only the notes sounding in a window are synthesized.
+        Memory does not grow with the length of the song, hour long songs can be rendered.
+
+        Unlike sox, a note stops after note_length seconds. If norm is not None the song is rendered twice,
+        the first pass only measures the peak.
+
+        :param sr: int, sampling rate
+        :param norm: float, peak level in dB or None to keep the sox mixing level of 1 / number of channels
+        :param fade: float, fade out at the end of the song in seconds
+        :param noise: instance of class noise
+        :param window: float, window length in seconds
+        :param overlap: float, crossfade between windows in seconds
+        :param note_length: float, seconds a note is synthesized after its onset
+        :param backend: NoteBank or backend rendering the notes of a new NoteBank, None for the 'bank' backend
+        :param seed: int, seed of the noise
+        :return: generator of np.array float32 chunks of window seconds (the last may be shorter)
+        """
+        if norm is None:
+            for chunk in self._stream(sr, 1., fade, noise, window, overlap, note_length, backend, seed):
+                yield chunk
+            return
+
+        peak = max(np.abs(chunk).max() for chunk in self._stream(sr, 1., 0, noise, window, overlap, note_length,
+                                                                   backend, seed))
+        gain = 10. ** (norm / 20.) / peak if peak > 0 else 1.
+        for chunk in self._stream(sr, gain, fade, noise, window, overlap, note_length, backend, seed):
+            yield chunk
+
+    def _stream(self, sr, gain, fade, noise, window, overlap, note_length, backend, seed):
+        if isinstance(backend, NoteBank):
+            bank = backend
+        else:
+            bank = NoteBank(backend) if backend is not None else synth.get_backend("bank")
+
+        builder = self.get_builder(sr=sr, noise=noise)
+        onsets = np.round(np.asarray(builder.delays) * sr).astype(np.int64)
+        total = int(round(sum(chord.duration for chord in self.sox_chords) * sr))
+        window, overlap, note_length = int(round(window * sr)), int(round(overlap * sr)), int(round(note_length * sr))
+        channels = len(builder.notes) + (1 if builder.noise else 0)
+        n_fade = min(int(round(fade * sr)), total)
+        rng = np.random.RandomState(seed)
+
+        tail = None
+        for start in range(0, total, window):
+            end = min(start + window + overlap, total)
+            y = np.zeros(end - start, dtype=np.float64)
+
+            # notes sounding in [start, end)
+            for i in range(np.searchsorted(onsets, start - note_length, "right"), np.searchsorted(onsets, end)):
+                note = builder.notes[i]
+                sample = bank.get_note(note.get_semi_tone(), sr, note_length) if isinstance(note, Note) else \
+                    bank.get_frequency(float(note), sr, note_length)
+                begin = max(start - onsets[i], 0)
+                segment = sample[begin:end - onsets[i]]
+                offset = max(onsets[i] - start, 0)
+                y[offset:offset + len(segment)] += segment
+            if builder.noise:
+                y += synth.noise(builder.noise, len(y), rng)
+            y *= gain / channels
+
+            if n_fade > 0 and end > total - n_fade:
+                index = np.arange(start, end) - (total - n_fade)
+                faded = index >= 0
+                y[faded] *= np.power(.1, (1. - (n_fade - index[faded]) / float(n_fade)) * 5.)
+
+            if tail is not None and len(tail) > 0:
+                n = min(len(tail), len(y))
+                ramp = np.arange(1, n + 1) / float(n + 1)
+                y[:n] = tail[:n] * (1. - ramp) + y[:n] * ramp
+            chunk_end = min(window, len(y)) if end < total else len(y)
+            tail = y[chunk_end:]
+            yield y[:chunk_end].astype(np.float32)
+
+    def generate_streaming(self, output, sr=44100, norm=-1, bits=8, fade=.1, noise=None, window=1.0, overlap=.01,
+                           note_length=4.0, backend=None):
+        """
+        Write the song to output chunk by chunk, see stream
+
+        :return: output
+        """
+        handler = synth.open_wav(output, sr, bits)
+        try:
+            for chunk in self.stream(sr=sr, norm=norm, fade=fade, noise=noise, window=window, overlap=overlap,
+                                     note_length=note_length, backend=backend):
+                handler.writeframes(synth.to_pcm(chunk, bits))
+        finally:
+            handler.close()
+        return output
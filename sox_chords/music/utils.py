@@ -33,7 +33,21 @@ def note_to_freq(note=None):
     :return: frequency in hz
     """
     assert (isinstance(note, Note)), "note is not of instance Note"
-    return get_frequency(key=(get_semi_tone(note)))
+    # semi tone 0 is C1, which is key 4 of the piano
+    return get_frequency(key=note.get_semi_tone() + 4)
+
+
+def note_name_to_freq(note=None, pitch=440.0):
+    """
+    Frequency of the note name str(note) in scientific pitch notation, which is how sox interprets it
+
+    :param note: Note
+    :param pitch: convert pitch of the A4 note in Hz
+    :return: frequency in hz
+    """
+    assert (isinstance(note, Note)), "note is not of instance Note"
+    midi = (note.get_semi_tone() % Values.MAX_SEMI_TONES) + Values.MAX_SEMI_TONES * (note.get_octave() + 1)
+    return pow(2, float(midi - 69) / 12.0) * pitch
 
 
 def get_notes_from_pattern(root=None, notation=None, core_pattern=None):
@@ -0,0 +1,176 @@
+"""
+Chords from a bank of pre-rendered notes
+
+There are only Values.MAX_NUM_KEYS distinct keys. The NoteBank renders each of them once with another
+synthesis backend (sox by default) and assembles chords, scales and songs by summing the delayed note
+samples with NumPy. Shifted frequencies are resampled from the nearest key.
+"""
+from threading import RLock
+
+import numpy as np
+
+from sox_chords.music.base import Note
+from sox_chords.music.utils import note_name_to_freq
+from sox_chords.util.synth import SynthBackend, get_backend, register_backend, fade, norm, quantize, write_wav
+from sox_chords.values import Values
+
+# key frequencies, the frequency of a key is the frequency sox plays for Note.from_semitone(key)
+KEY_FREQUENCIES = np.array([note_name_to_freq(Note.from_semitone(key)) for key in range(Values.MAX_NUM_KEYS)])
+
+
+class NoteBank(SynthBackend):
+    """
+        Synthesis backend composing the audio from cached renders of single notes
+    """
+    name = "bank"
+
+    def __init__(self, backend="sox"):
+        """
+        :param backend: SynthBackend or name of the backend rendering the single notes and noises
+        """
+        self.backend = backend
+        self._notes = {}
+        self._shifted = {}
+        self._noises = {}
+        self._lock = RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = RLock()
+
+    def cache_key(self):
+        return "%s-%s" % (self.name, get_backend(self.backend).cache_key())
+
+    @property
+    def num_renders(self):
+        """ number of renders done by the backend so far """
+        return len(self._notes) + len(self._noises)
+
+    def _render(self, builder, num_samples):
+        # render without norm, the fade only truncates at the stop position
+        duration = float(num_samples) / builder.sampling_rate
+        return get_backend(self.backend).render(builder.set_bits(32).add_effect("fade", [0, duration, 0]))
+
+    def get_note(self, key=0, sr=44100, num_samples=44100):
+        """
+        Samples of a single key, rendered once per sampling rate and extended if more samples are requested
+
+        :param key: int, semi tone between 0 and Values.MAX_NUM_KEYS - 1
+        :param sr: int, sampling rate
+        :param num_samples: int, minimum number of samples
+        :return: np.array float32
+        """
+        from sox_chords.util.sox import SoxBuilder
+
+        with self._lock:
+            y = self._notes.get((key, sr))
+            if y is None or len(y) < num_samples:
+                builder = SoxBuilder([Note.from_semitone(key)], [0]).set_sampling_rate(sr)
+                y = self._notes[(key, sr)] = self._render(builder, num_samples)
+                self._shifted = dict((k, v) for k, v in self._shifted.items() if k[:2] != (key, sr))
+        return y[:num_samples]
+
+    def get_frequency(self, freq=440.0, sr=44100, num_samples=44100):
+        """
+        Samples of an arbitrary frequency, resampled from the nearest key and cached
+
+        :param freq: float, frequency in Hz
+        :param sr: int, sampling rate
+        :param num_samples: int, number of samples
+        :return: np.array float32
+        """
+        key = int(np.argmin(np.abs(np.log2(KEY_FREQUENCIES / freq))))
+        ratio = freq / KEY_FREQUENCIES[key]
+        if np.isclose(ratio, 1.):
+            return self.get_note(key, sr, num_samples)
+
+        with self._lock:
+            y = self._shifted.get((key, sr, freq))
+            if y is None or len(y) < num_samples:
+                source = self.get_note(key, sr, int(np.ceil(num_samples * ratio)) + 1)
+                y = np.interp(np.arange(num_samples) * ratio, np.arange(len(source)), source).astype(np.float32)
+                self._shifted[(key, sr, freq)] = y
+        return y[:num_samples]
+
+    def get_noise(self, name="whitenoise", sr=44100, num_samples=44100):
+        """
+        A noise channel, rendered once per sampling rate
+
+        :param name: str, noise synth type
+        :param sr: int, sampling rate
+        :param num_samples: int, number of samples
+        :return: np.array float32
+        """
+        from sox_chords.util.sox import SoxBuilder
+
+        with self._lock:
+            y = self._noises.get((name, sr))
+            if y is None or len(y) < num_samples:
+                builder = SoxBuilder([], []).set_sampling_rate(sr)
+                builder.noise = name
+                y = self._noises[(name, sr)] = self._render(builder, num_samples)
+        return y[:num_samples]
+
+    def compose(self, notes=None, delays=None, sr=44100, num_samples=44100, noise=None):
+        """
+        Sum of the delayed notes (and the noise) divided by the number of channels, like sox 'remix -'
+
+        :param notes: list, Notes or frequencies in Hz
+        :param delays: list, delay of each note in seconds
+        :param sr: int, sampling rate
+        :param num_samples: int, number of samples
+        :param noise: str, noise synth type or None
+        :return: np.array float64
+        """
+        y = np.zeros(num_samples, dtype=np.float64)
+        if notes:
+            y += self._sum_delayed(notes, delays, sr, num_samples)
+        channels = len(notes)
+        if noise:
+            y += self.get_noise(noise, sr, num_samples)
+            channels += 1
+        return y / max(channels, 1)
+
+    def _sum_delayed(self, notes, delays, sr, num_samples):
+        # every note is added over its own window [delay, num_samples), only one note is gathered at a time
+        y = np.zeros(num_samples, dtype=np.float64)
+        offsets = np.round(np.asarray(delays, dtype=np.float64) * sr).astype(np.int64)
+        for note, offset in zip(notes, offsets):
+            length = num_samples - offset
+            if length <= 0:
+                continue
+            y[offset:] += self.get_note(note.get_semi_tone(), sr, length) if isinstance(note, Note) else \
+                self.get_frequency(float(note), sr, length)
+        return y
+
+    def render(self, builder):
+        sr = builder.sampling_rate
+        effects = dict((name, params) for name, params in builder.effects)
+        stop = effects["fade"][1] if "fade" in effects else None
+        num_samples = int(round(stop * sr)) if stop is not None else int(round((max(builder.delays or [0]) + 1.) * sr))
+
+        y = self.compose(builder.notes, builder.delays, sr, num_samples, builder.noise)
+        if "fade" in effects:
+            fade_in, stop, fade_out = effects["fade"]
+            y = fade(y, sr, fade_in=fade_in, stop=stop, fade_out=fade_out)
+        if "norm" in effects:
+            y = norm(y, effects["norm"][0])
+
+        y = quantize(y, builder.bits)
+        if builder.channels > 1:
+            y = np.tile(y[:, np.newaxis], (1, builder.channels))
+        return y
+
+    def synthesize(self, builder):
+        y = self.render(builder)
+        if builder.output:
+            write_wav(builder.output, y, builder.sampling_rate, builder.bits)
+        return y
+
+
+register_backend(NoteBank())
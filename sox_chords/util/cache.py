@@ -0,0 +1,158 @@
+"""
+Content addressed cache of rendered audio
+
+Renders are stored as .npy files named by a hash of everything that goes into the synthesis, so a
+variant is rendered once no matter which chord, file name or processor asked for it.
+"""
+import hashlib
+import os
+import tempfile
+from os.path import join, exists, getsize
+from threading import Lock
+
+import numpy as np
+
+from sox_chords.music.base import Note
+from sox_chords.util.logger import logger
+
+
+class RenderCache(object):
+
+    def __init__(self, cache_dir=join(tempfile.gettempdir(), "sox_chords_renders"), max_size=2 ** 30):
+        """
+        :param cache_dir: str, directory of the cached renders, will be created if it does not exist
+        :param max_size: int, maximum size of the cache in bytes, least recently used renders are evicted
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._lock = Lock()
+        if not exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.size = sum(size for _, size, _ in self._stats())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def _files(self):
+        return [join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".npy")]
+
+    @staticmethod
+    def get_key(builder=None, backend_key=""):
+        """
+        Hash of the synthesis inputs of a SoxBuilder: sounding notes, delays, duration, sampling rate, bits,
+        channels, noise type, shifted frequencies, fade and norm
+
+        :param builder: SoxBuilder
+        :param backend_key: str, cache key of the synthesis backend, see SynthBackend.cache_key
+        :return: str, hex digest
+        """
+        notes = tuple(("semi_tone", note.get_semi_tone()) if isinstance(note, Note) else ("freq", round(note, 6))
+                      for note in builder.notes)
+        inputs = (backend_key, notes, tuple(round(delay, 6) for delay in builder.delays),
+                  tuple((name, tuple(params)) for name, params in builder.effects),
+                  builder.sampling_rate, builder.bits, builder.channels, builder.noise)
+        return hashlib.sha1(repr(inputs).encode("utf-8")).hexdigest()
+
+    def get(self, key=""):
+        """
+        :param key: str, render key
+        :return: np.array float32 samples or None if not cached
+        """
+        path = join(self.cache_dir, key + ".npy")
+        try:
+            data = np.load(path)
+        except (IOError, OSError, ValueError):
+            return None
+        # mark as recently used, another process may have evicted it in the meantime
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            pass
+
+        if data.dtype.kind == "i":
+            return (data / float(np.iinfo(data.dtype).max + 1)).astype(np.float32)
+        return data
+
+    def put(self, key="", y=None, bits=32):
+        """
+        Store samples, PCM integers are used for bit depths up to 16 to keep the cache compact
+
+        :param key: str, render key
+        :param y: np.array float32 samples
+        :param bits: int, bits per sample of y
+        """
+        if bits <= 8:
+            data = np.round(y * 128.).clip(-128, 127).astype(np.int8)
+        elif bits <= 16:
+            data = np.round(y * 32768.).clip(-32768, 32767).astype(np.int16)
+        else:
+            data = np.asarray(y, dtype=np.float32)
+
+        path = join(self.cache_dir, key + ".npy")
+        handle, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(handle, "wb") as handler:
+            np.save(handler, data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            try:
+                self.size += getsize(path)
+            except FileNotFoundError:
+                # already evicted by another process
+                pass
+            if self.size > self.max_size:
+                self._evict()
+
+    def _stats(self):
+        # (mtime, size, path) of the cached renders, renders evicted by another process meanwhile are left out
+        stats = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stats.append((stat.st_mtime, stat.st_size, path))
+        return sorted(stats)
+
+    def _evict(self):
+        stats = self._stats()
+        self.size = sum(size for _, size, _ in stats)
+        while stats and self.size > self.max_size:
+            _, size, path = stats.pop(0)
+            self.size -= size
+            logger.debug("[*] evicting render %s" % path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # evicted by another process sharing the cache directory
+                pass
+
+    def render(self, builder=None, backend=None):
+        """
+        Cached render of a SoxBuilder
+
+        :param builder: SoxBuilder
+        :param backend: SynthBackend
+        :return: np.array float32 samples
+        """
+        key = self.get_key(builder, backend.cache_key())
+        y = self.get(key)
+        if y is None:
+            y = backend.render(builder)
+            self.put(key, y, builder.bits)
+        return y
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._stats():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.size = 0
@@ -0,0 +1,165 @@
+"""
+Single pass conversion of audio files with sox
+"""
+import json
+import multiprocessing
+import os
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from os.path import join, exists, getmtime, splitext, basename
+from subprocess import CalledProcessError
+
+import tqdm
+
+from sox_chords.util.logger import logger
+from sox_chords.util.sox import Sox, SoxException
+
+# pipeline the files of an output directory were converted with, see SoxPipeline.convert_dir
+SIGNATURE_FILE = ".sox_pipeline.json"
+
+
+class SoxPipeline(object):
+    """
+        Chain of conversion operations which is run as a single sox call per file
+    """
+
+    # supported operations = {name: (min number of args, max number of args)}
+    supported_operations = {"rate": (1, 1), "bits": (1, 1), "channels": (1, 1), "gain": (1, 1), "fade": (1, 3),
+                            "norm": (0, 1), "trim": (1, 2)}
+
+    def __init__(self, operations=None):
+        """
+        :param operations: list of (name, *params), e.g. [("rate", 22050), ("bits", 16), ("norm", -1)]
+        """
+        self.operations = []
+        for operation in operations or []:
+            self.add(operation[0], *operation[1:])
+
+    def add(self, name="", *params):
+        """
+        Append an operation
+
+        :param name: rate, bits, channels, gain, fade, norm or trim
+        :param params: parameters of the operation
+        :return: self
+        """
+        assert (name in self.supported_operations), "Operation " + name + " is not supported"
+        min_args, max_args = self.supported_operations[name]
+        assert (min_args <= len(params) <= max_args), "Insufficient arguments for operation %s" % name
+        self.operations.append((name, list(params)))
+        return self
+
+    def rate(self, rate=22050):
+        """ resample to rate Hz """
+        return self.add("rate", rate)
+
+    def bits(self, bits=16):
+        """ bits per sample of the output file """
+        return self.add("bits", bits)
+
+    def channels(self, channels=1):
+        """ mix to the number of channels """
+        return self.add("channels", channels)
+
+    def gain(self, db=0.):
+        """ change the volume by db dB """
+        return self.add("gain", db)
+
+    def fade(self, fade_in=0., stop=None, fade_out=None):
+        """ fade in, stop position and fade out in seconds, see sox fade """
+        return self.add("fade", *[param for param in [fade_in, stop, fade_out] if param is not None])
+
+    def norm(self, db=-1.):
+        """ normalize the peak to db dBFS """
+        return self.add("norm", db)
+
+    def trim(self, start=0., length=None):
+        """ keep length seconds from start on """
+        return self.add("trim", *[param for param in [start, length] if param is not None])
+
+    @property
+    def signature(self):
+        """ str, the operations and their parameters in order """
+        return json.dumps(self.operations)
+
+    def build(self, in_file="", out_file=""):
+        """
+        Build the sox command, the effects are applied in the order of the operations
+
+        :param in_file: str, input audio file
+        :param out_file: str, output audio file
+        :return: list, arguments
+        """
+        args = ["sox", in_file]
+        effects = []
+        for name, params in self.operations:
+            if name == "bits":
+                args += ["-b", str(params[0])]
+            else:
+                effects.append(name)
+                effects += list(map(lambda x: str(x), params))
+        return args + [out_file] + effects
+
+    def convert(self, in_file="", out_file=""):
+        """
+        Convert one file with a single sox call
+
+        :param in_file: str, input audio file
+        :param out_file: str, output audio file
+        :return: out_file
+        """
+        Sox.call(self.build(in_file, out_file))
+        return out_file
+
+    def convert_dir(self, in_dir="", out_dir="", extension=".wav", out_extension=None, jobs=None, force=False):
+        """
+        Convert every file with extension in in_dir into out_dir with a pool of workers (each runs a sox process).
+        Files whose output is newer than the input are skipped unless force is set or out_dir was converted
+        with other operations (recorded in SIGNATURE_FILE).
+
+        :param in_dir: str, input directory
+        :param out_dir: str, output directory, will be created if it does not exist
+        :param extension: str, extension of the input files
+        :param out_extension: str, extension of the output files, None keeps extension
+        :param jobs: int, number of parallel sox processes, None for the number of cores
+        :param force: bool, convert files even if their output is up to date
+        :return: OrderedDict, input file -> 'converted', 'skipped' or 'failed'
+        """
+        if not exists(out_dir):
+            os.makedirs(out_dir)
+        out_extension = out_extension or extension
+
+        # outputs of other operations are stale, the signature is removed until every file is converted again
+        signature_file = join(out_dir, SIGNATURE_FILE)
+        try:
+            with open(signature_file) as handler:
+                force = force or handler.read() != self.signature
+        except (IOError, OSError):
+            force = True
+        if force and exists(signature_file):
+            os.remove(signature_file)
+        in_files = sorted(join(in_dir, name) for name in os.listdir(in_dir) if name.endswith(extension))
+
+        def convert(in_file):
+            out_file = join(out_dir, splitext(basename(in_file))[0] + out_extension)
+            if not force and exists(out_file) and getmtime(out_file) >= getmtime(in_file):
+                return "skipped"
+            try:
+                self.convert(in_file, out_file)
+                return "converted"
+            except (SoxException, CalledProcessError) as e:
+                logger.error("converting %s failed: %s" % (in_file, e))
+                return "failed"
+
+        pool = ThreadPool(jobs or multiprocessing.cpu_count())
+        try:
+            status = list(tqdm.tqdm(pool.imap(convert, in_files), total=len(in_files), unit="files"))
+        finally:
+            pool.close()
+            pool.join()
+
+        # after a failure stale outputs of other operations may be left, the next call converts every file again
+        if "failed" not in status:
+            with open(signature_file, "w") as handler:
+                handler.write(self.signature)
+        return OrderedDict(zip(in_files, status))
@@ -0,0 +1,392 @@
+"""
+Spectrogram images computed with NumPy
+
+get_visual_data used to draw every training image with matplotlib (librosa.display.specshow) and read the
+pixels back from the canvas. The functions below compute the same dB scaled matrices and map them onto the
+pixel grid of the image with the axis scaling and colormap specshow uses, without creating a figure.
+
+Every function takes a single frame of shape (samples,) or a batch of frames of shape (batch, samples), a
+batch is framed and transformed with one rfft and the following steps are matrix operations on the batch.
+
+Windows, filterbanks, colormaps and the pixel maps of the axes only depend on their parameters and are kept in
+bounded lru caches. The cached arrays are read-only, so threads share them safely and worker processes forked
+after a first call inherit them.
+"""
+from functools import lru_cache
+
+import librosa
+import numpy as np
+
+
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+# chroma_cqt defaults
+CHROMA_BINS_PER_OCTAVE = 36
+CHROMA_OCTAVES = 7
+N_CHROMA = 12
+# fft size of the fast (stft) chroma, semi tones of the lower octaves need a finer resolution than N_FFT
+CHROMA_N_FFT = 4096
+
+# sampling rate librosa.display.specshow assumes if none is given
+DISPLAY_SR = 22050
+
+# maximum number of cached arrays of each kind
+CACHE_SIZE = 64
+
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_window(n_fft=N_FFT):
+    """ periodic hann window like scipy.signal.get_window('hann', n_fft), read-only float32 """
+    return _read_only((.5 - .5 * np.cos(2. * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_mel_basis(sr=22050, n_fft=N_FFT, n_mels=N_MELS, fmin=0., fmax=None):
+    """ librosa.filters.mel, read-only float32 of shape (n_mels, 1 + n_fft // 2) """
+    return _read_only(librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels, fmin=fmin, fmax=fmax))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_chroma_basis(n_bins=CHROMA_OCTAVES * CHROMA_BINS_PER_OCTAVE, bins_per_octave=CHROMA_BINS_PER_OCTAVE,
+                     n_chroma=N_CHROMA, fmin=None):
+    """ librosa.filters.cq_to_chroma, read-only of shape (n_chroma, n_bins), fmin None for C1 """
+    fmin = float(librosa.note_to_hz("C1")) if fmin is None else fmin
+    return _read_only(librosa.filters.cq_to_chroma(n_bins, bins_per_octave=bins_per_octave, n_chroma=n_chroma,
+                                                   fmin=fmin))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_cqt_basis(sr=22050, hop_length=HOP_LENGTH, fmin=None, n_bins=CHROMA_OCTAVES * CHROMA_BINS_PER_OCTAVE,
+                  bins_per_octave=CHROMA_BINS_PER_OCTAVE, sparsity=.01):
+    """
+    Magnitudes of the fft of the constant-Q filters like librosa.pseudo_cqt (hann windows, filter scale 1, unit
+    norm, no tuning), applied to a magnitude spectrogram of n_fft bins
+
+    :param fmin: float, frequency of the lowest bin, None for C1
+    :param sparsity: float, fraction of the energy of each filter which is discarded, see librosa.util.sparsify_rows
+    :return: (scipy.sparse.csr_matrix float32 of shape (n_bins, 1 + n_fft // 2) with read-only data, n_fft)
+    """
+    fmin = float(librosa.note_to_hz("C1")) if fmin is None else fmin
+    freqs = librosa.cqt_frequencies(n_bins=n_bins, fmin=fmin, bins_per_octave=bins_per_octave)
+    basis, lengths = librosa.filters.wavelet(freqs=freqs, sr=sr, filter_scale=1, norm=1, pad_fft=True,
+                                             window="hann")
+    # the fft covers the longest filter and two hops
+    n_fft = max(basis.shape[1], int(2 ** (1 + np.ceil(np.log2(hop_length)))))
+    basis *= lengths[:, np.newaxis] / float(n_fft)
+    fft_basis = np.abs(np.fft.fft(basis, n=n_fft, axis=1)[:, :n_fft // 2 + 1])
+    fft_basis = librosa.util.sparsify_rows(fft_basis, quantile=sparsity, dtype=np.float32)
+    for array in [fft_basis.data, fft_basis.indices, fft_basis.indptr]:
+        _read_only(array)
+    return fft_basis, n_fft
+
+
+def pseudo_cqt(y=None, sr=22050, hop_length=HOP_LENGTH, fmin=None,
+               n_bins=CHROMA_OCTAVES * CHROMA_BINS_PER_OCTAVE, bins_per_octave=CHROMA_BINS_PER_OCTAVE):
+    """
+    Constant-Q magnitudes ([batch,] n_bins, frames) like librosa.pseudo_cqt with tuning 0: the cached filters of
+    get_cqt_basis applied to the magnitude spectrogram
+
+    :param y: np.array, samples of shape (samples,) or (batch, samples)
+    :return: np.array float32
+    """
+    basis, n_fft = get_cqt_basis(sr, hop_length, fmin, n_bins, bins_per_octave)
+    y = np.asarray(y, dtype=np.float32)
+    # the fft of the lowest filters is long, the frames of one signal are transformed at a time to bound memory
+    c = np.stack([basis.dot(np.abs(stft(frame, n_fft=n_fft, hop_length=hop_length)))
+                  for frame in y.reshape((-1, y.shape[-1]))])
+    return (c / np.float32(np.sqrt(n_fft))).reshape(y.shape[:-1] + c.shape[-2:])
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_stft_chroma_basis(sr=22050, n_fft=CHROMA_N_FFT, n_chroma=N_CHROMA, tuning=0., octwidth=None):
+    """ librosa.filters.chroma folding fft bins into pitch classes, read-only of shape (n_chroma, 1 + n_fft // 2) """
+    return _read_only(librosa.filters.chroma(sr=sr, n_fft=n_fft, n_chroma=n_chroma, tuning=tuning,
+                                             octwidth=octwidth))
+
+
+def clear_cache():
+    """ drop all cached windows, filterbanks, colormaps and pixel maps """
+    for function in [get_window, get_mel_basis, get_chroma_basis, get_cqt_basis, get_stft_chroma_basis, get_colormap,
+                     get_gray_colormap, get_pixel_rows, get_pixel_cols]:
+        function.cache_clear()
+
+
+def stft(y=None, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """
+    Centered short time fourier transform with a periodic hann window like librosa.stft
+
+    :param y: np.array, samples of shape (samples,) or (batch, samples)
+    :param n_fft: int, fft size
+    :param hop_length: int, number of samples between frames
+    :return: np.array complex, shape ([batch,] 1 + n_fft // 2, frames)
+    """
+    y = np.asarray(y, dtype=np.float32)
+    y = np.pad(y, [(0, 0)] * (y.ndim - 1) + [(n_fft // 2, n_fft // 2)], mode="constant")
+    window = get_window(n_fft)
+    # view of the overlapping frames, shape ([batch,] frames, n_fft)
+    frames = np.lib.stride_tricks.sliding_window_view(y, n_fft, axis=-1)[..., ::hop_length, :]
+    return np.swapaxes(np.fft.rfft(frames * window, axis=-1), -1, -2)
+
+
+def power(d=None):
+    """ |d| ** 2 of a complex spectrogram without the square root of np.abs """
+    return np.square(d.real) + np.square(d.imag)
+
+
+def amplitude_to_db(s=None, amin=1e-5, top_db=80.):
+    """
+    librosa.amplitude_to_db(s, ref=np.max) of every matrix in s
+
+    :param s: np.array, amplitudes of shape ([batch,] bins, frames)
+    :param amin: float, minimum amplitude
+    :param top_db: float, dynamic range below the peak
+    :return: np.array, dB relative to the peak of each matrix
+    """
+    power = np.square(np.abs(s))
+    db = 10. * np.log10(np.maximum(amin ** 2, power))
+    db -= 10. * np.log10(np.maximum(amin ** 2, power.max(axis=(-2, -1), keepdims=True)))
+    return np.maximum(db, db.max(axis=(-2, -1), keepdims=True) - top_db)
+
+
+def symlog(x=None, linthresh=1000., base=2., linscale=1.):
+    """ transform of the matplotlib 'symlog' scale """
+    x = np.asarray(x, dtype=np.float64)
+    linscale_adj = linscale / (1. - 1. / base)
+    abs_x = np.abs(x)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log = np.sign(x) * linthresh * (linscale_adj + np.log(abs_x / linthresh) / np.log(base))
+    return np.where(abs_x <= linthresh, x * linscale_adj, log)
+
+
+def _edges(coords):
+    """ cell edges of a pcolormesh with shading 'nearest' around the given centers """
+    mid = (coords[1:] + coords[:-1]) / 2.
+    return np.concatenate([[2. * coords[0] - mid[0]], mid, [2. * coords[-1] - mid[-1]]])
+
+
+def _pixel_bins(edges, num_pixels, reverse=False):
+    """ index of the cell under the center of every pixel of an axis spanning the edges """
+    centers = edges[0] + (np.arange(num_pixels) + .5) / num_pixels * (edges[-1] - edges[0])
+    if reverse:
+        centers = centers[::-1]
+    return np.clip(np.searchsorted(edges, centers, side="right") - 1, 0, len(edges) - 2)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_pixel_rows(y_axis="log", sr=22050, n_bins=1 + N_FFT // 2, height=160):
+    """
+    Bin shown in every pixel row (top to bottom) of a specshow y axis, read-only
+
+    :param y_axis: str, 'log' (fft bins on a symlog axis), 'mel' or 'chroma'
+    :param sr: int, sampling rate the axis is labeled for
+    :param n_bins: int, number of bins
+    :param height: int, image height in pixels
+    :return: np.array int, shape (height,)
+    """
+    if y_axis == "log":
+        coords = librosa.fft_frequencies(sr=sr, n_fft=2 * (n_bins - 1))
+        linthresh = float(librosa.note_to_hz("C2"))
+        edges = symlog(_edges(coords), linthresh=linthresh, base=2., linscale=.5)
+    elif y_axis == "mel":
+        edges = symlog(_edges(librosa.mel_frequencies(n_bins, fmin=0., fmax=sr / 2.)), linthresh=1000., base=2.)
+    elif y_axis == "chroma":
+        edges = _edges(np.arange(n_bins, dtype=np.float64))
+    else:
+        raise ValueError("Axis %s is not supported" % y_axis)
+    return _read_only(_pixel_bins(edges, height, reverse=True))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_pixel_cols(n_frames=44, width=224):
+    """ frame shown in every pixel column of the (linear) time axis, read-only np.array int of shape (width,) """
+    return _read_only(_pixel_bins(np.arange(n_frames + 1, dtype=np.float64), width))
+
+
+def to_pixels(data=None, y_axis="log", sr=22050, size=(224, 160)):
+    """
+    Map a (bins, frames) matrix onto an image of size (width, height) like specshow on an axes filling
+    the whole figure, with the cached pixel maps of the axes. Row 0 of the image is the highest bin.
+
+    :param data: np.array, shape ([batch,] bins, frames)
+    :param y_axis: str, specshow y axis, see get_pixel_rows
+    :param sr: int, sampling rate the axis is labeled for
+    :param size: (width, height) in pixels
+    :return: np.array, shape ([batch,] height, width)
+    """
+    rows = get_pixel_rows(y_axis, sr, data.shape[-2], size[1])
+    return data[..., rows[:, np.newaxis], get_pixel_cols(data.shape[-1], size[0])[np.newaxis, :]]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_colormap(name="magma"):
+    """
+    Lookup table of a matplotlib colormap, only the colormap registry is used, no figure
+
+    :param name: str, colormap name
+    :return: np.array uint8, shape (256, 3), read-only
+    """
+    import matplotlib
+    return _read_only(np.ascontiguousarray(matplotlib.colormaps[name](np.arange(256), bytes=True)[:, :3]))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_gray_colormap(name="gray_r"):
+    """ gray value of every color of a colormap like image.rgb2gray, read-only float32 of shape (256,) """
+    return _read_only(np.dot(get_colormap(name), np.array([0.299, 0.587, 0.114])).astype(np.float32))
+
+
+def default_colormap(data=None):
+    """ colormap librosa.display.specshow picks for the (finite) data: sequential if it has a single sign """
+    if data.min() >= 0 or data.max() <= 0:
+        return "magma"
+    min_val, max_val = np.percentile(data, [2, 98])
+    return "magma" if min_val >= 0 or max_val <= 0 else "coolwarm"
+
+
+def _image_stats(data, bw=True):
+    """ colormap (None if bw) and value range of every matrix of shape ([batch,] bins, frames) like specshow """
+    if data.ndim == 2:
+        return None if bw else default_colormap(data), data.min(), data.max()
+    cmaps = None if bw else [default_colormap(matrix) for matrix in data]
+    return cmaps, data.min(axis=(1, 2), keepdims=True), data.max(axis=(1, 2), keepdims=True)
+
+
+def color_index(data=None, vmin=None, vmax=None):
+    """
+    Colormap index (0 - 255) of the values like a matplotlib Normalize followed by a colormap lookup
+
+    :param data: np.array, shape ([batch,] bins, frames)
+    :param vmin: float or np.array (batch, 1, 1), value of the first color, None for the minimum
+    :param vmax: float or np.array (batch, 1, 1), value of the last color, None for the maximum
+    :return: np.array uint8, same shape as data
+    """
+    vmin = np.float32(data.min()) if vmin is None else np.asarray(vmin, dtype=np.float32)
+    vmax = np.float32(data.max()) if vmax is None else np.asarray(vmax, dtype=np.float32)
+    scale = np.where(vmax > vmin, np.float32(256.) / np.maximum(vmax - vmin, np.float32(1e-20)), np.float32(0.))
+    return np.clip((data - vmin) * scale, 0, 255).astype(np.uint8)
+
+
+def to_image(index=None, bw=True, cmap="magma"):
+    """
+    Colors of colormap indices, bw images are converted to gray like fig2data
+
+    :param index: np.array uint8, shape ([batch,] height, width), see color_index
+    :param bw: bool, gray scale ('gray_r') image
+    :param cmap: str or list of str (one per image), colormap if not bw
+    :return: np.array float32 ([batch,] height, width) if bw else uint8 ([batch,] height, width, 3)
+    """
+    if bw:
+        return get_gray_colormap("gray_r")[index]
+    elif isinstance(cmap, (list, tuple)):
+        luts = np.stack([get_colormap(name) for name in cmap])
+        return luts[np.arange(len(cmap)).reshape((-1, 1, 1)), index]
+    return get_colormap(cmap)[index]
+
+
+def power_spectrogram_db(y=None):
+    """ power spectrogram ([batch,] bins, frames) in dB like visualize.power_spectrogram """
+    return amplitude_to_db(power(stft(y)))
+
+
+def mel_power_spectrogram_db(y=None, sr=22050):
+    """ mel power spectrogram ([batch,] mels, frames) in dB like visualize.mel_power_spectrogram """
+    return amplitude_to_db(np.matmul(get_mel_basis(sr, N_FFT, N_MELS), power(stft(y))))
+
+
+def chroma(y=None, sr=22050, mode="cqt", hpss=True):
+    """
+    Chromagram ([batch,] 12, frames), each frame normalized to a maximum of 1
+
+    mode 'cqt' is visualize.chromagram: the chroma of the harmonic component like librosa.feature.chroma_cqt,
+    from the pseudo constant-Q transform with cached filters (see pseudo_cqt) and the cached chroma filter, the
+    tuning is not estimated. mode 'stft' folds the magnitude spectrogram (CHROMA_N_FFT, same frames as the other features) into the
+    pitch classes with a cached filter (like librosa.feature.chroma_stft without tuning estimation and octave
+    weighting) and is many times faster, see examples/chroma_benchmark.py.
+
+    :param y: np.array, samples of shape (samples,) or (batch, samples)
+    :param sr: int, sampling rate
+    :param mode: str, 'cqt' or 'stft'
+    :param hpss: bool, use the harmonic component of y only, disable it if y is already harmonic (e.g. from an
+                 AudioFrameGenerator with harmonic=True or a synthetic chord without transients)
+    :return: np.array float32
+    """
+    y = np.asarray(y, dtype=np.float32)
+    if hpss:
+        y = librosa.effects.harmonic(y)
+    if mode == "stft":
+        c = np.matmul(get_stft_chroma_basis(sr, CHROMA_N_FFT, N_CHROMA), np.abs(stft(y, n_fft=CHROMA_N_FFT)))
+    elif mode == "cqt":
+        c = pseudo_cqt(y, sr)
+        c = np.maximum(np.matmul(get_chroma_basis(c.shape[-2]), c), 0.)
+    else:
+        raise ValueError("Chroma mode %s is not supported" % mode)
+    return librosa.util.normalize(c, norm=np.inf, axis=-2).astype(np.float32)
+
+
+def power_spectrogram(y=None, sr=22050, size=(224, 160), bw=True):
+    """
+    Image of visualize.power_spectrogram with a log frequency axis (specshow y_axis='log')
+
+    :param y: np.array, samples of shape (samples,) or (batch, samples)
+    :param sr: int, sampling rate
+    :param size: (width, height) in pixels
+    :param bw: bool, gray scale image
+    :return: np.array float32 ([batch,] height, width) if bw else uint8 ([batch,] height, width, 3)
+    """
+    db = power_spectrogram_db(y)
+    cmap, vmin, vmax = _image_stats(db, bw)
+    # the colored plot is drawn without passing sr, so specshow labels the bins for DISPLAY_SR
+    index = to_pixels(color_index(db, vmin, vmax), "log", sr if bw else DISPLAY_SR, size)
+    return to_image(index, bw, cmap)
+
+
+def mel_power_spectrogram(y=None, sr=22050, size=(224, 160), bw=True):
+    """
+    Image of visualize.mel_power_spectrogram with a mel frequency axis (specshow y_axis='mel')
+
+    :param y: np.array, samples of shape (samples,) or (batch, samples)
+    :param sr: int, sampling rate
+    :param size: (width, height) in pixels
+    :param bw: bool, gray scale image
+    :return: np.array float32 ([batch,] height, width) if bw else uint8 ([batch,] height, width, 3)
+    """
+    db = mel_power_spectrogram_db(y, sr)
+    cmap, vmin, vmax = _image_stats(db, bw)
+    index = to_pixels(color_index(db, vmin, vmax), "mel", sr, size)
+    return to_image(index, bw, cmap)
+
+
+def chromagram(y=None, sr=22050, size=(224, 160), bw=True):
+    """
+    Image of visualize.chromagram, 12 pitch classes between 0 and 1
+
+    :param y: np.array, samples of shape (samples,) or (batch, samples)
+    :param sr: int, sampling rate
+    :param size: (width, height) in pixels
+    :param bw: bool, gray scale image
+    :return: np.array float32 ([batch,] height, width) if bw else uint8 ([batch,] height, width, 3)
+    """
+    c = chroma(y, sr)
+    index = to_pixels(color_index(c, 0., 1.), "chroma", sr, size)
+    return to_image(index, bw, "magma")
+
+
+def fast_chromagram(y=None, sr=22050, size=(224, 160), bw=True):
+    """
+    Image of visualize.fast_chromagram: chroma(mode='stft', hpss=False), 12 pitch classes between 0 and 1
+
+    :param y: np.array, samples of shape (samples,) or (batch, samples)
+    :param sr: int, sampling rate
+    :param size: (width, height) in pixels
+    :param bw: bool, gray scale image
+    :return: np.array float32 ([batch,] height, width) if bw else uint8 ([batch,] height, width, 3)
+    """
+    c = chroma(y, sr, mode="stft", hpss=False)
+    index = to_pixels(color_index(c, 0., 1.), "chroma", sr, size)
+    return to_image(index, bw, "magma")
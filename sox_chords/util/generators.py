@@ -1,56 +1,138 @@
-from os.path import join, basename, exists
+import hashlib
+import os
+import tempfile
+from os.path import join, basename, exists, abspath, getmtime, getsize
 
-from pickle import load as pickle_load
-from pickle import dump as pickle_dump
+from math import ceil
+
+import numpy as np
+import soundfile
+from numpy.lib.stride_tricks import sliding_window_view
 from librosa import load as librosa_load
 from librosa import get_duration
-from random import randint
+from librosa import resample as librosa_resample
+from librosa.effects import harmonic as librosa_harmonic
 
 from sox_chords.values import Values
 from sox_chords.util.logger import pp
 from sox_chords.exceptions import GeneratorException
 
 
+def _frame_index(num_available=0, num_frames=-1, randomize=False, rng=None):
+    # frame numbers of get_frames_array: random (with replacement) or in order, repeated if there are too few
+    num_frames = num_frames if num_frames > 0 else num_available
+    if randomize:
+        return (rng or np.random.default_rng()).integers(num_available, size=num_frames)
+    return np.arange(num_frames) % num_available
+
+
 class AudioFrameGenerator(object):
 
-    def __init__(self, input_file="", sr=22050, load_duration=5.0):
+    def __init__(self, input_file="", sr=22050, load_duration=5.0, y=None, harmonic=False, cache_dir=None):
         """
 
-        :param input_file: str, input audio file
+        :param input_file: str, input audio file or name of the samples y
         :param sr: int, sampling rate
         :param load_duration: float, duration in seconds to load samples from an audio file in advance
+        :param y: np.array, samples already in memory (e.g. from Chord.render), input_file is not read then
+        :param harmonic: bool, keep only the harmonic component (librosa.effects.harmonic) of the samples, it is
+                         separated once here instead of for every frame (see features.chroma with hpss=False)
+        :param cache_dir: str, directory of the cached samples of audio files, None for Values.AUDIO_CACHE_DIR
         """
         self.load_duration = load_duration
         self.input_file = input_file
         self.sr = sr
-        self._load()
+        self.cache_dir = cache_dir or Values.AUDIO_CACHE_DIR
+        if y is not None:
+            self.y = y
+            self.duration = get_duration(y=self.y, sr=self.sr)
+        else:
+            self._load()
+        if harmonic:
+            self.y = librosa_harmonic(self.y)
+
+    def _load_args(self):
+        # every argument the decoded samples depend on, the cache key is derived from them
+        return {"sr": self.sr, "mono": True, "offset": 0., "duration": self.load_duration}
+
+    def get_cache_file(self):
+        """
+        :return: str, cache file of the samples, keyed by the path, modification time and size of the audio file
+                 and every argument of the decoding (sampling rate, channels, offset and loaded duration)
+        """
+        key = (abspath(self.input_file), getmtime(self.input_file), getsize(self.input_file),
+               sorted(self._load_args().items()))
+        return join(self.cache_dir, hashlib.sha1(repr(key).encode("utf-8")).hexdigest() + ".npy")
 
-    def _load_file_raw(self, pkl):
-        self.y, self.sr = librosa_load(path=self.input_file, sr=self.sr, duration=self.load_duration)
-        if Values.USE_PKL:
-            pickle_dump([self.y, self.sr], open(pkl, "wb"))
+    def _load_file_raw(self, cache_file=None):
+        self.y, self.sr = librosa_load(path=self.input_file, **self._load_args())
+        if cache_file:
+            if not exists(self.cache_dir):
+                os.makedirs(self.cache_dir, exist_ok=True)
+            # write to a temporary file first, concurrent readers never see a partial file
+            handle, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(handle, "wb") as handler:
+                np.save(handler, np.asarray(self.y, dtype=Values.D_TYPE_AUDIO))
+            os.replace(tmp, cache_file)
 
     def _load(self):
-        pkl = self.input_file + ".pkl"
-        if exists(pkl) and Values.USE_PKL:
-            self.y, self.sr = pickle_load(open(pkl, "rb"))
-            if self.load_duration != (len(self.y) / self.sr):
-                self._load_file_raw(pkl)
-
-                if Values.DEBUG:
-                    pp("Reloaded because durations do not match")
-
-            else:
-                if Values.DEBUG:
-                    pp("Loaded PKL: " + pkl)
+        # the sampling rate of the samples must be known to cache them
+        cache_file = self.get_cache_file() if Values.USE_AUDIO_CACHE and self.sr else None
+        if cache_file and exists(cache_file):
+            # memory-mapped, frames are slices of the file and only the pages read are loaded
+            self.y = np.load(cache_file, mmap_mode="r")
+            if Values.DEBUG:
+                pp("Loaded cache: " + cache_file)
         else:
-            self._load_file_raw(pkl)
+            self._load_file_raw(cache_file)
             if Values.DEBUG:
                 pp("Loaded Direct: " + basename(self.input_file))
 
         self.duration = get_duration(y=self.y, sr=self.sr)
 
-    def get_frames(self, frame_length=1, num_frames=-1, randomize=False):
+    def _frame_view(self, frame_length=1, hop_length=None):
+        num_samples = int(frame_length * self.sr)
+        if num_samples > len(self.y):
+            raise GeneratorException("Cannot get %d  samples from %s  which contains only %d samples" % (num_samples, self.input_file, len(self.y)))
+        hop = int(hop_length * self.sr) if hop_length else num_samples
+        if hop < 1:
+            raise GeneratorException("hop length of %s seconds is shorter than a sample" % str(hop_length))
+        return sliding_window_view(self.y, num_samples)[::hop]
+
+    def get_num_frames(self, frame_length=1, hop_length=None):
+        """
+        :param frame_length: frame length in seconds
+        :param hop_length: seconds between the starts of two frames, None for frame_length (no overlap)
+        :return: int, number of complete frames
+        """
+        return len(self._frame_view(frame_length, hop_length))
+
+    def get_frames_array(self, frame_length=1, num_frames=-1, randomize=False, hop_length=None, index=None,
+                         rng=None):
+        """
+        Get frames from an audio file as rows of an array. All frames in order are a strided view of the
+        samples, other selections are gathered with a single index operation.
+
+        :raise GeneratorException
+        :param frame_length: frame length in seconds
+        :param num_frames: if > 0 number of frames, else every complete frame
+        :param randomize: random frames (drawn with replacement), otherwise in order, repeated if more frames
+                          are requested than there are
+        :param hop_length: seconds between the starts of two frames, None for frame_length (no overlap)
+        :param index: np.array of int, frame numbers to get, num_frames and randomize are ignored then
+        :param rng: np.random.Generator of the random frames, None for a new unseeded one
+        :return: np.array, (num_frames, sampling_rate * frame_length)
+        """
+        frames = self._frame_view(frame_length, hop_length)
+        if index is None:
+            if not randomize and (num_frames < 0 or num_frames == len(frames)):
+                return frames
+            elif not randomize and num_frames < len(frames):
+                return frames[:num_frames]
+            index = _frame_index(len(frames), num_frames, randomize, rng)
+        return frames[index]
+
+    def get_frames(self, frame_length=1, num_frames=-1, randomize=False, hop_length=None, rng=None):
         """
         Get frames from an audio file
 
@@ -58,29 +140,115 @@ class AudioFrameGenerator(object):
         :param frame_length: frame length in seconds
         :param num_frames: if > 0 number of frames, else hole frame
         :param randomize: randomize the frame index otherwise it returns in order
+        :param hop_length: seconds between the starts of two frames, None for frame_length (no overlap)
+        :param rng: np.random.Generator of the random frames, None for a new unseeded one
         :return: list, list of frames length sampling_rate * frame_length
         """
-        num_samples = int(frame_length * self.sr)
-        if num_samples > len(self.y):
-            raise GeneratorException("Cannot get %d  samples from %s  which contains only %d samples" % (num_samples, self.input_file, len(self.y)))
+        return list(self.get_frames_array(frame_length, num_frames, randomize, hop_length, rng=rng))
+
+
+class AudioFileReader(object):
+    """
+        Random access to the samples of an audio file, only the requested window is decoded. Files soundfile
+        can open are read by seeking to the offset, other files (e.g. mp3 for libsndfile versions before 1.1)
+        with sox trim.
+    """
+
+    def __init__(self, input_file="", sr=22050):
+        """
+        :param input_file: str, audio file
+        :param sr: int, sampling rate of the samples read
+        """
+        from sox_chords.util.sox import Sox
+
+        self.input_file = input_file
+        self.sr = sr
+        try:
+            info = soundfile.info(input_file)
+            self.use_sox = False
+            self.file_sr, self.duration = info.samplerate, float(info.frames) / info.samplerate
+        except RuntimeError:
+            self.use_sox = True
+            self.file_sr = int(float(Sox.call_pipe(["sox", "--i", "-r", input_file])))
+            self.duration = float(Sox.call_pipe(["sox", "--i", "-D", input_file]))
+
+    def read(self, offset=0., duration=1.):
+        """
+        Mono samples of a window of the file, resampled to sr
+
+        :param offset: float, start of the window in seconds
+        :param duration: float, length of the window in seconds
+        :return: np.array float32 of int(duration * sr) samples, zero padded after the end of the file
+        """
+        from sox_chords.util.sox import Sox
+
+        num_samples = int(duration * self.sr)
+        if self.use_sox:
+            y = np.frombuffer(Sox.call_pipe(["sox", self.input_file, "-t", "raw", "-e", "floating-point", "-b", "32",
+                                             "-c", "1", "-r", str(self.sr), "-", "trim", str(offset), str(duration)]),
+                              dtype=np.float32)
+        else:
+            with soundfile.SoundFile(self.input_file) as handler:
+                handler.seek(min(int(round(offset * self.file_sr)), handler.frames))
+                y = handler.read(int(ceil(duration * self.file_sr)), dtype="float32", always_2d=True).mean(axis=1)
+            if self.file_sr != self.sr:
+                y = librosa_resample(y, orig_sr=self.file_sr, target_sr=self.sr)
+
+        y = np.asarray(y[:num_samples], dtype=np.float32)
+        if len(y) < num_samples:
+            y = np.concatenate([y, np.zeros(num_samples - len(y), dtype=np.float32)])
+        return y
+
+
+class FileFrameSampler(object):
+    """
+        Frames drawn from a whole audio file, each frame is read on its own by an AudioFileReader. It has the
+        get_frames interface of AudioFrameGenerator without loading the file into memory.
+    """
 
-        _frames = []
-        if num_frames < 0:
-            num_frames = int(len(self.y) // num_samples)
+    def __init__(self, input_file="", sr=22050):
+        """
+        :param input_file: str, audio file
+        :param sr: int, sampling rate
+        """
+        self.input_file = input_file
+        self.sr = sr
+        self.reader = AudioFileReader(input_file, sr)
+        self.duration = self.reader.duration
+
+    def get_num_frames(self, frame_length=1, hop_length=None):
+        """
+        :param frame_length: frame length in seconds
+        :param hop_length: seconds between the starts of two frames, None for frame_length (no overlap)
+        :return: int, number of complete frames in the file
+        """
+        hop_length = hop_length or frame_length
+        return int((self.duration - frame_length) // hop_length) + 1 if self.duration >= frame_length else 0
+
+    def get_frames_array(self, frame_length=1, num_frames=-1, randomize=False, hop_length=None, index=None,
+                         rng=None):
+        """
+        Read frames of the file, see AudioFrameGenerator.get_frames_array
 
-        _i = -1
-        while len(_frames) < num_frames:
-            if randomize:
-                _i = randint(0, num_frames - 1)
-            else:
-                _i += 1
-            _frame = self.y[(_i * num_samples) %
-                            len(self.y):((_i + 1) * num_samples) % (len(self.y) + 1)]
+        :raise GeneratorException
+        :return: np.array, (num_frames, sampling_rate * frame_length)
+        """
+        num_available = self.get_num_frames(frame_length, hop_length)
+        if num_available == 0:
+            raise GeneratorException("Cannot get a frame of %s seconds from %s which is %s seconds long" %
+                                     (str(frame_length), self.input_file, str(self.duration)))
+        if index is None:
+            index = _frame_index(num_available, num_frames, randomize, rng)
+        hop_length = hop_length or frame_length
+        return np.stack([self.reader.read(i * hop_length, frame_length) for i in index])
 
-            if len(_frame) != 0:
-                _frames.append(_frame)
+    def get_frames(self, frame_length=1, num_frames=-1, randomize=False, hop_length=None, rng=None):
+        """
+        Read frames of the file
 
-        return _frames
+        :return: list, list of frames length sampling_rate * frame_length
+        """
+        return list(self.get_frames_array(frame_length, num_frames, randomize, hop_length, rng=rng))
 
 
 def check_files_loadable(_path="", _sr=22050):
@@ -1,3 +1,6 @@
+from contextlib import contextmanager
+from threading import Lock
+
 from sox_chords import values
 
 # from random import randint
@@ -9,6 +12,8 @@ from PIL import Image
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 matplotlib.rcParams['axes.titlesize'] = 8
 matplotlib.rcParams['axes.labelsize'] = 5
 matplotlib.rcParams['xtick.labelsize'] = 5
@@ -66,13 +71,82 @@ def fig2data(fig=None, bw=True, crop=None):
     # draw the renderer
     fig.canvas.draw()
 
-    # Get the GBA buffer from the figure
-    w, h = fig.canvas.get_width_height()
-    buf = np.frombuffer(fig.canvas.tostring_rgb(), dtype=values.Values.D_TYPE_IMG)
-    buf.shape = (h, w, 3)
+    # view of the RGBA buffer of the canvas, only the result is copied out of it
+    buf = np.asarray(fig.canvas.buffer_rgba())
     if bw:
-        buf = rgb2gray(buf)
+        # bw figures are drawn in gray, every color channel holds the gray value
+        buf = buf[..., 0].astype(np.float32)
+    else:
+        buf = np.array(buf[..., :3], dtype=values.Values.D_TYPE_IMG)
     if crop:
         buf = np.asarray(data_to_image(buf).crop(box=crop), dtype=values.Values.D_TYPE_IMG)
 
     return buf
+
+
+class FigurePool(object):
+    """
+        Pre-sized figures without borders, each with a single axes covering the whole figure and its own
+        FigureCanvasAgg. A figure is lent to one thread at a time, so threads can plot concurrently without
+        the pyplot state machine.
+    """
+
+    def __init__(self):
+        self._free = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def _create(size, dpi):
+        fig = Figure(figsize=size, dpi=dpi, frameon=False)
+        FigureCanvasAgg(fig)
+        ax = fig.add_axes([0., 0., 1., 1.])
+        ax.set_axis_off()
+        return ax
+
+    def acquire(self, size=(22.4, 16.0), dpi=10, bw=True):
+        """
+        Borrow the axes of a figure, a new figure is created if all figures of the key are in use
+
+        :param size: tuple, (width, height) of the figure in inches
+        :param dpi: int, dots per inch
+        :param bw: bool, black and white images
+        :return: matplotlib Axes, ax.figure is the figure
+        """
+        with self._lock:
+            free = self._free.get((tuple(size), dpi, bw))
+            if free:
+                return free.pop()
+        return self._create(size, dpi)
+
+    def release(self, ax=None, size=(22.4, 16.0), dpi=10, bw=True):
+        """
+        Clear the axes and give its figure back to the pool
+
+        :param ax: matplotlib Axes returned by acquire
+        :param size: tuple, size the axes was acquired with
+        :param dpi: int, dpi the axes was acquired with
+        :param bw: bool, bw the axes was acquired with
+        """
+        ax.clear()
+        ax.set_axis_off()
+        with self._lock:
+            self._free.setdefault((tuple(size), dpi, bw), []).append(ax)
+
+    @contextmanager
+    def axes(self, size=(22.4, 16.0), dpi=10, bw=True):
+        """
+        with pool.axes(size, dpi, bw) as ax: ... borrows the axes of a figure and releases it afterwards
+        """
+        ax = self.acquire(size, dpi, bw)
+        try:
+            yield ax
+        finally:
+            self.release(ax, size, dpi, bw)
+
+    def clear(self):
+        """ drop all free figures """
+        with self._lock:
+            self._free = {}
+
+
+figure_pool = FigurePool()
@@ -0,0 +1,182 @@
+"""
+Prefetching of batches in worker processes
+
+Every worker process makes the batches of a ChordProcessor (frame picking, mixing and visualization) and
+writes them into its slots of shared memory. The random generator of a batch is seeded with the loader seed
+and the position of the batch, so the batches do not depend on the number of workers and a run can be
+resumed from any position. The slots are handed back and forth
+with two queues per worker, so a worker is at most 'prefetch' batches ahead. Batch i is made by worker
+i % workers, the batches are returned in order.
+"""
+import multiprocessing
+import traceback
+from multiprocessing import shared_memory
+from queue import Empty
+
+import numpy as np
+
+from sox_chords.exceptions import GeneratorException
+from sox_chords.util.logger import logger
+from sox_chords.util.utils import spawn_seed
+
+
+def _get(tasks, stop, timeout=1.):
+    # next item of a queue, None if the loader is closed while waiting
+    while not stop.is_set():
+        try:
+            return tasks.get(timeout=timeout)
+        except Empty:
+            pass
+    return None
+
+
+def _worker(processor, worker, workers, n_batches, batch_size, start, batch_kwargs, seed, memory, specs, free,
+            ready, stop):
+    batches = None
+    try:
+        batches = [np.ndarray(shape, dtype=dtype, buffer=buf.buf) for buf, (shape, dtype) in zip(memory, specs)]
+        processor.prepare_worker(spawn_seed(seed, 0, worker))
+
+        for batch_i in range(worker, n_batches, workers):
+            slot = _get(free, stop)
+            if slot is None:
+                return
+            position = start + batch_i * batch_size
+            x, y = processor._make_batch(np.random.default_rng(spawn_seed(seed, 1, position)),
+                                         batch_size=batch_size, start=position, **batch_kwargs)
+            batches[0][slot], batches[1][slot] = x, y
+            ready.put((slot, None))
+    except Exception:
+        ready.put((None, traceback.format_exc()))
+    finally:
+        # the arrays must be released before the shared memory is closed
+        del batches
+        for buf in memory:
+            buf.close()
+
+
+class PrefetchLoader(object):
+
+    # seconds between two checks whether the workers are alive or the loader is closed
+    poll_interval = 1.
+
+    def __init__(self, processor=None, n_batches=5000, batch_size=64, workers=2, prefetch=2, seed=None, copy=True,
+                 start_method=None, start=0, **batch_kwargs):
+        """
+        :param processor: ChordProcessor
+        :param n_batches: int, number of batches
+        :param batch_size: int, number of images per batch
+        :param workers: int, number of worker processes
+        :param prefetch: int, number of batches each worker makes in advance
+        :param seed: int or np.random.SeedSequence, seed of the batches, every batch and every worker gets its own
+                     seed derived from it, None for a random seed
+        :param copy: bool, copy a batch out of the shared memory, otherwise the arrays of a batch are only valid
+                     until the next batch is requested
+        :param start_method: str, 'fork', 'spawn' or 'forkserver', None for the default of the platform
+        :param start: int, position of the first frame of the first batch, see ChordProcessor._make_batch
+        :param batch_kwargs: one_hot, n_mixed_files, rand_chord_sample, rand_mix_sample, rand_chord and balanced of
+                             ChordProcessor.batch_iterator
+        """
+        assert (workers > 0 and prefetch > 0), "workers and prefetch must be positive"
+        self.processor = processor
+        self.n_batches = n_batches
+        self.batch_size = batch_size
+        self.workers = workers
+        self.prefetch = prefetch
+        self.copy = copy
+        self.batch_kwargs = batch_kwargs
+        self.start = start
+        self.seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self._context = multiprocessing.get_context(start_method)
+        self._processes = []
+        self._memory = []
+        self._batches = []
+        self._free = []
+        self._ready = []
+        self._stop = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _start(self):
+        specs = [((self.prefetch,) + shape, dtype) for shape, dtype in
+                 self.processor.get_batch_specs(self.batch_size, self.batch_kwargs.get("one_hot", True))]
+        self._stop = self._context.Event()
+
+        for worker in range(self.workers):
+            memory = [shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+                      for shape, dtype in specs]
+            self._memory.append(memory)
+            self._batches.append([np.ndarray(shape, dtype=dtype, buffer=buf.buf)
+                                  for buf, (shape, dtype) in zip(memory, specs)])
+            free, ready = self._context.Queue(), self._context.Queue()
+            for slot in range(self.prefetch):
+                free.put(slot)
+            self._free.append(free)
+            self._ready.append(ready)
+
+            process = self._context.Process(
+                target=_worker, name="PrefetchLoader-%d" % worker, daemon=True,
+                args=(self.processor, worker, self.workers, self.n_batches, self.batch_size, self.start,
+                      self.batch_kwargs, self.seed, memory, specs, free, ready, self._stop))
+            process.start()
+            self._processes.append(process)
+
+    def _get_ready(self, worker):
+        while True:
+            try:
+                return self._ready[worker].get(timeout=self.poll_interval)
+            except Empty:
+                process = self._processes[worker]
+                if not process.is_alive():
+                    raise GeneratorException("worker %s exited with code %s" % (process.name, process.exitcode))
+
+    def __iter__(self):
+        self._start()
+        try:
+            pending = None
+            for batch_i in range(self.n_batches):
+                # the previous batch is released before waiting, its worker may have no other free slot
+                if pending is not None:
+                    self._free[pending[0]].put(pending[1])
+                    pending = None
+                worker = batch_i % self.workers
+                slot, error = self._get_ready(worker)
+                if error:
+                    raise GeneratorException("worker %d failed: %s" % (worker, error))
+
+                x, y = self._batches[worker][0][slot], self._batches[worker][1][slot]
+                if self.copy:
+                    x, y = x.copy(), y.copy()
+                    self._free[worker].put(slot)
+                else:
+                    pending = (worker, slot)
+                yield x, y
+        finally:
+            self.close()
+
+    def close(self):
+        """ stop the workers and release the shared memory """
+        if self._stop is None:
+            return
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout=10 * self.poll_interval)
+            if process.is_alive():
+                logger.error("terminating %s" % process.name)
+                process.terminate()
+                process.join()
+        for tasks in self._free + self._ready:
+            tasks.cancel_join_thread()
+            tasks.close()
+
+        self._batches = []
+        for memory in self._memory:
+            for buf in memory:
+                buf.close()
+                buf.unlink()
+        self._processes, self._memory, self._free, self._ready = [], [], [], []
+        self._stop = None
@@ -0,0 +1,280 @@
+"""
+Rotating pool of decoded mix segments
+
+The MixPool holds a fixed number of segments of random mix files in one preallocated array, so its memory
+is bounded. seek replaces the oldest segments with segments of other random files, the caller decides when
+(e.g. every few batches). The n-th decoded segment only depends on the seed of the pool and n, so the pool
+holds the same segments after the same number of replacements in every process and after a resume. A
+background thread decodes the next replacements in advance. Segments from the start of a file are read
+through the memory-mapped sample cache of AudioFrameGenerator, so a file is only decoded once. Frames are sampled from the segments in memory, sampling never waits for decoding.
+mix adds the sampled frames of a whole batch to the chord frames at once.
+"""
+from threading import Event, Lock, Thread
+
+import numpy as np
+
+from sox_chords.exceptions import GeneratorException
+from sox_chords.util.generators import AudioFileReader, AudioFrameGenerator
+from sox_chords.util.logger import logger
+from sox_chords.util.utils import spawn_seed
+from sox_chords.values import Values
+
+
+def mix(frames=None, mix_frames=None, snr_range=None, rng=None):
+    """
+    Add mix frames to a batch of chord frames, every mix frame is scaled to a random signal to noise ratio
+
+    :param frames: np.array, (batch, samples) chord frames
+    :param mix_frames: np.array, (batch, n_mixed, samples) frames mixed into each chord frame
+    :param snr_range: (low, high), signal to noise ratio in dB of the chord to each mix frame, drawn uniformly
+                      for every mix frame, None adds the mix frames unscaled
+    :param rng: np.random.Generator of the ratios, None for a new unseeded one
+    :return: np.array Values.D_TYPE_AUDIO, (batch, samples)
+    """
+    dtype = Values.D_TYPE_AUDIO
+    frames = np.asarray(frames, dtype=dtype)
+    mix_frames = np.asarray(mix_frames, dtype=dtype)
+    if snr_range is None:
+        return frames + mix_frames.sum(axis=1)
+
+    rng = rng or np.random.default_rng()
+    snr = rng.uniform(snr_range[0], snr_range[1], size=mix_frames.shape[:2]).astype(dtype)
+    signal_power = np.mean(np.square(frames), axis=-1, keepdims=True)
+    noise_power = np.mean(np.square(mix_frames), axis=-1)
+    # silent mix frames stay silent
+    gains = np.where(noise_power > 0, np.sqrt(signal_power / np.maximum(noise_power, np.finfo(dtype).tiny) *
+                                              np.power(dtype(10.), -snr / dtype(10.))), dtype(0.))
+    # weighted sum over the mix frames of every chord frame
+    return frames + np.matmul(gains[:, np.newaxis, :], mix_frames)[:, 0]
+
+
+class MixPool(object):
+
+    # number of files tried in a row before giving up to decode a segment
+    max_attempts = 10
+    # number of replacements the background thread decodes in advance
+    decode_ahead = 2
+
+    def __init__(self, mix_files=None, sr=22050, segment_duration=20., n_segments=10, max_bytes=None,
+                 whole_file=True, seed=None, cache_dir=None):
+        """
+        :param mix_files: list, audio files the segments are decoded from
+        :param sr: int, sampling rate
+        :param segment_duration: float, duration of each segment in seconds
+        :param n_segments: int, number of segments in the pool
+        :param max_bytes: int, maximum size of the segments in bytes (fewer segments are kept), None for no limit
+        :param whole_file: bool, decode segments starting anywhere in a file, otherwise the start of the file
+        :param seed: int or np.random.SeedSequence, seed of the choice of files and offsets, None for a random seed
+        :param cache_dir: str, directory of the cached samples of the starts of the files, None for
+                          Values.AUDIO_CACHE_DIR, see AudioFrameGenerator
+        """
+        if not mix_files:
+            raise GeneratorException("MixPool needs at least one mix file")
+        self.mix_files = list(mix_files)
+        self.sr = sr
+        self.whole_file = whole_file
+        self.cache_dir = cache_dir
+        self.seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.segment_samples = int(segment_duration * sr)
+        if max_bytes is not None:
+            n_segments = min(n_segments,
+                             max_bytes // (self.segment_samples * np.dtype(Values.D_TYPE_AUDIO).itemsize))
+        if n_segments < 1:
+            raise GeneratorException("max_bytes %s is too small for a segment of %s seconds" %
+                                     (str(max_bytes), str(segment_duration)))
+
+        self._init_threading()
+        # number of segments replaced since the pool was filled
+        self.refreshes = 0
+
+        self.segments = np.zeros((n_segments, self.segment_samples), dtype=Values.D_TYPE_AUDIO)
+        self.lengths = np.zeros(n_segments, dtype=np.int64)
+        self.files = [None] * n_segments
+        # the segment number of every row, segment n is stored in row n % n_segments
+        self.numbers = [None] * n_segments
+        for number in range(n_segments):
+            self._replace(number, *self._decode(number))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ["_lock", "_stop", "_wake", "_thread", "_decoded"]:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_threading()
+
+    def _init_threading(self):
+        self._lock = Lock()
+        self._stop = Event()
+        self._wake = Event()
+        self._thread = None
+        # segments decoded in advance by the background thread, by segment number
+        self._decoded = {}
+
+    def __len__(self):
+        return len(self.segments)
+
+    def _decode(self, number):
+        # segment number 'number' is a segment of a random file, unreadable files are skipped
+        rng = np.random.default_rng(spawn_seed(self.seed, number))
+        for _ in range(self.max_attempts):
+            mix_file = self.mix_files[rng.integers(len(self.mix_files))]
+            position = rng.random()
+            try:
+                y = self._read(mix_file, position)
+            except Exception as e:
+                # every decoder of librosa (and sox) fails with its own exception
+                logger.error("reading mix file %s failed: %s" % (mix_file, e))
+                continue
+            if len(y):
+                return mix_file, y
+        raise GeneratorException("could not read a segment from %d mix files" % self.max_attempts)
+
+    def _read(self, mix_file, position):
+        duration = float(self.segment_samples) / self.sr
+        if not self.whole_file:
+            return AudioFrameGenerator(mix_file, self.sr, duration, cache_dir=self.cache_dir).y[:self.segment_samples]
+        reader = AudioFileReader(mix_file, self.sr)
+        duration = min(reader.duration, duration)
+        return reader.read(position * (reader.duration - duration), duration)
+
+    def _replace(self, number, mix_file, y):
+        i = number % len(self)
+        with self._lock:
+            self.segments[i, :len(y)] = y
+            self.lengths[i] = len(y)
+            self.files[i] = mix_file
+            self.numbers[i] = number
+
+    def seek(self, refreshes=0):
+        """
+        Hold the segments of the pool after 'refreshes' replacements of the oldest segment, the segments only
+        depend on the seed of the pool and refreshes. Segments the background thread decoded in advance are
+        taken from there, the others are decoded now.
+
+        :raise GeneratorException
+        :param refreshes: int, number of segments replaced since the pool was filled
+        :return: self
+        """
+        last = len(self) - 1 + refreshes
+        with self._lock:
+            # the newest segment number of every row
+            numbers = [last - (last - i) % len(self) for i in range(len(self))]
+            missing = [number for number, current in zip(numbers, self.numbers) if number != current]
+            decoded = dict((number, self._decoded.pop(number)) for number in missing if number in self._decoded)
+            self._decoded = dict((number, item) for number, item in self._decoded.items() if number > last)
+            self.refreshes = refreshes
+        for number in sorted(missing):
+            self._replace(number, *(decoded.get(number) or self._decode(number)))
+        self._wake.set()
+        return self
+
+    def refresh(self):
+        """ replace the oldest segment with the next segment """
+        return self.seek(self.refreshes + 1)
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                last = len(self) - 1 + self.refreshes
+                upcoming = [number for number in range(last + 1, last + 1 + self.decode_ahead)
+                            if number not in self._decoded]
+            if not upcoming:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            try:
+                item = self._decode(upcoming[0])
+            except GeneratorException as e:
+                logger.error("decoding a mix segment in advance failed: %s" % e)
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            with self._lock:
+                if upcoming[0] > len(self) - 1 + self.refreshes:
+                    self._decoded[upcoming[0]] = item
+
+    def start(self):
+        """
+        Start decoding the next segments in a background thread
+
+        :return: self
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name="MixPool", daemon=True)
+            self._thread.start()
+        return self
+
+    def restart(self):
+        """
+        Start the background thread in a forked process, the thread and the lock of the parent process are not
+        usable there
+
+        :return: self
+        """
+        self._init_threading()
+        return self.start()
+
+    def state_dict(self):
+        """
+        Contents of the pool and the number of replacements, see load_state_dict
+
+        :return: dict
+        """
+        with self._lock:
+            return {"segments": self.segments.copy(), "lengths": self.lengths.copy(), "files": list(self.files),
+                    "numbers": list(self.numbers), "refreshes": self.refreshes, "seed": self.seed}
+
+    def load_state_dict(self, state):
+        """
+        Restore the segments and the seed of state_dict, e.g. of a pool of an interrupted run
+
+        :param state: dict, see state_dict
+        :return: self
+        """
+        with self._lock:
+            self.segments = np.array(state["segments"], dtype=Values.D_TYPE_AUDIO)
+            self.lengths = np.array(state["lengths"], dtype=np.int64)
+            self.files = list(state["files"])
+            self.numbers = list(state["numbers"])
+            self.refreshes = state["refreshes"]
+            self.seed = state["seed"]
+            self._decoded = {}
+        self._wake.set()
+        return self
+
+    def stop(self):
+        """ stop the background thread """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sample(self, frame_length=1., num_frames=1, randomize=True, rng=None):
+        """
+        Frames of random segments of the pool
+
+        :raise GeneratorException
+        :param frame_length: float, frame length in seconds
+        :param num_frames: int, number of frames
+        :param randomize: bool, random offsets in the segments, otherwise the frames start at the segments
+        :param rng: np.random.Generator of the segments and offsets, None for a new unseeded one
+        :return: np.array Values.D_TYPE_AUDIO, (num_frames, sampling_rate * frame_length)
+        """
+        rng = rng or np.random.default_rng()
+        num_samples = int(frame_length * self.sr)
+        with self._lock:
+            long_enough = np.flatnonzero(self.lengths >= num_samples)
+            if len(long_enough) == 0:
+                raise GeneratorException("no mix segment contains %d samples" % num_samples)
+            rows = long_enough[rng.integers(len(long_enough), size=num_frames)]
+            if randomize:
+                offsets = (rng.random(num_frames) * (self.lengths[rows] - num_samples + 1)).astype(
+                    np.int64)
+            else:
+                offsets = np.zeros(num_frames, dtype=np.int64)
+            return self.segments[rows[:, np.newaxis], offsets[:, np.newaxis] + np.arange(num_samples)]
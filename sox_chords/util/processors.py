@@ -2,8 +2,7 @@ from argparse import ArgumentParser
 from abc import abstractmethod
 
 """ Chord Processor imports"""
-from random import randint
-from numpy.random import permutation
+from collections import OrderedDict
 from os.path import join, exists
 from pickle import load as pickle_load
 import pickle
@@ -11,12 +10,19 @@ import tqdm
 import numpy as np
 
 from sox_chords.exceptions import ReaderException
-from sox_chords.music import utils
+from sox_chords.util.cache import RenderCache
 from sox_chords.util.generators import AudioFrameGenerator
-from sox_chords.util.visualize import get_visual_data, power_spectrogram, dpi, show_images
+from sox_chords.util.loader import PrefetchLoader
+from sox_chords.util.mix import MixPool, mix
+from sox_chords.util.render import render_many, get_variants
+from sox_chords.util.sampler import EpochSampler
+from sox_chords.util.store import FeatureStore
+from sox_chords.util.synth import get_backend
+from sox_chords.util.utils import get_files_with_extension, spawn_seed
+from sox_chords.util.visualize import get_visual_data, get_visual_batch, get_visual_shape, power_spectrogram, dpi, \
+    show_images
 from sox_chords.values import Values
 from sox_chords.util.logger import pp
-from sox_chords.util.logger import logger
 
 
 class BatchProcessor:
@@ -35,12 +41,44 @@ class BatchProcessor:
     def input_data(self, x):
         self._input_data = x
 
+    def _init_random(self, seed=None):
+        # every random choice of the processor derives from its seed, the generator of the batches is key 0
+        self.seed = seed if seed is not None else int(np.random.SeedSequence().entropy)
+        self.rng = np.random.default_rng(spawn_seed(self.seed, 0))
+        # number of samples generated so far
+        self._position = 0
+
+    def state_dict(self):
+        """
+        State of the batches of the processor: its seed, the number of samples generated so far and the state of
+        its random generator. A processor of the same data continues with the same batches after load_state_dict.
+
+        :return: dict
+        """
+        return {"seed": self.seed, "position": self._position, "rng": self.rng.bit_generator.state}
+
+    def load_state_dict(self, state):
+        """
+        Continue the batches of an interrupted run
+
+        :param state: dict, see state_dict
+        :return: self
+        """
+        self.seed = state["seed"]
+        self._position = state["position"]
+        self.rng.bit_generator.state = state["rng"]
+        return self
+
 
 class AudioProcessor(BatchProcessor):
 
     def __init__(self, audio_files, labels, sr=44100, frame_length=1.0, v_func=power_spectrogram, bw=False,
-                 v_size=(96, 96)):
+                 v_size=(96, 96), seed=None):
+        """
+        :param seed: int, seed of the batches, None for a random seed
+        """
         super().__init__()
+        self._init_random(seed)
         assert(len(audio_files) == len(labels)
                ), "audio files size must be equal to labels size"
         self.labels = labels
@@ -78,7 +116,6 @@ class AudioProcessor(BatchProcessor):
         """
         classes = len(self.labels)
         idxs = len(self.fg)
-        o_index = -1
 
         if Values.DEBUG:
             pp("Generating " + str(n_batches) + " batches")
@@ -90,16 +127,17 @@ class AudioProcessor(BatchProcessor):
 
                 # Get Random Input Chord or
                 if rand_chord:
-                    o_index = np.random.randint(idxs)
+                    o_index = self.rng.integers(idxs)
                 else:
-                    o_index = (o_index + 1) % idxs
+                    o_index = self._position % idxs
+                self._position += 1
 
                 (key, orig_fg) = self.fg[o_index]
                 if Values.DEBUG:
                     pp("Use chord: " + str(key))
 
                 for frame in orig_fg.get_frames(frame_length=self.frame_length, num_frames=1,
-                                                randomize=rand_chord_sample):
+                                                randomize=rand_chord_sample, rng=self.rng):
 
                     if one_hot:
                         y.append(
@@ -118,7 +156,7 @@ class AudioProcessor(BatchProcessor):
                     """
 
             x, y = np.array(x, dtype=Values.D_TYPE_IMG), np.array(
-                y, dtype=Values.D_TYPE_IMG)
+                y, dtype=Values.D_TYPE_IMG if one_hot else Values.D_TYPE_LABEL)
             yield x, y
 
 
@@ -126,24 +164,52 @@ class ChordProcessor(BatchProcessor):
 
     def __init__(self, chords, mix_dir, gen_dir="generated", mld=20, frame_length=1.0, n_load=10, ext_mix=".wav",
                  sr=44100, v_func=power_spectrogram, v_size=(256, 256), bw=True, noises=[], shift_range=range(0),
-                 bits=16, map_file="mapping.pkl"):
+                 bits=16, map_file="mapping.pkl", in_memory=False, backend=None, cache_dir=None,
+                 cache_size=2 ** 30, jobs=None, harmonic=False, store_dir=None, audio_cache_dir=None,
+                 seek_mix=False, mix_pool_bytes=None, mix_refresh=1, snr_range=None, seed=None):
         """
-        Generate 'chords' of frame length 'frame_length' and mix them randomly with pre-loaded samples of
-        audio files of length 'mld' located in 'mix_dir'. Chord will be generated in 'gen_dir' with extension '.wav'.
+        Generate 'chords' of frame length 'frame_length' and mix them randomly with pre-loaded segments of
+        audio files of length 'mld' located in 'mix_dir' (see MixPool). Chord will be generated in 'gen_dir' with extension '.wav'.
         Then a visualization function 'v_func' will be applied and the visualized data of 'v_size'
         is returned in batch sizes.
 
         :param chords: list, Chords to generate all modifications from
         :param gen_dir: str, directory where chords will be generated
         :param mix_dir: str, directory containing arbitrary music files which will be mixed with chord samples or None
-        :param mld: float, duration [seconds] each mix file preload before sampling from it
+        :param mld: float, duration [seconds] of each mix segment loaded before sampling from it
         :param frame_length: float, length of each frame/batch in seconds
-        :param n_load: int, number of randomly opened arbitrary files for mixing with chords
+        :param n_load: int, number of segments of random mix files in the mix pool
         :param ext_mix: str, extension of mix files '.wav' or '.mp3' ...
-        :param sr: int, sampling rate of read chords and mix files
+        :param sr: int, sampling rate of read chords and mix files, chords are rendered at sr directly so
+                   loading them for the visualization does not resample
         :param v_func: function, visualization function in core.util.visualize
         :param v_size: (width, height), size of the visualized audio image
         :param bw: bool, if true generated image will be gray scale
+        :param noises: list, Noise instances, each chord is additionally generated with every noise
+        :param shift_range: list, frequency shifts in Hz, each chord is additionally generated with every shift
+        :param bits: int, bits per sample of the generated chords
+        :param map_file: str, pickle file of the generated chord mapping, ignored if in_memory
+        :param in_memory: bool, render chords into memory instead of writing them to 'gen_dir'
+        :param backend: SynthBackend or name of the synthesis backend, None for Values.SYNTH_BACKEND
+        :param cache_dir: str, directory of a RenderCache, only variants missing in the cache are rendered
+        :param cache_size: int, maximum size of the render cache in bytes
+        :param jobs: int, number of processes rendering the chord variants, None for the number of cores
+        :param harmonic: bool, separate the harmonic component of every chord once when it is loaded instead of
+                         for every frame, e.g. for v_func=fast_chromagram
+        :param store_dir: str, directory of a FeatureStore, batches without mix files are read from the images
+                          stored there, which are computed once
+        :param audio_cache_dir: str, directory of the memory-mapped samples of loaded chord and mix files, None
+                                for Values.AUDIO_CACHE_DIR
+        :param seek_mix: bool, decode mix segments starting anywhere in the mix files instead of their first 'mld'
+                         seconds
+        :param mix_pool_bytes: int, maximum memory of the mix segments in bytes, None for n_load segments
+        :param mix_refresh: int, number of batches between two replaced mix segments, None to keep the first
+                            segments. The segments of a batch only depend on the seed and the position of the
+                            batch, the next segments are decoded in the background.
+        :param snr_range: (low, high), signal to noise ratio in dB of a chord to each frame mixed into it, drawn
+                          uniformly for every mix frame, None adds the mix frames unscaled
+        :param seed: int, seed of the processor, the class-balanced epochs (see EpochSampler), the mix pool and the
+                     batches derive their seeds from it, None for a random seed
         """
         self.mix_dir = mix_dir
         self.ext_mix = ext_mix
@@ -152,19 +218,47 @@ class ChordProcessor(BatchProcessor):
         self.v_func = v_func
         self.v_size = (v_size[0] / dpi, v_size[1] / dpi)
         self.bw = bw
+        self.harmonic = harmonic
+        self.store_dir = store_dir
+        self._store = None
+        self.audio_cache_dir = audio_cache_dir
+        self.seek_mix = seek_mix
+        self.mix_pool_bytes = mix_pool_bytes
+        self.mix_refresh = mix_refresh
+        self.snr_range = snr_range
+        # everything the rendered audio depends on, stored images are rebuilt if it changes
+        self.render_params = {"backend": get_backend(backend).cache_key(), "bits": bits,
+                              "noises": [noise.__class__.__name__ for noise in noises],
+                              "shift_range": [float(shift) for shift in shift_range]}
+        self._init_random(seed)
 
         self._chords = []
+        # variants of the generated chords, lined up with self._chords, None if unknown
+        self._variants = None
+        if in_memory:
+            map_file = None
         # Generate all chords used in this network
         if map_file and exists(map_file):
             print('loading pickle')
             with open(map_file, "rb") as handler:
-                self._chords = pickle_load(handler)
+                mapping = pickle_load(handler)
+            # mapping files of older versions only contain the chords
+            self._chords, self._variants = mapping if isinstance(mapping, tuple) else (mapping, None)
         else:
             print("get all chord modifications")
-            self._chords = self.get_all_chord_modifications(chords, gen_dir, shift_range, noises, bits=bits,
-                                                            duration=frame_length, sr=sr)
-            pickle.dump(self._chords, open(map_file, "wb"))
-            print('dumping pickle')
+            variants = get_variants(noises, shift_range)
+            mapping = self.get_all_chord_modifications(chords, gen_dir, shift_range, noises, bits=bits,
+                                                       duration=frame_length, sr=sr, in_memory=in_memory,
+                                                       backend=backend,
+                                                       cache=RenderCache(cache_dir, cache_size) if cache_dir else None,
+                                                       jobs=jobs, keep_failed=True)
+            self._chords = OrderedDict((name, [output for output in outputs if output is not None])
+                                       for name, outputs in mapping.items())
+            self._variants = OrderedDict((name, [variant for variant, output in zip(variants, outputs)
+                                                 if output is not None]) for name, outputs in mapping.items())
+            if map_file:
+                pickle.dump((self._chords, self._variants), open(map_file, "wb"))
+                print('dumping pickle')
         '''
         for i in range(len(chords)):
             self._chords.append(chords[i].generate(output_dir=gen_dir, extension=".wav", duration=frame_length))
@@ -172,6 +266,7 @@ class ChordProcessor(BatchProcessor):
         self.n_load = n_load
         self.frame_length = frame_length
         self.fgs = self._get_frame_generators()
+        self.sampler = self._get_sampler()
 
     def get_classes(self):
         return list(self._chords.keys())
@@ -180,117 +275,170 @@ class ChordProcessor(BatchProcessor):
         return len(list(self._chords.keys()))
 
     @staticmethod
-    def get_all_chord_modifications(chords, output_dir, shift_range, noises, bits=16, duration=1.0, sr=44100):
-        def gen_real(_chord):
-            return _chord.generate(output_dir=output_dir, extension=".wav", duration=duration, sr=sr, bits=bits,
-                                   noise=None, freq_shift=0)
-
-        def get_shift(_chord, _shift):
-            return _chord.generate(output_dir=output_dir, extension="-shift%5f.wav" % _shift, duration=duration,
-                                   sr=sr, bits=bits, noise=None, freq_shift=_shift)
-
-        def get_real_with_noise(_chord, noise):
-            return _chord.generate(output_dir=output_dir, extension="%s-.wav" % noise.__class__.__name__,
-                                   duration=duration, sr=sr, bits=bits, noise=noise, freq_shift=0)
-
-        def get_real_with_noise_and_shift(_chord, _noise, _shift):
-            return _chord.generate(output_dir=output_dir,
-                                   extension="-%s-shift%5f.wav" % (
-                                       _noise.__class__.__name__, _shift),
-                                   duration=duration, sr=sr, bits=bits, noise=_noise, freq_shift=_shift)
-
-        mapping = {}
-        for chord in tqdm.tqdm(chords, unit="chords"):
-            mapping[chord.get_name()] = []
-            mapping[chord.get_name()].append(gen_real(chord))
-            logger.debug('generate noices of ', chord.get_name(), noises)
-            for noise in noises:
-                mapping[chord.get_name()].append(
-                    get_real_with_noise(chord, noise))
-
-            logger.debug('generate shift range of ',
-                         chord.get_name(), shift_range)
-            for shift in shift_range:
-                mapping[chord.get_name()].append(get_shift(chord, shift))
-                for noise in noises:
-                    mapping[chord.get_name()].append(
-                        get_real_with_noise_and_shift(chord, noise, shift))
-        return mapping
+    def get_all_chord_modifications(chords, output_dir, shift_range, noises, bits=16, duration=1.0, sr=44100,
+                                    in_memory=False, backend=None, cache=None, dedup=True, jobs=None,
+                                    keep_failed=False):
+        """
+        Generate every chord clean, with every noise, with every frequency shift and with every noise and shift
+
+        :param in_memory: bool, render into np.arrays instead of files in output_dir
+        :param cache: RenderCache or None
+        :param dedup: bool, render chords sounding the same semi tones (e.g. C# and Db) only once and share the
+                      generated file (or np.array) between their labels
+        :param jobs: int, number of rendering processes, None for the number of cores
+        :param keep_failed: bool, keep None for failed renders, see render_many
+        :return: dict, chord name -> list of generated files (or np.arrays if in_memory)
+        """
+        return render_many(chords, get_variants(noises, shift_range), output_dir=output_dir, duration=duration, sr=sr,
+                           bits=bits, in_memory=in_memory, backend=backend, cache=cache, dedup=dedup, jobs=jobs,
+                           keep_failed=keep_failed)
 
     def _get_frame_generators(self):
 
         # Get data to modify original files
         if self.mix_dir:
-            mix_files = utils.get_files_with_extension(
-                self.mix_dir, extension=self.ext_mix)
-            if len(mix_files) < self.n_load:
-                raise ReaderException("You cannot load %s  files from %s, %s files where found. Please provide more files." % (str(self.n_load), self.mix_dir, str(len(mix_files))))
+            mix_files = get_files_with_extension(self.mix_dir, extension=self.ext_mix)
+            if not mix_files:
+                raise ReaderException("No files with extension %s found in %s. Please provide mix files." %
+                                      (self.ext_mix, self.mix_dir))
+
+            # segments of random mix files, replaced in the background
+            mix_pool = MixPool(mix_files, self.sr, segment_duration=self.mld, n_segments=self.n_load,
+                               max_bytes=self.mix_pool_bytes, whole_file=self.seek_mix,
+                               seed=spawn_seed(self.seed, 2), cache_dir=self.audio_cache_dir)
+            if self.mix_refresh:
+                mix_pool.start()
+        else:
+            mix_pool = None
+        # Generate original data, labels sharing a deduplicated render share its frame generator
+        fgs = {}
+
+        def get_frame_generator(name, chord):
+            key = id(chord) if isinstance(chord, np.ndarray) else chord
+            if key not in fgs:
+                fgs[key] = AudioFrameGenerator(name, self.sr, self.frame_length, y=chord, harmonic=self.harmonic) \
+                    if isinstance(chord, np.ndarray) else \
+                    AudioFrameGenerator(chord, self.sr, self.frame_length, harmonic=self.harmonic,
+                                        cache_dir=self.audio_cache_dir)
+            return fgs[key]
 
-            # Generate num_load random indexes
-            rand_idx = permutation([i for i in range(len(self.mix_dir))])[
-                :self.n_load]
+        orig_fgs_map = ([
+            (list(self._chords.keys()).index(name), get_frame_generator(name, chord))
+            for name in self._chords.keys() for chord in self._chords[name]])
 
-            # Load random mix files
-            rand_mix_args = list(map(lambda x: (mix_files[x], self.sr, self.mld), rand_idx))
-            mix_fgs = utils.parallize(AudioFrameGenerator, rand_mix_args)
+        return [orig_fgs_map, mix_pool]
 
+    def _get_sampler(self):
+        # the variant type of every frame generator is its stratum
+        if self._variants is not None:
+            strata = [variant.kind for name in self._chords.keys() for variant in self._variants[name]]
         else:
-            mix_fgs = None
-        # Generate original data
-        orig_fgs_map = ([
-            (list(self._chords.keys()).index(name),
-             AudioFrameGenerator(chord, self.sr, self.frame_length))
-            for name in self._chords.keys() for chord in self._chords[name]])
+            strata = None
+        return EpochSampler([key for key, _ in self.fgs[0]], strata, seed=spawn_seed(self.seed, 1))
+
+    def state_dict(self):
+        """
+        State of the batches of the processor: its seed, the number of samples generated so far (the position in
+        the epochs of the sampler), the state of its random generator and the contents of the mix pool. Batches of
+        batch_iterator without a seed continue bit-identical after load_state_dict.
+
+        :return: dict
+        """
+        state = super().state_dict()
+        state["mix_pool"] = self.fgs[1].state_dict() if self.fgs[1] else None
+        return state
+
+    def load_state_dict(self, state):
+        """
+        Continue the batches of an interrupted run
 
-        return [orig_fgs_map, mix_fgs]
+        :param state: dict, see state_dict
+        :return: self
+        """
+        seed = self.seed
+        super().load_state_dict(state)
+        if self.seed != seed:
+            self.sampler = self._get_sampler()
+        if self.fgs[1] and state["mix_pool"] is not None:
+            self.fgs[1].load_state_dict(state["mix_pool"])
+        return self
+
+    def batches_per_epoch(self, batch_size=64):
+        """ number of batches of a class-balanced epoch, see batch_iterator with balanced """
+        return -(-self.sampler.epoch_size // batch_size)
+
+    def close(self):
+        """ stop decoding mix segments in the background """
+        if self.fgs[1]:
+            self.fgs[1].stop()
+
+    def get_feature_store(self, store_dir=None, force=False):
+        """
+        FeatureStore with the image of every frame of every generated chord, it is only computed if the store
+        in store_dir is missing or was built from other chords or visualization parameters
+
+        :param store_dir: str, directory of the store, None for the store_dir of the processor
+        :param force: bool, recompute the images
+        :return: FeatureStore
+        """
+        store_dir = store_dir or self.store_dir
+        if self._store is None or self._store.store_dir != store_dir or force:
+            if self._variants is not None:
+                variants = [variant.params for name in self._chords.keys() for variant in self._variants[name]]
+            else:
+                variants = [None] * len(self.fgs[0])
+            sources = [(label, fg, variant) for (label, fg), variant in zip(self.fgs[0], variants)]
+            self._store = FeatureStore(store_dir, self.v_func, self.v_size, self.bw, self.sr, self.frame_length,
+                                       self.harmonic, self.render_params).build(sources, force=force)
+        return self._store
 
     def get_next(self, test=False, one_hot=True, n_mixed_files=5,
-                 rand_chord_sample=True, rand_mix_sample=True, rand_chord=True):
+                 rand_chord_sample=True, rand_mix_sample=True, rand_chord=True, balanced=False):
+        """
+        Returns the next sample
 
+        :param balanced: bool, take the chord from the class-balanced epochs of the sampler (then rand_chord
+                         is not used)
+        :return: x,y
+        """
         classes = self.get_num_classes()
         idxs = len(self.fgs[0])
-        o_index = -1
 
-        # Get Random Input Chord or
-        if rand_chord:
-            o_index = np.random.randint(idxs)
+        # Get the next chord of the balanced epochs, a random chord or
+        if balanced:
+            o_index = self.sampler.get_indices(self._position, 1)[0]
+        elif rand_chord:
+            o_index = self.rng.integers(idxs)
         else:
-            o_index = (o_index + 1) % idxs
+            o_index = self._position % idxs
+        self._position += 1
 
         (key, orig_fg) = self.fgs[0][o_index]
         if Values.DEBUG:
             pp("Use chord: " + str(key))
 
         for frame in orig_fg.get_frames(frame_length=self.frame_length, num_frames=1,
-                                        randomize=rand_chord_sample):
+                                        randomize=rand_chord_sample, rng=self.rng):
 
             if one_hot:
                 y = [1 if c == key else 0 for c in range(classes)]
             else:
                 y = key
 
-            if self.fgs[1]:
-                # choose audio files which will be mixed with the original chord
-                for i in range(n_mixed_files):
-
-                    i = randint(0, len(self.fgs[1]) - 1)
-                    if Values.DEBUG:
-                        pp("Mix with file: " + str(i))
-                    _x = np.array(self.fgs[1][i].get_frames(frame_length=self.frame_length, num_frames=1,
-                                                            randomize=rand_mix_sample)[0],
-                                  dtype=Values.D_TYPE_AUDIO)
-                    frame += _x
+            if self.fgs[1] and n_mixed_files > 0:
+                frame = self._mix(frame[np.newaxis], n_mixed_files, rand_mix_sample, self.rng)[0]
 
             # create a 400x400 sized power spectrogram, crop unnecessary white space
             x = get_visual_data(frame, self.sr, self.v_size,
                                 self.v_func, "", self.bw, True)
             x, y = np.array(x, dtype=Values.D_TYPE_IMG), np.array(
-                y, dtype=Values.D_TYPE_IMG)
+                y, dtype=Values.D_TYPE_IMG if one_hot else Values.D_TYPE_LABEL)
 
             yield x, y
 
     def batch_iterator(self, batch_size=64, test=False, one_hot=True, n_batches=5000, n_mixed_files=5,
-                       rand_chord_sample=True, rand_mix_sample=True, rand_chord=True):
+                       rand_chord_sample=True, rand_mix_sample=True, rand_chord=True, workers=0, prefetch=2,
+                       seed=None, balanced=False):
         """
         Returns the next batch needed for feeding into the network
 
@@ -309,60 +457,125 @@ class ChordProcessor(BatchProcessor):
         :param rand_mix_sample: bool, randomize mix file samples
         :param rand_chord: bool, randomize getting new chord or get them in order
         :param bw: bool, convert visualization to gray scale
+        :param workers: int, number of processes making batches in advance, 0 makes them when they are requested
+        :param prefetch: int, number of batches each worker makes in advance
+        :param seed: int, seed of a reproducible run of batches of its own, None continues the batches of the
+                     processor (see state_dict)
+        :param balanced: bool, take the chords from the class-balanced epochs of the sampler (then rand_chord is
+                         not used), see batches_per_epoch. Batches read from the feature store are not balanced.
         :return: x,y
         """
         classes = self.get_num_classes()
-        idxs = len(self.fgs[0])
-        o_index = -1
-
-        from sox_chords.util.utils import parallize
+        # without a seed the batches continue from the state of the processor, which is advanced before a batch
+        # is returned, a state_dict taken between two batches resumes with the next one
+        resume = seed is None
+        start = self._position if resume else 0
+        rng = self.rng if resume else np.random.default_rng(seed)
+
+        def advance():
+            if resume:
+                self._position += batch_size
+
+        if self.store_dir and not self.fgs[1]:
+            # without mixing every image is precomputed
+            for x, y in self.get_feature_store().batch_iterator(batch_size=batch_size, n_batches=n_batches,
+                                                                one_hot=one_hot, num_classes=classes,
+                                                                shuffle=rand_chord, rng=rng, start=start):
+                advance()
+                yield x, y
+            return
+
+        if workers:
+            # batches of worker processes, seeded by their position, see PrefetchLoader
+            loader = PrefetchLoader(self, n_batches=n_batches, workers=workers, prefetch=prefetch,
+                                    seed=spawn_seed(self.seed, 3) if resume else seed, start=start,
+                                    batch_size=batch_size, one_hot=one_hot, n_mixed_files=n_mixed_files,
+                                    rand_chord_sample=rand_chord_sample, rand_mix_sample=rand_mix_sample,
+                                    rand_chord=rand_chord, balanced=balanced)
+            try:
+                for x, y in loader:
+                    advance()
+                    yield x, y
+            finally:
+                loader.close()
+            return
 
         if Values.DEBUG:
             pp("Generating " + str(n_batches) + " batches")
         for batch_i in range(n_batches):
-            x, y = [], []
-            args = []
-            while len(args) < batch_size:
-                if len(args) % 5 == 0 and Values.DEBUG:
-                    pp(str(len(args)) + " of " + str(batch_size))
-
-                # Get Random Input Chord or
-                if rand_chord:
-                    o_index = np.random.randint(idxs)
-                else:
-                    o_index = (o_index + 1) % idxs
-
-                (key, orig_fg) = self.fgs[0][o_index]
-                if Values.DEBUG:
-                    pp("Use chord: " + str(key))
+            x, y = self._make_batch(rng, batch_size=batch_size, one_hot=one_hot, n_mixed_files=n_mixed_files,
+                                    rand_chord_sample=rand_chord_sample, rand_mix_sample=rand_mix_sample,
+                                    rand_chord=rand_chord, start=start + batch_i * batch_size, balanced=balanced)
+            advance()
+            yield x, y
 
-                for frame in orig_fg.get_frames(frame_length=self.frame_length, num_frames=1,
-                                                randomize=rand_chord_sample):
+    def _make_batch(self, rng=None, batch_size=64, one_hot=True, n_mixed_files=5, rand_chord_sample=True,
+                    rand_mix_sample=True, rand_chord=True, start=0, balanced=False):
+        """
+        One batch of batch_iterator: pick chord frames, mix them and visualize them
 
-                    if one_hot:
-                        y.append(
-                            [1 if c == key else 0 for c in range(classes)])
-                    else:
-                        y.append(key)
+        :param rng: np.random.Generator, source of every random choice of the batch
+        :param start: int, number of frames of the previous batches, the position of the first chord in order
+                      and in the epochs of the sampler
+        :return: x,y
+        """
+        classes = self.get_num_classes()
+        idxs = len(self.fgs[0])
 
-                    if self.fgs[1]:
-                        # choose audio files which will be mixed with the original chord
-                        for i in range(n_mixed_files):
+        # indices of the chords of the batch
+        if balanced:
+            indices = self.sampler.get_indices(start, batch_size)
+        elif rand_chord:
+            indices = rng.integers(idxs, size=batch_size)
+        else:
+            indices = (start + np.arange(batch_size)) % idxs
+
+        frames = []
+        for o_index in indices:
+            (key, orig_fg) = self.fgs[0][o_index]
+            if Values.DEBUG:
+                pp("Use chord: " + str(key))
+            frames.append(orig_fg.get_frames_array(frame_length=self.frame_length, num_frames=1,
+                                                   randomize=rand_chord_sample, rng=rng)[0])
+
+        keys = self.sampler.labels[indices]
+        y = np.eye(classes, dtype=Values.D_TYPE_IMG)[keys] if one_hot else keys
+
+        frames = np.stack(frames)
+        if self.fgs[1] and n_mixed_files > 0:
+            if self.mix_refresh:
+                # the segments of the pool follow the position of the batch
+                self.fgs[1].seek(start // batch_size // self.mix_refresh)
+            frames = self._mix(frames, n_mixed_files, rand_mix_sample, rng)
+
+        # visualize the whole batch at once
+        x = get_visual_batch(frames, self.sr, self.v_size, self.v_func, self.bw)
+        return np.array(x, dtype=Values.D_TYPE_IMG), np.asarray(y, dtype=Values.D_TYPE_IMG if one_hot else
+                                                                   Values.D_TYPE_LABEL)
+
+    def get_batch_specs(self, batch_size=64, one_hot=True):
+        """
+        Shapes and types of the arrays of a batch of _make_batch, without making one
 
-                            i = randint(0, len(self.fgs[1]) - 1)
-                            if Values.DEBUG:
-                                pp("Mix with file: " + str(i))
-                            _x = np.array(self.fgs[1][i].get_frames(frame_length=self.frame_length, num_frames=1,
-                                                                    randomize=rand_mix_sample)[0],
-                                          dtype=Values.D_TYPE_AUDIO)
-                            frame += _x
+        :return: list, [(shape, dtype) of x, (shape, dtype) of y]
+        """
+        y_spec = ((batch_size, self.get_num_classes()), np.dtype(Values.D_TYPE_IMG)) if one_hot else \
+            ((batch_size,), np.dtype(Values.D_TYPE_LABEL))
+        return [((batch_size,) + get_visual_shape(self.v_size, self.bw), np.dtype(Values.D_TYPE_IMG)), y_spec]
 
-                    # create a 400x400 sized power spectrogram, crop unnecessary white space
-                    args.append((frame, self.sr, self.v_size,
-                                 self.v_func, "", self.bw, True))
+    def _mix(self, frames, n_mixed_files=5, rand_mix_sample=True, rng=None):
+        # frames of random mix segments which are mixed with the chord frames
+        mix_frames = self.fgs[1].sample(frame_length=self.frame_length, num_frames=len(frames) * n_mixed_files,
+                                        randomize=rand_mix_sample, rng=rng)
+        return mix(frames, mix_frames.reshape(len(frames), n_mixed_files, -1), self.snr_range, rng)
 
-            x = parallize(get_visual_data, args)
-            x, y = np.array(x, dtype=Values.D_TYPE_IMG), np.array(
-                y, dtype=Values.D_TYPE_IMG)
+    def prepare_worker(self, seed=None):
+        """
+        Called in a worker process of a PrefetchLoader before it makes batches, the processor gets a random
+        generator of its own and the mix pool its own background thread there
 
-            yield x, y
+        :param seed: np.random.SeedSequence of the worker
+        """
+        self.rng = np.random.default_rng(spawn_seed(seed, 0))
+        if self.fgs[1] and self.mix_refresh:
+            self.fgs[1].restart()
@@ -0,0 +1,177 @@
+"""
+Rendering of many chord variants (noise, frequency shift) with a process pool
+"""
+import multiprocessing
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import tqdm
+
+from sox_chords.util.logger import logger
+
+
+class Variant(object):
+    """
+        A modification of a generated chord: added noise and/or shifted frequencies
+    """
+
+    def __init__(self, noise=None, freq_shift=0):
+        """
+        :param noise: Noise instance or None
+        :param freq_shift: float, frequency shift in Hz
+        """
+        self.noise = noise
+        self.freq_shift = freq_shift
+
+    @property
+    def noise_name(self):
+        return self.noise.__class__.__name__ if self.noise else None
+
+    @property
+    def extension(self):
+        """ file name extension of the generated chord, chord name + extension is the output file """
+        if self.noise and self.freq_shift:
+            return "-%s-shift%5f.wav" % (self.noise_name, self.freq_shift)
+        elif self.noise:
+            return "%s-.wav" % self.noise_name
+        elif self.freq_shift:
+            return "-shift%5f.wav" % self.freq_shift
+        return ".wav"
+
+    @property
+    def kind(self):
+        """ variant type: 'clean', 'noise', 'shift' or 'noise+shift' """
+        return "+".join(name for name, used in [("noise", self.noise), ("shift", self.freq_shift)] if used) or "clean"
+
+    @property
+    def params(self):
+        """ json serializable parameters of the variant """
+        return {"noise": self.noise_name, "freq_shift": self.freq_shift}
+
+    def get_key(self, chord):
+        """ chords with the same key sound identical """
+        return chord.get_semi_tones(), self.noise_name, self.freq_shift
+
+    def __repr__(self):
+        return "Variant(noise=%s, freq_shift=%s)" % (self.noise_name, self.freq_shift)
+
+
+def get_variants(noises=None, shift_range=None):
+    """
+    All variants in the order of ChordProcessor.get_all_chord_modifications: clean, every noise and for every shift
+    the shift alone followed by the shift with every noise
+
+    :param noises: list, Noise instances
+    :param shift_range: list, frequency shifts in Hz
+    :return: list, Variants
+    """
+    noises = noises or []
+    variants = [Variant()] + [Variant(noise=noise) for noise in noises]
+    for shift in shift_range if shift_range is not None else []:
+        variants.append(Variant(freq_shift=shift))
+        variants += [Variant(noise=noise, freq_shift=shift) for noise in noises]
+    return variants
+
+
+def render_variant(chord=None, variant=None, output_dir="", duration=1.0, sr=44100, bits=16, in_memory=False,
+                   backend=None, cache=None):
+    """
+    Render one variant of a chord
+
+    :return: str, output file or np.array if in_memory
+    """
+    if in_memory:
+        return chord.render(duration=duration, sr=sr, bits=bits, noise=variant.noise, freq_shift=variant.freq_shift,
+                            backend=backend, cache=cache)
+    return chord.generate(output_dir=output_dir, extension=variant.extension, duration=duration, sr=sr, bits=bits,
+                          noise=variant.noise, freq_shift=variant.freq_shift, backend=backend, cache=cache)
+
+
+def _render_job(job):
+    index, args, kwargs = job
+    try:
+        return index, render_variant(*args, **kwargs), None
+    except Exception as e:
+        return index, None, traceback.format_exc()
+
+
+def render_many(chords=None, variants=None, output_dir="", duration=1.0, sr=44100, bits=16, in_memory=False,
+                backend=None, cache=None, dedup=True, jobs=None, max_in_flight=None, keep_failed=False):
+    """
+    Render every variant of every chord with a pool of worker processes
+
+    The result does not depend on the number of workers: it is ordered like chords and variants. A failing
+    render is logged and left out of the result, it does not stop the other renders.
+
+    :param chords: list, Chords
+    :param variants: list, Variants, see get_variants
+    :param output_dir: str, directory of the generated files
+    :param duration: float, duration of each chord in seconds
+    :param sr: int, sampling rate
+    :param bits: int, bits per sample
+    :param in_memory: bool, render into np.arrays instead of files in output_dir
+    :param backend: SynthBackend or name of the synthesis backend, None for Values.SYNTH_BACKEND
+    :param cache: RenderCache or None
+    :param dedup: bool, render chords sounding the same semi tones (e.g. C# and Db) only once and share the
+                  generated file (or np.array) between their labels
+    :param jobs: int, number of worker processes, None for the number of cores, 1 renders in this process
+    :param max_in_flight: int, maximum number of submitted but unfinished renders, None for 2 * jobs
+    :param keep_failed: bool, keep None for a failed render, so the list of every chord lines up with variants
+    :return: OrderedDict, chord name -> list of generated files (or np.arrays if in_memory)
+    """
+    jobs = jobs or multiprocessing.cpu_count()
+    max_in_flight = max_in_flight or 2 * jobs
+    kwargs = dict(output_dir=output_dir, duration=duration, sr=sr, bits=bits, in_memory=in_memory, backend=backend,
+                  cache=cache)
+
+    # one render per group of identical sounding chord variants
+    groups = OrderedDict()
+    for i, chord in enumerate(chords):
+        for j, variant in enumerate(variants):
+            key = variant.get_key(chord) if dedup else (i, j)
+            groups.setdefault(key, []).append((i, j))
+    renders = [((chords[members[0][0]], variants[members[0][1]]), members) for members in groups.values()]
+
+    outputs = [None] * len(renders)
+    errors = {}
+    progress = tqdm.tqdm(total=len(renders), unit="renders")
+
+    def collect(result):
+        index, output, error = result
+        outputs[index] = output
+        if error:
+            errors[index] = error
+        progress.update(1)
+
+    if jobs == 1:
+        for index, (args, _) in enumerate(renders):
+            collect(_render_job((index, args, kwargs)))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            in_flight = set()
+            for index, (args, _) in enumerate(renders):
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future.result())
+                in_flight.add(executor.submit(_render_job, (index, args, kwargs)))
+            for future in wait(in_flight)[0]:
+                collect(future.result())
+    progress.close()
+
+    results = [[None] * len(variants) for _ in chords]
+    for index, (_, members) in enumerate(renders):
+        for i, j in members:
+            results[i][j] = outputs[index]
+
+    for index, error in errors.items():
+        chord, variant = renders[index][0]
+        logger.error("rendering %s %s failed: %s" % (chord.get_name(), variant, error))
+    logger.debug("rendered %d of %d chord variants" % (len(renders), len(chords) * len(variants)))
+
+    mapping = OrderedDict()
+    for i, chord in enumerate(chords):
+        mapping.setdefault(chord.get_name(), [])
+        mapping[chord.get_name()] += [output for output in results[i] if keep_failed or output is not None]
+    return mapping
@@ -0,0 +1,82 @@
+"""
+Class-balanced epochs over the frame generators of a ChordProcessor
+
+An epoch contains every class equally often. Within a class the variant types (clean, noise, shift,
+noise+shift) get equal shares, and within a variant type the frame generators are drawn without
+replacement (a group is only repeated if it is smaller than its share). The order of an epoch is an index
+array computed from the seed and the epoch number, so every position of the sampler can be computed in any
+process without drawing per sample.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from sox_chords.util.utils import spawn_seed
+
+
+class EpochSampler(object):
+
+    def __init__(self, labels=None, strata=None, seed=None):
+        """
+        :param labels: list, label of every frame generator
+        :param strata: list, variant type of every frame generator, see Variant.kind, None for a single type
+        :param seed: int or np.random.SeedSequence, seed of the epoch orders, None for a random seed
+        """
+        self.labels = np.asarray(labels, dtype=np.int64)
+        strata = strata if strata is not None else [None] * len(self.labels)
+        assert (len(strata) == len(self.labels)), "strata size must be equal to labels size"
+        self.seed = seed if seed is not None else int(np.random.SeedSequence().entropy)
+
+        # generators of every class and variant type
+        self.groups = OrderedDict()
+        for i, (label, stratum) in enumerate(zip(self.labels, strata)):
+            self.groups.setdefault(int(label), OrderedDict()).setdefault(stratum, []).append(i)
+        self.num_strata = len(set(strata))
+        # draws of every variant type of a class, the largest group is drawn once per epoch
+        self.quota = max(len(group) for strata_groups in self.groups.values() for group in strata_groups.values())
+        self._epoch = None
+        self._order = None
+
+    @property
+    def epoch_size(self):
+        """ number of samples of an epoch """
+        return len(self.groups) * self.num_strata * self.quota
+
+    def _draw(self, rng, group, count):
+        # count generators of a group without replacement, the group is repeated if it is too small
+        group = np.asarray(group)
+        repeats = -(-count // len(group))
+        return np.concatenate([rng.permutation(group) for _ in range(repeats)])[:count]
+
+    def get_epoch(self, epoch=0):
+        """
+        :param epoch: int, epoch number
+        :return: np.array, indices of the frame generators of the epoch in order
+        """
+        if self._epoch != epoch:
+            rng = np.random.default_rng(spawn_seed(self.seed, epoch))
+            draws = []
+            per_class = self.num_strata * self.quota
+            for strata_groups in self.groups.values():
+                # a class missing a variant type (e.g. a failed render) draws more of its other types
+                shares = np.full(len(strata_groups), per_class // len(strata_groups))
+                shares[:per_class % len(strata_groups)] += 1
+                draws += [self._draw(rng, group, share) for group, share in zip(strata_groups.values(), shares)]
+            self._order = rng.permutation(np.concatenate(draws))
+            self._epoch = epoch
+        return self._order
+
+    def get_indices(self, start=0, count=1):
+        """
+        Indices at positions start to start + count of the sequence of epochs
+
+        :param start: int, position of the first index, position p is in epoch p // epoch_size
+        :param count: int, number of indices
+        :return: np.array of int
+        """
+        positions = np.arange(start, start + count)
+        indices = np.empty(count, dtype=np.int64)
+        for epoch in np.unique(positions // self.epoch_size):
+            in_epoch = positions // self.epoch_size == epoch
+            indices[in_epoch] = self.get_epoch(int(epoch))[positions[in_epoch] % self.epoch_size]
+        return indices
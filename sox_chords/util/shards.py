@@ -0,0 +1,283 @@
+"""
+Export of generated batches into shards and a streaming reader of the shards
+
+export_shards writes the images and labels a ChordProcessor generates into shards of a fixed number of
+samples: shard-<n>-x.npy (uint8 images) and shard-<n>-y.npy (int64 labels), listed in index.json. Shard n is
+generated with its own seed derived from the export seed, so shards can be written in parallel and an
+interrupted export resumes with the missing shards. ShardReader memory-maps the shards and yields batches,
+shuffled across shards with a bounded buffer.
+"""
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os.path import join, exists
+
+import numpy as np
+import tqdm
+
+from sox_chords.exceptions import GeneratorException
+from sox_chords.util.logger import logger
+from sox_chords.util.utils import spawn_seed
+
+INDEX_FILE = "index.json"
+
+# processor of an export worker process
+_processor = None
+
+
+def _shard_files(shard):
+    return "shard-%05d-x.npy" % shard, "shard-%05d-y.npy" % shard
+
+
+def _save(path, data):
+    # write to a temporary file first, an interrupted export never leaves a partial shard
+    handle, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(handle, "wb") as handler:
+        np.save(handler, data)
+    os.replace(tmp, path)
+
+
+def _read_index(out_dir):
+    try:
+        with open(join(out_dir, INDEX_FILE)) as handler:
+            return json.load(handler)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write_index(out_dir, index):
+    handle, tmp = tempfile.mkstemp(dir=out_dir, suffix=".tmp")
+    with os.fdopen(handle, "w") as handler:
+        json.dump(index, handler, indent=1)
+    os.replace(tmp, join(out_dir, INDEX_FILE))
+
+
+def _init_worker(processor, seed, counter):
+    global _processor
+    with counter.get_lock():
+        worker = counter.value
+        counter.value += 1
+    _processor = processor
+    # shard n draws from spawn_seed(seed, n), the workers from their own streams next to them
+    _processor.prepare_worker(spawn_seed(seed, worker, 1))
+
+
+def _export_shard(job, processor=None):
+    shard, out_dir, shard_size, batch_size, seed, batch_kwargs = job
+    processor = processor or _processor
+    rng = np.random.default_rng(spawn_seed(seed, shard))
+
+    x, y = [], []
+    for start in range(0, shard_size, batch_size):
+        batch_x, batch_y = processor._make_batch(rng, batch_size=min(batch_size, shard_size - start),
+                                                 start=shard * shard_size + start, one_hot=False, **batch_kwargs)
+        x.append(batch_x)
+        y.append(batch_y)
+
+    x_file, y_file = _shard_files(shard)
+    _save(join(out_dir, x_file), np.concatenate(x))
+    _save(join(out_dir, y_file), np.concatenate(y))
+    return shard, {"x": x_file, "y": y_file, "size": shard_size}
+
+
+def export_shards(processor=None, out_dir="shards", n_shards=10, shard_size=1024, batch_size=64, jobs=1, seed=0,
+                  **batch_kwargs):
+    """
+    Generate n_shards shards of shard_size samples with ChordProcessor._make_batch, shards already in the index
+    of out_dir (with the same parameters) are kept
+
+    :param processor: ChordProcessor
+    :param out_dir: str, directory of the shards and the index, will be created if it does not exist
+    :param n_shards: int, number of shards
+    :param shard_size: int, number of samples per shard
+    :param batch_size: int, number of samples generated at once
+    :param jobs: int, number of processes writing shards, None for the number of cores, 1 writes in this process
+    :param seed: int, seed of the export, the samples of a shard only depend on it, the shard number and the
+                 segments in the mix pool
+    :param batch_kwargs: n_mixed_files, rand_chord_sample, rand_mix_sample, rand_chord and balanced of
+                         ChordProcessor.batch_iterator
+    :return: dict, the index
+    """
+    if not exists(out_dir):
+        os.makedirs(out_dir)
+    batch_kwargs.pop("one_hot", None)
+    params = {"classes": processor.get_classes(), "v_func": "%s.%s" % (processor.v_func.__module__,
+                                                                       processor.v_func.__name__),
+              "v_size": list(processor.v_size), "bw": processor.bw, "sr": processor.sr,
+              "frame_length": processor.frame_length, "shard_size": shard_size, "seed": seed,
+              "batch_kwargs": batch_kwargs}
+
+    index = _read_index(out_dir)
+    if index is None or index["params"] != params:
+        if index is not None:
+            logger.info("[*] parameters of the shards in %s changed, exporting them again" % out_dir)
+        index = {"params": params, "shards": {}}
+    done = set(int(shard) for shard, entry in index["shards"].items()
+               if exists(join(out_dir, entry["x"])) and exists(join(out_dir, entry["y"])))
+    index["shards"] = dict((str(shard), index["shards"][str(shard)]) for shard in done)
+    jobs_left = [(shard, out_dir, shard_size, batch_size, seed, batch_kwargs)
+                 for shard in range(n_shards) if shard not in done]
+    logger.debug("[*] exporting %d of %d shards" % (len(jobs_left), n_shards))
+
+    def collect(result):
+        shard, entry = result
+        index["shards"][str(shard)] = entry
+        # the index is written after every shard, an interrupted export resumes from it
+        _write_index(out_dir, index)
+
+    progress = tqdm.tqdm(total=len(jobs_left), unit="shards")
+    if jobs == 1:
+        for job in jobs_left:
+            collect(_export_shard(job, processor))
+            progress.update(1)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs or multiprocessing.cpu_count(), initializer=_init_worker,
+                                 initargs=(processor, seed, multiprocessing.Value("i", 0))) as executor:
+            for future in as_completed([executor.submit(_export_shard, job) for job in jobs_left]):
+                collect(future.result())
+                progress.update(1)
+    progress.close()
+
+    _write_index(out_dir, index)
+    return index
+
+
+class ShardReader(object):
+
+    def __init__(self, shard_dir="shards", batch_size=64, buffer_size=4096, shuffle=True, one_hot=True, epochs=1,
+                 drop_last=False, seed=None):
+        """
+        :param shard_dir: str, directory of the shards and their index, see export_shards
+        :param batch_size: int, number of samples per batch
+        :param buffer_size: int, number of samples in the shuffle buffer
+        :param shuffle: bool, shuffle the shards and the samples, otherwise in order of the shards
+        :param one_hot: bool, make y one hot
+        :param epochs: int, number of passes over the shards
+        :param drop_last: bool, leave out the last batch of an epoch if it has less than batch_size samples
+        :param seed: int, seed of the shuffling, see state_dict to continue an interrupted pass
+        """
+        index = _read_index(shard_dir)
+        if index is None:
+            raise GeneratorException("no shard index found in %s" % shard_dir)
+        self.shard_dir = shard_dir
+        self.params = index["params"]
+        self.batch_size = batch_size
+        self.buffer_size = max(buffer_size, batch_size)
+        self.shuffle = shuffle
+        self.one_hot = one_hot
+        self.epochs = epochs
+        self.drop_last = drop_last
+        self.rng = np.random.default_rng(seed)
+        # position of the current pass: epoch, batches yielded in it and the rng state at its start
+        self._epoch = self._batch = 0
+        self._epoch_rng = None
+        shards = sorted(index["shards"].items(), key=lambda item: int(item[0]))
+        self.shards = [(np.load(join(shard_dir, entry["x"]), mmap_mode="r"),
+                        np.load(join(shard_dir, entry["y"]), mmap_mode="r")) for _, entry in shards]
+
+    def __len__(self):
+        return sum(len(y) for _, y in self.shards)
+
+    @property
+    def num_classes(self):
+        return len(self.params["classes"])
+
+    def state_dict(self):
+        """
+        Position of the reader in its epochs, a reader of the same shards continues with the same batches after
+        load_state_dict
+
+        :return: dict
+        """
+        return {"epoch": self._epoch, "batch": self._batch,
+                "rng": self._epoch_rng if self._epoch_rng is not None else self.rng.bit_generator.state}
+
+    def load_state_dict(self, state):
+        """
+        Continue the batches of an interrupted pass, the next iteration starts with the batch after the last one
+        yielded
+
+        :param state: dict, see state_dict
+        :return: self
+        """
+        self._epoch, self._batch = state["epoch"], state["batch"]
+        self.rng.bit_generator.state = state["rng"]
+        self._epoch_rng = state["rng"]
+        return self
+
+    def _labels(self, y):
+        if self.one_hot:
+            return np.eye(self.num_classes, dtype=np.uint8)[y]
+        return np.asarray(y)
+
+    def _chunks(self):
+        # consecutive rows of the shards, read sequentially from the memory maps
+        order = self.rng.permutation(len(self.shards)) if self.shuffle else range(len(self.shards))
+        for shard in order:
+            x, y = self.shards[shard]
+            for start in range(0, len(y), self.batch_size):
+                yield x[start:start + self.batch_size], y[start:start + self.batch_size]
+
+    def _ordered(self):
+        x, y, count = [], [], 0
+        for chunk_x, chunk_y in self._chunks():
+            x.append(chunk_x)
+            y.append(chunk_y)
+            count += len(chunk_y)
+            if count >= self.batch_size:
+                x, y = np.concatenate(x), np.concatenate(y)
+                yield x[:self.batch_size], y[:self.batch_size]
+                x, y, count = [x[self.batch_size:]], [y[self.batch_size:]], count - self.batch_size
+        if count:
+            yield np.concatenate(x), np.concatenate(y)
+
+    def _shuffled(self):
+        chunks = self._chunks()
+        buffer_x = buffer_y = None
+        count, exhausted = 0, False
+        while True:
+            while count < self.buffer_size and not exhausted:
+                try:
+                    chunk_x, chunk_y = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if buffer_x is None:
+                    # a chunk has at most batch_size rows, the buffer never holds more than that in addition
+                    buffer_x = np.empty((self.buffer_size + self.batch_size,) + chunk_x.shape[1:], chunk_x.dtype)
+                    buffer_y = np.empty(self.buffer_size + self.batch_size, chunk_y.dtype)
+                buffer_x[count:count + len(chunk_y)] = chunk_x
+                buffer_y[count:count + len(chunk_y)] = chunk_y
+                count += len(chunk_y)
+            if count == 0:
+                return
+
+            size = min(self.batch_size, count)
+            picked = self.rng.choice(count, size, replace=False)
+            yield buffer_x[picked], buffer_y[picked]
+
+            # move the last samples of the buffer into the picked positions
+            tail = np.setdiff1d(np.arange(count - size, count), picked)
+            holes = picked[picked < count - size]
+            buffer_x[holes], buffer_y[holes] = buffer_x[tail], buffer_y[tail]
+            count -= size
+
+    def __iter__(self):
+        while self._epoch < self.epochs:
+            # an epoch is replayed from the rng state at its start, skipping the batches already yielded
+            if self._epoch_rng is None:
+                self._epoch_rng = self.rng.bit_generator.state
+            skip = self._batch
+            for x, y in (self._shuffled() if self.shuffle else self._ordered()):
+                if self.drop_last and len(y) < self.batch_size:
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                self._batch += 1
+                yield x, self._labels(y)
+            self._epoch, self._batch, self._epoch_rng = self._epoch + 1, 0, None
+        # a finished reader starts over on the next iteration
+        self._epoch = 0
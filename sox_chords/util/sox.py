@@ -1,11 +1,17 @@
-from subprocess import check_output
+from subprocess import check_output, Popen, PIPE
 from functools import reduce
 from abc import abstractmethod
+from weakref import WeakKeyDictionary
+import asyncio
+
+import numpy as np
 
 from sox_chords.music.base import Note
 from sox_chords.music.mapping import SemiCoreToneMapping
 from sox_chords.music.utils import get_core_from_diff, note_to_freq
 from sox_chords.util.logger import logger
+from sox_chords.values import Values
+from sox_chords.util.synth import SynthBackend, get_backend, register_backend, quantize, write_wav
 
 
 class SoxBuilder(object):
@@ -16,7 +22,6 @@ class SoxBuilder(object):
     def __init__(self, notes=None, delays=None):
         assert(isinstance(notes, list) and isinstance(
             delays, list)), "Notes or delays not a list"
-        assert (len(notes) != 0), "You must set some notes"
         assert(len(notes) == len(delays)
                ), "size of delays and notes list must be equal"
         self.notes = notes
@@ -64,10 +69,11 @@ class SoxBuilder(object):
         """
         Sets the output sampling rate
 
-        :param sampling_rate: sampling rate must be between 44100 and 48000 hz
+        :param sampling_rate: sampling rate must be between 8000 and 48000 hz, render directly at the rate the
+                              audio is consumed at to skip resampling, see synth.compare_sampling_rates
         :return: self
         """
-        assert(44100 <= sampling_rate <= 48000), "Sampling rate " + \
+        assert(Values.MIN_SAMPLING_RATE <= sampling_rate <= Values.MAX_SAMPLING_RATE), "Sampling rate " + \
             str(sampling_rate) + " is an invalid sampling rate"
         self.sampling_rate = sampling_rate
         return self
@@ -92,7 +98,14 @@ class SoxBuilder(object):
         self.output = output
         return self
 
-    def build(self):
+    def build(self, raw=False):
+        """
+        Build the sox command
+
+        :param raw: bool, write raw float32 samples to stdout instead of the output file
+        :return: list, arguments
+        """
+        assert (len(self.notes) != 0 or self.noise), "You must set some notes"
         args = []
         args.append("sox")
         args.append("--multi-threaded")
@@ -102,9 +115,14 @@ class SoxBuilder(object):
         args.append(str(self.channels))
         args.append("-r")
         args.append(str(self.sampling_rate))
-        args.append("-b")
-        args.append(str(self.bits))
-        args.append(self.output)
+        if raw:
+            args.append("-t")
+            args.append("f32")
+            args.append("-")
+        else:
+            args.append("-b")
+            args.append(str(self.bits))
+            args.append(self.output)
         args.append("synth")
         for note in self.notes:
             args.append("pl")
@@ -112,8 +130,9 @@ class SoxBuilder(object):
         if self.noise:
             args.append(self.noise)
 
-        args.append("delay")
-        args += list(map(lambda x: str(x), self.delays))
+        if self.delays:
+            args.append("delay")
+            args += list(map(lambda x: str(x), self.delays))
 
         if len(self.effects) > 0:
             args.append("remix")
@@ -144,14 +163,17 @@ class TpdfNoise(Noise):
 
 class Sox(object):
 
+    # asyncio.Semaphore limiting Sox.call_async, one per event loop
+    _semaphores = WeakKeyDictionary()
+
     @staticmethod
     def create_audio(output="", notes=None, sr=44100, fade=.1, dpn=.05, duration=2, channels=1, norm=-1, bits=8,
-                     freq_shift=0, noise=None):
+                     freq_shift=0, noise=None, backend=None, cache=None):
         """
         :param output: if output is not empty, file will be recorded to disk, else will be played
         :param notes: list of notes
         :param channels: number of audio channels
-        :param sr: sampling_rate must be for pluck instruments between 44100 and 48000
+        :param sr: sampling_rate must be for pluck instruments between 8000 and 48000
         :param dpn: delay per note
         :param duration: duration of the audio in seconds
         :param fade: delay of the fade 1 = no delay
@@ -159,7 +181,30 @@ class Sox(object):
         :param bits: bits per sample value
         :param freq_shift: frequency shift by Hz
         :param noise: instance of class noise
-        :return: true or false whether executed correctly
+        :param backend: SynthBackend or name of a synthesis backend ('sox', 'numpy'), None for Values.SYNTH_BACKEND
+        :param cache: RenderCache or None
+        :return: np.array float32 samples if rendered in-process, else None
+        """
+        return Sox.synthesize(Sox.get_builder(output=output, notes=notes, sr=sr, fade=fade, dpn=dpn, duration=duration,
+                                              channels=channels, norm=norm, bits=bits, freq_shift=freq_shift,
+                                              noise=noise), backend, cache)
+
+    @staticmethod
+    def render_audio(notes=None, sr=44100, fade=.1, dpn=.05, duration=2, channels=1, norm=-1, bits=8, freq_shift=0,
+                     noise=None, backend=None, cache=None):
+        """
+        Same as create_audio, but the audio is returned instead of written to disk
+
+        :return: np.array float32, shape (samples,) or (samples, channels) if more than 1 channel
+        """
+        return Sox.render(Sox.get_builder(notes=notes, sr=sr, fade=fade, dpn=dpn, duration=duration, channels=channels,
+                                          norm=norm, bits=bits, freq_shift=freq_shift, noise=noise), backend, cache)
+
+    @staticmethod
+    def get_builder(output="", notes=None, sr=44100, fade=.1, dpn=.05, duration=2, channels=1, norm=-1, bits=8,
+                    freq_shift=0, noise=None):
+        """
+        SoxBuilder for the parameters of create_audio
         """
         notes = list(map(lambda x: Sox.check_note(x), notes))
         if freq_shift != 0:
@@ -170,8 +215,40 @@ class Sox(object):
             delays.append(dpn * delay)
 
         norm = [norm]
-        return Sox.call(SoxBuilder(notes, delays).set_sampling_rate(sr).set_channels(channels).set_output(output).
-                        set_bits(bits).set_noise(noise).add_effect("fade", fade).add_effect("norm", norm).build())
+        return SoxBuilder(notes, delays).set_sampling_rate(sr).set_channels(channels).set_output(output).\
+            set_bits(bits).set_noise(noise).add_effect("fade", fade).add_effect("norm", norm)
+
+    @staticmethod
+    def synthesize(builder=None, backend=None, cache=None):
+        """
+        Create the audio described by a SoxBuilder with a synthesis backend
+
+        :param builder: SoxBuilder
+        :param backend: SynthBackend or name of a synthesis backend, None for Values.SYNTH_BACKEND
+        :param cache: RenderCache, renders are looked up in / added to the cache and written to builder.output
+        :return: np.array float32 samples if rendered in-process or cached, else None
+        """
+        if cache is None:
+            return get_backend(backend).synthesize(builder)
+
+        y = cache.render(builder, get_backend(backend))
+        if builder.output:
+            write_wav(builder.output, y, builder.sampling_rate, builder.bits)
+        return y
+
+    @staticmethod
+    def render(builder=None, backend=None, cache=None):
+        """
+        Render the audio described by a SoxBuilder into memory, builder.output is ignored
+
+        :param builder: SoxBuilder
+        :param backend: SynthBackend or name of a synthesis backend, None for Values.SYNTH_BACKEND
+        :param cache: RenderCache or None
+        :return: np.array float32, shape (samples,) or (samples, channels) if more than 1 channel
+        """
+        if cache is None:
+            return get_backend(backend).render(builder)
+        return cache.render(builder, get_backend(backend))
 
     @staticmethod
     def check_note(note=None):
@@ -196,11 +273,13 @@ class Sox(object):
 
     @staticmethod
     def reduce_sampling_rate(in_file="", out_file="", rate=44100):
-        Sox.call(["sox", in_file, "-r", str(rate), " ", out_file])
+        from sox_chords.util.convert import SoxPipeline
+        SoxPipeline().rate(rate).convert(in_file, out_file)
 
     @staticmethod
     def reduce_bits(in_file="", out_file="", bits=8):
-        Sox.call(["sox", in_file, "-b", str(bits), " ", out_file])
+        from sox_chords.util.convert import SoxPipeline
+        SoxPipeline().bits(bits).convert(in_file, out_file)
 
     @staticmethod
     def call(args):
@@ -214,11 +293,161 @@ class Sox(object):
             raise SoxException(
                 "Could not find sox, please install sox. sudo apt-get install sox")
 
+    @staticmethod
+    def call_pipe(args):
+        """
+        Call sox and return what it writes to stdout
+
+        :param args: list, arguments
+        :return: bytes, stdout of sox
+        """
+        try:
+            logger.debug("[*] calling sox with: %s" %
+                         reduce(lambda x, y: str(x) + " " + str(y), args))
+            process = Popen(args, stdout=PIPE, stderr=PIPE)
+            output, error = process.communicate()
+        except OSError as e:
+            raise SoxException(
+                "Could not find sox, please install sox. sudo apt-get install sox")
+        if process.returncode != 0:
+            raise SoxException("Sox command " + reduce(lambda x, y: x + " " + y, args) + " failed with error: " +
+                               error.decode(errors="replace"))
+        return output
+
+    @staticmethod
+    async def call_async(args, timeout=None):
+        """
+        Call sox from an asyncio event loop, at most Values.MAX_PARALLEL_SOX calls run at the same time.
+        The sox process is killed if the call times out or the awaiting task is cancelled.
+
+        :param args: list, arguments
+        :param timeout: float, seconds until the call is aborted or None
+        :return: bytes, stdout of sox
+        """
+        loop = asyncio.get_running_loop()
+        if loop not in Sox._semaphores:
+            Sox._semaphores[loop] = asyncio.Semaphore(Values.MAX_PARALLEL_SOX)
+
+        async with Sox._semaphores[loop]:
+            logger.debug("[*] calling sox with: %s" %
+                         reduce(lambda x, y: str(x) + " " + str(y), args))
+            try:
+                process = await asyncio.create_subprocess_exec(*args, stdout=PIPE, stderr=PIPE)
+            except OSError as e:
+                raise SoxException(
+                    "Could not find sox, please install sox. sudo apt-get install sox")
+
+            try:
+                output, error = await asyncio.wait_for(process.communicate(), timeout)
+            except asyncio.TimeoutError:
+                await Sox._kill(process)
+                raise SoxException("Sox command " + reduce(lambda x, y: x + " " + y, args) +
+                                   " timed out after %s seconds" % timeout)
+            except asyncio.CancelledError:
+                await Sox._kill(process)
+                raise
+
+        if process.returncode != 0:
+            raise SoxException("Sox command " + reduce(lambda x, y: x + " " + y, args) + " failed with error: " +
+                               error.decode(errors="replace"))
+        return output
+
+    @staticmethod
+    async def _kill(process):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+    @staticmethod
+    async def synthesize_async(builder=None, backend=None, timeout=None):
+        """
+        Async version of Sox.synthesize, in-process backends run in the default executor of the event loop
+
+        :param builder: SoxBuilder
+        :param backend: SynthBackend or name of a synthesis backend, None for Values.SYNTH_BACKEND
+        :param timeout: float, seconds until a sox call is aborted or None
+        :return: np.array float32 samples if rendered in-process, else None
+        """
+        backend = get_backend(backend)
+        if isinstance(backend, SoxBackend):
+            await Sox.call_async(builder.build(), timeout)
+            return None
+        return await asyncio.get_running_loop().run_in_executor(None, backend.synthesize, builder)
+
+    @staticmethod
+    async def render_async(builder=None, backend=None, timeout=None):
+        """
+        Async version of Sox.render
+
+        :return: np.array float32, shape (samples,) or (samples, channels) if more than 1 channel
+        """
+        backend = get_backend(backend)
+        if isinstance(backend, SoxBackend):
+            return backend.to_samples(await Sox.call_async(builder.build(raw=True), timeout), builder)
+        return await asyncio.get_running_loop().run_in_executor(None, backend.render, builder)
+
+    @staticmethod
+    async def create_audio_async(output="", notes=None, sr=44100, fade=.1, dpn=.05, duration=2, channels=1, norm=-1,
+                                 bits=8, freq_shift=0, noise=None, backend=None, timeout=None):
+        """
+        Async version of create_audio
+
+        :param timeout: float, seconds until the sox call is aborted or None
+        """
+        return await Sox.synthesize_async(Sox.get_builder(output=output, notes=notes, sr=sr, fade=fade, dpn=dpn,
+                                                          duration=duration, channels=channels, norm=norm, bits=bits,
+                                                          freq_shift=freq_shift, noise=noise), backend, timeout)
+
+    @staticmethod
+    async def render_audio_async(notes=None, sr=44100, fade=.1, dpn=.05, duration=2, channels=1, norm=-1, bits=8,
+                                 freq_shift=0, noise=None, backend=None, timeout=None):
+        """
+        Async version of render_audio
+
+        :param timeout: float, seconds until the sox call is aborted or None
+        """
+        return await Sox.render_async(Sox.get_builder(notes=notes, sr=sr, fade=fade, dpn=dpn, duration=duration,
+                                                      channels=channels, norm=norm, bits=bits, freq_shift=freq_shift,
+                                                      noise=noise), backend, timeout)
+
 
 class SoxException(Exception):
     pass
 
 
+class SoxBackend(SynthBackend):
+    """
+        Reference backend, runs the command of SoxBuilder.build
+    """
+    name = "sox"
+
+    def synthesize(self, builder):
+        return Sox.call(builder.build())
+
+    def render(self, builder):
+        return self.to_samples(Sox.call_pipe(builder.build(raw=True)), builder)
+
+    @staticmethod
+    def to_samples(data, builder):
+        """
+        :param data: bytes, raw float32 output of builder.build(raw=True)
+        :param builder: SoxBuilder
+        :return: np.array float32 samples
+        """
+        y = np.frombuffer(data, dtype=np.float32)
+        if builder.channels > 1:
+            y = y.reshape(-1, builder.channels)
+        return quantize(y, builder.bits)
+
+
+register_backend(SoxBackend())
+
+# registers the 'bank' backend
+from sox_chords.util.bank import NoteBank
+
+
 if __name__ == "__main__":
     from sox_chords.music.chords.triad import MajorTriad
     from sox_chords.music.utils import get_note
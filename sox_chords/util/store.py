@@ -0,0 +1,193 @@
+"""
+Memory-mapped store of precomputed chord images
+
+Without mixing, the image of a chord frame is the same in every epoch. The FeatureStore computes the image of
+every frame of every chord variant once into a .npy block, which is read memory-mapped afterwards, and an
+index.json with the label, source, frame offset and variant of every image. The index also records the
+parameters the images depend on (v_func, v_size, bw, sr, frame_length, harmonic and the render parameters of
+the sources): a store built with other parameters or from other sources is rebuilt.
+"""
+import json
+import os
+from os.path import join, exists
+
+import numpy as np
+import tqdm
+from numpy.lib.format import open_memmap
+
+from sox_chords.util.logger import logger
+from sox_chords.util.visualize import get_visual_batch
+from sox_chords.values import Values
+
+
+class FeatureStore(object):
+
+    features_file = "features.npy"
+    index_file = "index.json"
+
+    def __init__(self, store_dir="features", v_func=None, v_size=(25.6, 25.6), bw=True, sr=44100,
+                 frame_length=1.0, harmonic=False, render_params=None):
+        """
+        :param store_dir: str, directory of the store, will be created if it does not exist
+        :param v_func: function, visualization function in core.util.visualize
+        :param v_size: (width, height), size of the visualized audio image in inches (pixels / dpi)
+        :param bw: bool, gray scale images
+        :param sr: int, sampling rate of the frames
+        :param frame_length: float, length of each frame in seconds
+        :param harmonic: bool, the frames are the harmonic component of the sources
+        :param render_params: dict, json serializable parameters the audio of the sources was rendered with
+                              (e.g. backend, bits, noises and shift_range), None if they are not known
+        """
+        self.store_dir = store_dir
+        self.v_func = v_func
+        self.v_size = v_size
+        self.bw = bw
+        self.sr = sr
+        self.frame_length = frame_length
+        self.params = {"v_func": "%s.%s" % (v_func.__module__, v_func.__name__), "v_size": list(v_size),
+                       "bw": bw, "sr": sr, "frame_length": frame_length, "harmonic": harmonic,
+                       "render": render_params}
+        self.entries = []
+        self.features = None
+        if not exists(store_dir):
+            os.makedirs(store_dir)
+
+    def __getstate__(self):
+        # the memory map is opened again instead of copying the images
+        state = self.__dict__.copy()
+        state["features"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.entries:
+            self.features = np.load(self.features_path, mmap_mode="r")
+
+    @property
+    def features_path(self):
+        return join(self.store_dir, self.features_file)
+
+    @property
+    def index_path(self):
+        return join(self.store_dir, self.index_file)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def labels(self):
+        """ np.array, label of every image """
+        return np.array([entry["label"] for entry in self.entries], dtype=Values.D_TYPE_LABEL)
+
+    def _read_index(self):
+        try:
+            with open(self.index_path) as handler:
+                return json.load(handler)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _get_entries(self, sources):
+        num_samples = int(self.frame_length * self.sr)
+        entries = []
+        for label, fg, variant in sources:
+            for offset in range(0, len(fg.y) - num_samples + 1, num_samples):
+                entries.append({"label": int(label), "source": str(fg.input_file), "offset": offset,
+                                "variant": variant})
+        return entries
+
+    def is_valid(self, entries=None):
+        """
+        :param entries: list, expected index entries or None to only check the parameters
+        :return: bool, the store on disk was built with the parameters of this store (and these entries)
+        """
+        index = self._read_index()
+        if index is None or index["params"] != self.params or not exists(self.features_path):
+            return False
+        return entries is None or index["entries"] == entries
+
+    def open(self):
+        """
+        Open the images memory-mapped and read the index
+
+        :return: self
+        """
+        index = self._read_index()
+        self.entries = index["entries"]
+        self.features = np.load(self.features_path, mmap_mode="r")
+        return self
+
+    def build(self, sources=None, batch_size=64, force=False):
+        """
+        Compute the images of every frame of the sources, if the store on disk is outdated
+
+        :param sources: list of (label, AudioFrameGenerator, variant params), e.g. Variant.params or None
+        :param batch_size: int, number of frames visualized at once
+        :param force: bool, rebuild even if the store is up to date
+        :return: self
+        """
+        entries = self._get_entries(sources)
+        if not force and self.is_valid(entries):
+            logger.debug("[*] feature store %s is up to date" % self.store_dir)
+            return self.open()
+        if not entries:
+            raise ValueError("no frames of %.2f seconds in the sources" % self.frame_length)
+
+        # the index is written last, a store interrupted while building is not valid
+        if exists(self.index_path):
+            os.remove(self.index_path)
+        self.features = None
+
+        num_samples = int(self.frame_length * self.sr)
+        fgs = [fg for _, fg, _ in sources for _ in range(0, len(fg.y) - num_samples + 1, num_samples)]
+        features = None
+        for start in tqdm.trange(0, len(entries), batch_size, unit="batches"):
+            frames = np.stack([fgs[i].y[entries[i]["offset"]:entries[i]["offset"] + num_samples]
+                               for i in range(start, min(start + batch_size, len(entries)))])
+            x = np.array(get_visual_batch(frames, self.sr, self.v_size, self.v_func, self.bw),
+                         dtype=Values.D_TYPE_IMG)
+            if features is None:
+                features = open_memmap(self.features_path, mode="w+", dtype=Values.D_TYPE_IMG,
+                                       shape=(len(entries),) + x.shape[1:])
+            features[start:start + len(x)] = x
+        features.flush()
+        del features
+
+        with open(self.index_path, "w") as handler:
+            json.dump({"params": self.params, "entries": entries}, handler)
+        logger.debug("[*] stored %d images in %s" % (len(entries), self.store_dir))
+        return self.open()
+
+    def batch_iterator(self, batch_size=64, n_batches=5000, one_hot=True, num_classes=None, shuffle=True, rng=None,
+                       start=0):
+        """
+        Batches of stored images. In order, the images of a batch are a view of the memory-mapped block
+        (unless the batch wraps around), shuffled batches gather their rows from it.
+
+        :param batch_size: int, number of images per batch
+        :param n_batches: int, number of batches
+        :param one_hot: bool, make y one hot
+        :param num_classes: int, number of classes of the one hot labels, None for the highest label + 1
+        :param shuffle: bool, random images, otherwise in order of the index
+        :param rng: np.random.Generator of the random images, None for a new unseeded one
+        :param start: int, row of the first image in order
+        :return: x,y
+        """
+        labels = self.labels
+        num_classes = num_classes or int(labels.max()) + 1
+        y_all = np.eye(num_classes, dtype=Values.D_TYPE_IMG)[labels] if one_hot else labels
+
+        rng = rng or np.random.default_rng()
+        start = start % len(self)
+        for _ in range(n_batches):
+            if shuffle:
+                rows = rng.integers(len(self), size=batch_size)
+                yield self.features[rows], y_all[rows]
+                continue
+
+            stop = start + batch_size
+            if stop <= len(self):
+                yield self.features[start:stop], y_all[start:stop]
+            else:
+                rows = np.arange(start, stop) % len(self)
+                yield self.features[rows], y_all[rows]
+            start = stop % len(self)
@@ -0,0 +1,384 @@
+"""
+Synthesis backends for Sox.create_audio
+
+A backend turns a SoxBuilder description (notes, delays, effects, bits, ...) into audio.
+The 'sox' backend (see sox_chords.util.sox) calls the sox binary and is the reference, the 'numpy'
+backend below re-implements the sox 'synth pl' (pluck) instrument with NumPy and works in-process.
+"""
+import copy
+import wave
+from abc import abstractmethod
+
+import numpy as np
+
+from sox_chords.music.base import Note
+from sox_chords.music.utils import note_name_to_freq
+from sox_chords.values import Values
+
+# decay time (seconds to -60 dB) of a plucked string is PLUCK_DECAY / freq, clipped to the given range
+PLUCK_DECAY = 1200.
+PLUCK_DECAY_RANGE = (.5, 6.)
+# sampling rate the pluck filters are tuned for, other rates are rendered with the same timbre
+PLUCK_REFERENCE_SR = 44100
+
+
+def pluck(freq=440.0, num_samples=44100, sr=44100, rng=None):
+    """
+    Karplus-Strong plucked string, the algorithm behind the sox 'pl' synth type
+
+    A burst of noise is fed through a delay line of one period which is averaged (low passed) and damped
+    on every pass. The delay line is advanced one period at a time so every step is a vectorized NumPy op.
+    The delay line needs a period of at least 2.5 samples, higher notes are plucked at a multiple of sr and
+    resampled, which drops their partials above the Nyquist frequency. Notes at or above the Nyquist frequency
+    are silent.
+
+    :param freq: float, frequency in Hz
+    :param num_samples: int, number of samples to generate
+    :param sr: int, sampling rate
+    :param rng: np.random.RandomState used for the excitation noise or None
+    :return: np.array float32, samples between -1 and 1
+    """
+    period = float(sr) / freq
+    if period <= 2.:
+        return np.zeros(num_samples, dtype=np.float32)
+    if period < 2.5:
+        factor = int(np.ceil(2.5 / period))
+        return resample(pluck(freq, num_samples * factor, sr * factor, rng), sr * factor, sr)
+    rng = rng if rng is not None else np.random
+
+    # the loop and excitation filters are sample based, their low pass weight b keeps the damping in Hz
+    # (and therefore the timbre) the same at every sampling rate, b = 1 at PLUCK_REFERENCE_SR
+    b = (float(sr) / PLUCK_REFERENCE_SR) ** 2
+    # the averaging filter delays by b / 2 samples, the remaining fraction is done by linear interpolation
+    n = int(period - b / 2.)
+    frac = period - b / 2. - n
+    w0, w1, w2 = (1. - b / 2.) * (1. - frac), (1. - b / 2.) * frac + b / 2. * (1. - frac), b / 2. * frac
+    t60 = min(max(PLUCK_DECAY / freq, PLUCK_DECAY_RANGE[0]), PLUCK_DECAY_RANGE[1])
+    gain = 10. ** (-3. / (t60 * freq))
+
+    y = np.zeros(max(num_samples, n + 2), dtype=np.float64)
+    # low passed noise burst, gives the fundamental more weight than the upper harmonics
+    excitation = rng.uniform(-1., 1., n + 2)
+    excitation = b / 4. * (np.roll(excitation, 1) + np.roll(excitation, -1)) + (1. - b / 2.) * excitation
+    excitation -= excitation.mean()
+    y[:n + 2] = excitation / max(np.abs(excitation).max(), 1e-9)
+
+    for start in range(n + 2, len(y), n):
+        end = min(start + n, len(y))
+        y[start:end] = gain * (w0 * y[start - n:end - n] + w1 * y[start - n - 1:end - n - 1] +
+                               w2 * y[start - n - 2:end - n - 2])
+
+    return y[:num_samples].astype(np.float32)
+
+
+def noise(name="whitenoise", num_samples=44100, rng=None):
+    """
+    Noise synth types of sox
+
+    :param name: str, whitenoise, tpdfnoise or brownnoise
+    :param num_samples: int, number of samples to generate
+    :param rng: np.random.RandomState or None
+    :return: np.array float32, samples between -1 and 1
+    """
+    rng = rng if rng is not None else np.random
+    if name == "whitenoise":
+        y = rng.uniform(-1., 1., num_samples)
+    elif name == "tpdfnoise":
+        y = (rng.uniform(-1., 1., num_samples) + rng.uniform(-1., 1., num_samples)) / 2.
+    elif name == "brownnoise":
+        # random walk with small steps, reflected at -1 and 1
+        y = np.cumsum(rng.uniform(-1., 1., num_samples) / 16.) + 1.
+        y = np.abs(np.mod(y, 4.) - 2.) - 1.
+    else:
+        raise ValueError("Noise %s is not supported" % name)
+    return y.astype(np.float32)
+
+
+def fade(y=None, sr=44100, fade_in=0., stop=None, fade_out=0.):
+    """
+    Logarithmic fade like the sox fade effect with its default fade type, truncates y at stop
+
+    :param y: np.array, samples
+    :param sr: int, sampling rate
+    :param fade_in: float, fade in length in seconds
+    :param stop: float, stop position in seconds or None for the end of y
+    :param fade_out: float, fade out length in seconds, ending at stop
+    :return: np.array, faded samples
+    """
+    if stop is not None:
+        y = y[:int(round(stop * sr))]
+    y = y.copy()
+    n_in = min(int(round(fade_in * sr)), len(y))
+    n_out = min(int(round(fade_out * sr)), len(y))
+    if n_in > 0:
+        y[:n_in] *= np.power(.1, (1. - np.arange(n_in) / float(n_in)) * 5.)
+    if n_out > 0:
+        y[len(y) - n_out:] *= np.power(.1, (1. - np.arange(n_out, 0, -1) / float(n_out)) * 5.)
+    return y
+
+
+def norm(y=None, db=-1.):
+    """
+    Normalize the peak of y to db dBFS like the sox norm effect
+
+    :param y: np.array, samples
+    :param db: float, peak level in dB
+    :return: np.array, normalized samples
+    """
+    peak = np.abs(y).max() if len(y) > 0 else 0.
+    if peak == 0:
+        return y
+    return y * (10. ** (db / 20.) / peak)
+
+
+def quantize(y=None, bits=16):
+    """
+    Quantize samples to the resolution of a given bit depth
+
+    :param y: np.array, samples between -1 and 1
+    :param bits: int, bits per sample
+    :return: np.array float32, quantized samples
+    """
+    if bits >= 24:
+        return np.clip(y, -1., 1.).astype(np.float32)
+    scale = float(2 ** (bits - 1))
+    return (np.clip(np.round(y * scale), -scale, scale - 1) / scale).astype(np.float32)
+
+
+def write_wav(path="", y=None, sr=44100, bits=16):
+    """
+    Write PCM samples to a wav file without any external dependency
+
+    :param path: str, output file
+    :param y: np.array, samples between -1 and 1, shape (samples,) or (samples, channels)
+    :param sr: int, sampling rate
+    :param bits: int, bits per sample, stored in the next full byte
+    :return: path
+    """
+    y = np.asarray(y)
+    handler = open_wav(path, sr, bits, 1 if y.ndim == 1 else y.shape[1])
+    try:
+        handler.writeframes(to_pcm(y, bits))
+    finally:
+        handler.close()
+    return path
+
+
+def open_wav(path="", sr=44100, bits=16, channels=1):
+    """
+    Open a wav file for writing frames of to_pcm incrementally
+
+    :return: wave.Wave_write
+    """
+    handler = wave.open(path, "wb")
+    handler.setnchannels(channels)
+    handler.setsampwidth((bits + 7) // 8)
+    handler.setframerate(sr)
+    return handler
+
+
+def to_pcm(y=None, bits=16):
+    """
+    Encode samples as little endian PCM, stored in the next full byte of the bit depth
+
+    :param y: np.array, samples between -1 and 1, shape (samples,) or (samples, channels)
+    :param bits: int, bits per sample
+    :return: bytes
+    """
+    width = (bits + 7) // 8
+    scale = float(2 ** (8 * width - 1))
+    pcm = np.clip(np.round(quantize(np.asarray(y), bits).reshape(-1) * scale), -scale, scale - 1).astype(np.int64)
+
+    if width == 1:
+        return (pcm + 128).astype(np.uint8).tobytes()
+    elif width == 3:
+        return pcm.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    return pcm.astype("<i%d" % width).tobytes()
+
+
+class SynthBackend(object):
+    """
+        Base class of synthesis backends, turns a SoxBuilder into audio
+    """
+    name = ""
+
+    @abstractmethod
+    def synthesize(self, builder):
+        """
+        Create the audio described by the builder and write it to builder.output
+
+        :param builder: SoxBuilder
+        :return: np.array float32 samples if the backend renders in-process, else None
+        """
+        pass
+
+    @abstractmethod
+    def render(self, builder):
+        """
+        Render the audio described by the builder into memory, builder.output is ignored
+
+        :param builder: SoxBuilder
+        :return: np.array float32, shape (samples,) or (samples, channels) if more than 1 channel
+        """
+        pass
+
+    def cache_key(self):
+        """
+        :return: str, identifies the audio of the backend in a RenderCache, backends rendering the same builder
+                 differently must have different keys
+        """
+        return self.name
+
+
+class NumpyBackend(SynthBackend):
+    """
+        In-process pluck synthesizer following the semantics of SoxBuilder.build
+    """
+    name = "numpy"
+
+    def __init__(self, seed=None):
+        """
+        :param seed: int, seed of the excitation noise, None for a new random pluck on every render like sox
+        """
+        self.seed = seed
+
+    def cache_key(self):
+        return self.name if self.seed is None else "%s-%s" % (self.name, self.seed)
+
+    @staticmethod
+    def get_frequency(note):
+        if isinstance(note, Note):
+            return note_name_to_freq(note)
+        return float(note)
+
+    def render(self, builder):
+        rng = np.random.RandomState(self.seed)
+        sr = builder.sampling_rate
+        effects = dict((name, params) for name, params in builder.effects)
+
+        stop = effects["fade"][1] if "fade" in effects else None
+        max_delay = max(builder.delays or [0])
+        num_samples = int(round(stop * sr)) if stop is not None else int(round((max_delay + 1.) * sr))
+
+        # every note (and the noise) is a channel of its own, remix mixes them down with 1 / n
+        y = np.zeros(num_samples, dtype=np.float64)
+        for note, delay in zip(builder.notes, builder.delays):
+            offset = int(round(delay * sr))
+            if offset < num_samples:
+                y[offset:] += pluck(self.get_frequency(note), num_samples - offset, sr, rng)
+        channels = len(builder.notes)
+        if builder.noise:
+            y += noise(builder.noise, num_samples, rng)
+            channels += 1
+        y /= channels
+
+        if "fade" in effects:
+            fade_in, stop, fade_out = effects["fade"]
+            y = fade(y, sr, fade_in=fade_in, stop=stop, fade_out=fade_out)
+        if "norm" in effects:
+            y = norm(y, effects["norm"][0])
+
+        y = quantize(y, builder.bits)
+        if builder.channels > 1:
+            y = np.tile(y[:, np.newaxis], (1, builder.channels))
+        return y
+
+    def synthesize(self, builder):
+        y = self.render(builder)
+        if builder.output:
+            write_wav(builder.output, y, builder.sampling_rate, builder.bits)
+        return y
+
+
+backends = {}
+
+
+def register_backend(backend):
+    """
+    Register a synthesis backend so that it can be selected by name
+
+    :param backend: SynthBackend
+    :return: backend
+    """
+    assert (isinstance(backend, SynthBackend)), "backend is not of instance SynthBackend"
+    backends[backend.name] = backend
+    return backend
+
+
+def get_backend(backend=None):
+    """
+    Resolve a synthesis backend
+
+    :param backend: SynthBackend, name of a registered backend or None for Values.SYNTH_BACKEND
+    :return: SynthBackend
+    """
+    if isinstance(backend, SynthBackend):
+        return backend
+    name = backend or Values.SYNTH_BACKEND
+    assert (name in backends), "Synthesis backend %s is not registered, choose one of %s" % (name, sorted(backends))
+    return backends[name]
+
+
+def resample(y=None, sr=44100, target_sr=22050):
+    """
+    Band limited resampling by truncating (or zero padding) the spectrum
+
+    :param y: np.array, samples of shape (samples,)
+    :param sr: int, sampling rate of y
+    :param target_sr: int, sampling rate of the result
+    :return: np.array float32
+    """
+    num_samples = int(round(len(y) * float(target_sr) / sr))
+    if num_samples == len(y):
+        return np.asarray(y, dtype=np.float32)
+    spectrum = np.fft.rfft(y)[:num_samples // 2 + 1]
+    return (np.fft.irfft(spectrum, num_samples) * (float(num_samples) / len(y))).astype(np.float32)
+
+
+def band_levels(y=None, sr=44100, num_bands=24, f_min=50.):
+    """
+    Energy of y in logarithmically spaced frequency bands between f_min and 0.45 * sr in dB
+
+    :return: np.array, shape (num_bands,)
+    """
+    power = np.abs(np.fft.rfft(y)) ** 2
+    freqs = np.fft.rfftfreq(len(y), 1. / sr)
+    edges = np.geomspace(f_min, .45 * sr, num_bands + 1)
+    bands = np.array([power[(freqs >= lo) & (freqs < hi)].sum() for lo, hi in zip(edges[:-1], edges[1:])])
+    return 10. * np.log10(bands / max(power.sum(), 1e-20) + 1e-12)
+
+
+def compare_sampling_rates(builder=None, backend=None, reference_sr=44100, num_bands=8, repeats=4):
+    """
+    Quality check of a render at a training sampling rate (e.g. 22050 or 16000) against the reference render
+
+    The builder is rendered at its own sampling rate and at reference_sr, the reference is resampled to the
+    sampling rate of the builder and both are compared by their energy in logarithmic frequency bands up to
+    0.45 * builder.sampling_rate. The pluck excitation is random, so the band levels are averaged over a few
+    renders instead of comparing samples. With the numpy backend the deviation of triads rendered at 16k and
+    above is about 1-2 dB, which is also the deviation between two sets of renders at 44.1k. At 8k the
+    upper harmonics of notes above C5 are damped too much (3-9 dB), render those at reference_sr instead.
+
+    :param builder: SoxBuilder, rendered at builder.sampling_rate
+    :param backend: SynthBackend or name of the synthesis backend, None for Values.SYNTH_BACKEND
+    :param reference_sr: int, sampling rate of the reference render
+    :param num_bands: int, number of frequency bands
+    :param repeats: int, number of renders the band levels are averaged over
+    :return: float, mean absolute deviation of the band levels in dB
+    """
+    backend = get_backend(backend)
+    sr = builder.sampling_rate
+    reference_builder = copy.copy(builder).set_sampling_rate(reference_sr)
+
+    def levels(b):
+        levels = []
+        for _ in range(repeats):
+            y = backend.render(b)
+            y = resample(y[:, 0] if y.ndim > 1 else y, b.sampling_rate, sr)
+            levels.append(band_levels(y, sr, num_bands))
+        return np.mean(levels, axis=0)
+
+    return float(np.abs(levels(builder) - levels(reference_builder)).mean())
+
+
+register_backend(NumpyBackend())
@@ -1,24 +1,48 @@
+from os import listdir
+from os.path import join
 from threading import Thread
 import multiprocessing
+import numpy as np
 import tqdm
 
 
 class ThreadWithReturnValue(Thread):
     def __init__(self, group=None, target=None, name=None,
-                 args=(), kwargs={}, Verbose=None):
-        Thread.__init__(self, group, target, name, args, kwargs, Verbose)
+                 args=(), kwargs=None):
+        Thread.__init__(self, group, target, name, args, kwargs)
         self._return = None
 
     def run(self):
-        if self._Thread__target is not None:
-            self._return = self._Thread__target(*self._Thread__args,
-                                                **self._Thread__kwargs)
+        if self._target is not None:
+            self._return = self._target(*self._args, **self._kwargs)
 
     def join(self):
         Thread.join(self)
         return self._return
 
 
+def get_files_with_extension(directory="", extension=".wav"):
+    """
+    :param directory: str, directory
+    :param extension: str, extension of the files
+    :return: list, sorted paths of the files in directory ending with extension
+    """
+    return sorted(join(directory, name) for name in listdir(directory) if name.endswith(extension))
+
+
+def spawn_seed(seed=None, *key):
+    """
+    Seed of an independent random stream derived from seed, the same seed and key always give the same stream
+
+    :param seed: int or np.random.SeedSequence, None for a random seed
+    :param key: int, position of the stream below seed (e.g. worker, shard or epoch number)
+    :return: np.random.SeedSequence
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return np.random.SeedSequence(seed.entropy, spawn_key=tuple(seed.spawn_key) + key)
+
+
 def parallize_v2(f, args):
     threads = multiprocessing.cpu_count()
     return parallize(f, args, threads=threads)
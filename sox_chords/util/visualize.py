@@ -14,7 +14,8 @@ import numpy as np
 import librosa.display as display
 
 from sox_chords.exceptions import VisualizerException
-from sox_chords.util.image import fig2data, plt
+from sox_chords.util import features
+from sox_chords.util.image import fig2data, figure_pool, plt, Figure, FigureCanvasAgg
 
 
 class Actions(object):
@@ -25,10 +26,18 @@ fig_size = (7, 5)
 dpi = 10
 
 
-def chromagram(y=None, sr=22050, title="", bw=False, hide_axes=False):
+def _decorate(img=None, title="", format=None):
+    # title and colorbar of the axes of the image, without the pyplot state machine
+    ax = img.axes
+    ax.set_title(title)
+    ax.figure.colorbar(img, ax=ax, format=format)
+    ax.figure.tight_layout()
+
+
+def chromagram(y=None, sr=22050, title="", bw=False, hide_axes=False, ax=None):
     """
     Visualizable function \n
-    Create a chromagram using librosa.feature.chroma_cqt
+    Create a chromagram from a pseudo constant-Q transform (see features.chroma)
 
         :param y: list, input data
         :param sr: int, sampling rate
@@ -36,31 +45,54 @@ def chromagram(y=None, sr=22050, title="", bw=False, hide_axes=False):
         :param subplot: subplot array [y,x,id] or null if no subplot should be used
         :param bw: bool, black and white coloured
         :param hide_axes: bool, hide title and axes
-        :param crop: cropping box = (x_start, y_start, width, height)
+        :param ax: matplotlib Axes to draw into, None for the current pyplot axes
         :return: null
     """
 
-    y_harmonic, y_percussive = librosa.effects.hpss(y)
-    # We'll use a CQT-based chromagram here.  An STFT-based implementation also exists in chroma_cqt()
-    # We'll use the harmonic component to avoid pollution from transients
-    c = librosa.feature.chroma_cqt(y=y_harmonic, sr=sr)
+    # CQT-based chromagram of the harmonic component to avoid pollution from transients, see features.chroma
+    c = features.chroma(y, sr)
 
     # Display the chromagram: the energy in each chromatic pitch class as a function of time
     # To make sure that the colors span the full range of chroma values, set vmin and vmax
     if bw:
-        librosa.display.specshow(
-            c, sr=sr, x_axis='time', cmap='gray_r', y_axis='chroma', vmin=0, vmax=1)
+        img = librosa.display.specshow(
+            c, sr=sr, x_axis='time', cmap='gray_r', y_axis='chroma', vmin=0, vmax=1, ax=ax)
+    else:
+        img = librosa.display.specshow(
+            c, sr=sr, x_axis='time', y_axis='chroma', vmin=0, vmax=1, ax=ax)
+
+    if not hide_axes:
+        _decorate(img, title)
+
+
+def fast_chromagram(y=None, sr=22050, title="", bw=False, hide_axes=False, ax=None):
+    """
+    Visualizable function \n
+    Create a chromagram by folding the power spectrogram into 12 pitch classes, without separating the
+    harmonic component (see features.chroma with mode 'stft')
+
+        :param y: list, input data
+        :param sr: int, sampling rate
+        :param title: str, title of the plot
+        :param bw: bool, black and white coloured
+        :param hide_axes: bool, hide title and axes
+        :param ax: matplotlib Axes to draw into, None for the current pyplot axes
+        :return: null
+    """
+    c = features.chroma(y, sr, mode="stft", hpss=False)
+
+    if bw:
+        img = librosa.display.specshow(
+            c, sr=sr, x_axis='time', cmap='gray_r', y_axis='chroma', vmin=0, vmax=1, ax=ax)
     else:
-        librosa.display.specshow(
-            c, sr=sr, x_axis='time', y_axis='chroma', vmin=0, vmax=1)
+        img = librosa.display.specshow(
+            c, sr=sr, x_axis='time', y_axis='chroma', vmin=0, vmax=1, ax=ax)
 
     if not hide_axes:
-        plt.title(title)
-        plt.colorbar()
-        plt.tight_layout()
+        _decorate(img, title)
 
 
-def power_spectrogram(y=None, sr=22050, title="", bw=False, hide_axes=False):
+def power_spectrogram(y=None, sr=22050, title="", bw=False, hide_axes=False, ax=None):
     """
     Visualizable function \n
     Create a power spectrogram using np.aps(D) ** 2
@@ -70,24 +102,21 @@ def power_spectrogram(y=None, sr=22050, title="", bw=False, hide_axes=False):
         :param title: str, title of the plot
         :param bw: bool, black and white coloured
         :param hide_axes: bool, hide title and axes
+        :param ax: matplotlib Axes to draw into, None for the current pyplot axes
         :return: null
     """
-    d = librosa.stft(y)
+    db = features.power_spectrogram_db(y)
 
     if bw:
-        display.specshow(librosa.amplitude_to_db(np.abs(d) ** 2, ref=np.max), cmap='gray_r', sr=sr,
-                         y_axis='log', x_axis='time')
+        img = display.specshow(db, cmap='gray_r', sr=sr, y_axis='log', x_axis='time', ax=ax)
     else:
-        display.specshow(librosa.amplitude_to_db(
-            np.abs(d) ** 2, ref=np.max), y_axis='log', x_axis='time')
+        img = display.specshow(db, y_axis='log', x_axis='time', ax=ax)
 
     if not hide_axes:
-        plt.title(title)
-        plt.colorbar(format='%+2.0f dB')
-        plt.tight_layout()
+        _decorate(img, title, format='%+2.0f dB')
 
 
-def mel_power_spectrogram(y=None, sr=22050, title="", bw=False, hide_axes=False):
+def mel_power_spectrogram(y=None, sr=22050, title="", bw=False, hide_axes=False, ax=None):
     """
     Visualizable function \n
     Create a mel scale using librosa.melspectrogram
@@ -97,27 +126,32 @@ def mel_power_spectrogram(y=None, sr=22050, title="", bw=False, hide_axes=False)
         :param title: str, title of the plot
         :param bw: bool, black and white coloured
         :param hide_axes: bool, hide title and axes
+        :param ax: matplotlib Axes to draw into, None for the current pyplot axes
         :return: null
     """
 
-    # Let's make and display a mel-scaled power (energy-squared) spectrogram
-    S = librosa.feature.melspectrogram(y, sr=sr, n_mels=128)
-
-    # Convert to log scale (dB). We'll use the peak power as reference.
-    log_S = librosa.amplitude_to_db(S, ref=np.max)
+    # mel-scaled power (energy-squared) spectrogram in dB with the peak power as reference
+    log_S = features.mel_power_spectrogram_db(y, sr)
 
     # Display the spectrogram on a mel scale
     # sample rate and hop length parameters are used to render the time axis
     if bw:
-        librosa.display.specshow(
-            log_S, sr=sr, cmap='gray_r', x_axis='time', y_axis='mel')
+        img = librosa.display.specshow(
+            log_S, sr=sr, cmap='gray_r', x_axis='time', y_axis='mel', ax=ax)
     else:
-        librosa.display.specshow(log_S, sr=sr, x_axis='time', y_axis='mel')
+        img = librosa.display.specshow(log_S, sr=sr, x_axis='time', y_axis='mel', ax=ax)
 
     if not hide_axes:
-        plt.title(title)
-        plt.colorbar(format='%+02.0f dB')
-        plt.tight_layout()
+        _decorate(img, title, format='%+02.0f dB')
+
+
+# visualizable functions with an image computed by NumPy, used by get_visual_data
+feature_functions = {
+    power_spectrogram: features.power_spectrogram,
+    mel_power_spectrogram: features.mel_power_spectrogram,
+    chromagram: features.chromagram,
+    fast_chromagram: features.fast_chromagram
+}
 
 
 def show_images(imgs=None, titles=None, hide_axes=False, size=(70, 50)):
@@ -223,6 +257,17 @@ def _visualize(data=None, titles=None, sr=22050, size=(22.4, 16.5), v_func=None,
         :param hide_axes: bool, hide title and axes
         :return: RGBA data(4d np array), if action is GET_DATA, else None
     """
+    if titles:
+        if len(titles) != len(data):
+            raise VisualizerException(
+                "If you specify titles, please specify len(data) titles")
+
+    if action == Actions.GET_DATA and hide_axes and len(data) == 1:
+        # borderless single image, drawn into a figure borrowed from the module-wide pool (one per thread at a time)
+        with figure_pool.axes(size=size, dpi=dpi, bw=bw) as ax:
+            v_func(y=data[0], sr=sr, title=titles[0], bw=bw, hide_axes=hide_axes, ax=ax)
+            return fig2data(ax.figure, bw=bw, crop=None)
+
     if len(data) < 4:
         plot_x = len(data)
     else:
@@ -231,43 +276,40 @@ def _visualize(data=None, titles=None, sr=22050, size=(22.4, 16.5), v_func=None,
     plot_y = int(ceil(float(len(data)) / float(plot_x)))
 
     if hide_axes:
-        fig = plt.figure(frameon=False, dpi=dpi)
-        fig.set_size_inches(size[0], size[1])
+        fig_kwargs = dict(figsize=size, dpi=dpi, frameon=False)
     else:
-        fig = plt.figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi * 10)
-        # fig.set_size_inches(size[0] / 10.0, size[1] / 10.0)
+        fig_kwargs = dict(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi * 10)
 
-    if titles:
-        if len(titles) != len(data):
-            raise VisualizerException(
-                "If you specify titles, please specify len(data) titles")
+    # only a shown figure is managed by pyplot
+    if action == Actions.SHOW:
+        fig = plt.figure(**fig_kwargs)
+    else:
+        fig = Figure(**fig_kwargs)
+        FigureCanvasAgg(fig)
 
     for plot_id, y in enumerate(data):
-        plt.subplot(plot_y, plot_x, plot_id + 1)
         if len(data) == 1 and hide_axes:
             # no axis and remove borders
-            ax = plt.Axes(fig, [0., 0., 1., 1.])
+            ax = fig.add_axes([0., 0., 1., 1.])
             ax.set_axis_off()
-            fig.add_axes(ax)
+        else:
+            ax = fig.add_subplot(plot_y, plot_x, plot_id + 1)
 
-        v_func(y=y, sr=sr, title=titles[plot_id], bw=bw, hide_axes=hide_axes)
+        v_func(y=y, sr=sr, title=titles[plot_id], bw=bw, hide_axes=hide_axes, ax=ax)
 
     _data = None
     if action == Actions.SHOW:
         plt.show()
-
+        plt.close(fig)
     elif action == Actions.SAVE_PLOT:
-        if hide_axes:
-            plt.savefig(out_file, dpi=dpi)
-        else:
-            plt.savefig(out_file)
+        fig.savefig(out_file, dpi=dpi if hide_axes else "figure")
     else:
         _data = fig2data(fig, bw=bw, crop=None)
-    plt.close(fig)
     return _data
 
 
-def get_visual_data(y=None, sr=22050, size=(22.4, 16.0), v_func=None, title="title", bw=True, hide_axes=True):
+def get_visual_data(y=None, sr=22050, size=(22.4, 16.0), v_func=None, title="title", bw=True, hide_axes=True,
+                    fast=True):
     """
 
     :param y: list of samples, input data
@@ -277,13 +319,51 @@ def get_visual_data(y=None, sr=22050, size=(22.4, 16.0), v_func=None, title="tit
     :param size: size of the histogram
     :param bw: bool, black and white indicator
     :param hide_axes: bool, hide title and axes
+    :param fast: bool, compute the image of power_spectrogram, mel_power_spectrogram or chromagram with NumPy
+                 (see sox_chords.util.features) instead of plotting it, only used if hide_axes
     :param crop: (left, upper, right, lower)
     :return: x,y: tuple of image data
     """
+    if fast and hide_axes and v_func in feature_functions:
+        return feature_functions[v_func](y=y, sr=sr, size=(int(round(size[0] * dpi)), int(round(size[1] * dpi))),
+                                         bw=bw)
     return _visualize(data=[y], sr=sr, size=size, v_func=v_func, titles=[title], action=Actions.GET_DATA, bw=bw,
                       hide_axes=hide_axes)
 
 
+def get_visual_batch(frames=None, sr=22050, size=(22.4, 16.0), v_func=None, bw=True, hide_axes=True):
+    """
+    Images of a batch of frames, the images of power_spectrogram, mel_power_spectrogram and chromagram are
+    computed for the whole batch at once (see sox_chords.util.features)
+
+    :param frames: np.array (batch, samples) or list of frames of the same length
+    :param sr: int, sampling rate
+    :param size: size of the histogram
+    :param v_func: func, visualizable function
+    :param bw: bool, black and white indicator
+    :param hide_axes: bool, hide title and axes
+    :return: np.array, (batch, height, width) if bw else (batch, height, width, 3)
+    """
+    if hide_axes and v_func in feature_functions:
+        return feature_functions[v_func](y=np.asarray(frames), sr=sr,
+                                         size=(int(round(size[0] * dpi)), int(round(size[1] * dpi))), bw=bw)
+
+    from sox_chords.util.utils import parallize
+    return np.array(parallize(get_visual_data, [(frame, sr, size, v_func, "", bw, hide_axes) for frame in frames]))
+
+
+def get_visual_shape(size=(22.4, 16.0), bw=True):
+    """
+    Shape of an image of get_visual_data and get_visual_batch with hidden axes, without drawing it
+
+    :param size: size of the histogram
+    :param bw: bool, black and white indicator
+    :return: tuple, (height, width) if bw else (height, width, 3)
+    """
+    shape = (int(round(size[1] * dpi)), int(round(size[0] * dpi)))
+    return shape if bw else shape + (3,)
+
+
 def visualize(y=None, sr=22050, size=(224, 160), v_func=None, out_file="out.png", title="title", show=True, bw=False,
               hide_axes=False):
     _visualize(data=[y], sr=sr, size=size, v_func=v_func, out_file=out_file, titles=[title], action=int(show),
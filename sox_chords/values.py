@@ -1,7 +1,25 @@
+import tempfile
+import warnings
+from os.path import join
+
 import numpy as np
 
 
-class Values(object):
+class _ValuesMeta(type):
+
+    @property
+    def USE_PKL(cls):
+        """ deprecated alias of USE_AUDIO_CACHE """
+        warnings.warn("Values.USE_PKL is deprecated, use Values.USE_AUDIO_CACHE", DeprecationWarning, stacklevel=2)
+        return cls.USE_AUDIO_CACHE
+
+    @USE_PKL.setter
+    def USE_PKL(cls, value):
+        warnings.warn("Values.USE_PKL is deprecated, use Values.USE_AUDIO_CACHE", DeprecationWarning, stacklevel=2)
+        cls.USE_AUDIO_CACHE = value
+
+
+class Values(object, metaclass=_ValuesMeta):
 
     EXTRACTED_FOLDER = "extracted"
     MAX_SEMI_TONES = 12
@@ -9,6 +27,11 @@ class Values(object):
     MAX_OCTAVES = 8
     MAX_NUM_KEYS = 12 * 8
     MAX_PARALLEL_THREADS = 8
+    # maximum number of concurrently running sox processes of Sox.call_async (per event loop)
+    MAX_PARALLEL_SOX = 8
+    # range of sampling rates audio can be synthesized at
+    MIN_SAMPLING_RATE = 8000
+    MAX_SAMPLING_RATE = 48000
 
     IS_NEXT_CORE_SEMI_TONE = [1, 3, 4, 6, 8, 10, 11]
     SEMI_TONE_STEPS = [2, 2, 1, 2, 2, 2, 1]
@@ -18,9 +41,16 @@ class Values(object):
     CORE_NOTES = [
         "C", "D", "E", "F", "G", "A", "B"
     ]
-    D_TYPE_AUDIO = np.uint32
+    D_TYPE_AUDIO = np.float32
     D_TYPE_IMG = np.uint8
-    USE_PKL = True
+    # integer class labels (one_hot=False), one hot labels are D_TYPE_IMG
+    D_TYPE_LABEL = np.int64
+    # cache the samples AudioFrameGenerator loads from audio files as .npy files in AUDIO_CACHE_DIR (formerly
+    # USE_PKL, which is still accepted)
+    USE_AUDIO_CACHE = True
+    AUDIO_CACHE_DIR = join(tempfile.gettempdir(), "sox_chords_audio")
+    # default synthesis backend of Sox.create_audio, 'sox' or 'numpy'
+    SYNTH_BACKEND = "sox"
 
     SUPPORTED_VIDEO_EXTENSIONS = ["mp4", "mpeg", "mpg", "avi", "mkv", "flv"]
     SUPPORTED_IMAGE_EXTENSIONS = ["jpg", "jpeg", "png", "jp2"]
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import tempfile
+import time
+
+import pytest
+
+from sox_chords.music.chords import triad
+from sox_chords.music.song import SoxChord, SoxSong
+from sox_chords.music.utils import get_note
+from sox_chords.util.sox import Sox, SoxBuilder, SoxException
+from sox_chords.values import Values
+
+
+def test_generate_async_in_flight():
+    progression = [triad.MajorTriad(get_note(name, 4)) for name in ["C", "F", "G", "A"]]
+    output_dir = tempfile.mkdtemp()
+
+    async def generate():
+        return await asyncio.gather(*[chord.generate_async(output_dir=output_dir, duration=.25, backend="numpy")
+                                      for chord in progression])
+
+    outputs = asyncio.run(generate())
+    assert all(os.path.exists(output) for output in outputs)
+
+    song = SoxSong([SoxChord(chord.notes, duration=.25) for chord in progression])
+    y = asyncio.run(song.generate_async(os.path.join(output_dir, "song.wav"), backend="numpy"))
+    assert len(y) == 44100
+
+
+def test_call_async_bounds_concurrent_processes(monkeypatch):
+    running = tempfile.mkdtemp()
+    # every sox call is replaced by a process that counts the processes running next to it
+    script = 'touch "$1/$$"; ls "$1" | wc -l >> "$1.peak"; sleep .2; rm "$1/$$"'
+    monkeypatch.setattr(SoxBuilder, "build", lambda self, raw=False: ["sh", "-c", script, "sh", running])
+    monkeypatch.setattr(Values, "MAX_PARALLEL_SOX", 2)
+    progression = [triad.MajorTriad(get_note(name, 4)) for name in ["C", "D", "E", "F", "G", "A"]]
+
+    async def generate():
+        await asyncio.gather(*[chord.generate_async(output_dir=running, duration=.25, backend="sox")
+                               for chord in progression])
+
+    asyncio.run(generate())
+    with open(running + ".peak") as handler:
+        counts = [int(line) for line in handler]
+    assert len(counts) == len(progression) and max(counts) == 2
+
+
+def test_call_async_timeout_kills_process():
+    with pytest.raises(SoxException):
+        asyncio.run(Sox.call_async(["sleep", "5"], timeout=.1))
+
+
+def test_call_async_cancel():
+    async def cancel():
+        task = asyncio.ensure_future(Sox.call_async(["sleep", "5"]))
+        await asyncio.sleep(.1)
+        task.cancel()
+        await task
+
+    start = time.time()
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancel())
+    assert time.time() - start < 2
@@ -0,0 +1,43 @@
+import numpy as np
+
+from sox_chords.music.chords import triad
+from sox_chords.music.scale import MajorScale
+from sox_chords.music.song import SoxChord, SoxSong
+from sox_chords.music.utils import get_note
+from sox_chords.util.bank import NoteBank
+from sox_chords.util.sox import Sox, WhiteNoise
+from sox_chords.util.synth import NumpyBackend
+
+
+def test_bank_renders_every_key_once():
+    bank = NoteBank(backend=NumpyBackend(seed=0))
+    chords = [triad.MajorTriad(get_note(name, 4)) for name in ["C", "F", "G"]]
+
+    for chord in chords:
+        y = chord.render(duration=.25, backend=bank)
+        assert y.shape == (11025,)
+        assert np.isclose(np.abs(y).max(), 10 ** (-1 / 20.), atol=1e-3)
+    num_keys = len(set(semi_tone for chord in chords for semi_tone in chord.get_semi_tones()))
+    assert bank.num_renders == num_keys
+
+    # shifted and noisy variants come from the same keys
+    for chord in chords:
+        chord.render(duration=.25, freq_shift=.5, noise=WhiteNoise(), backend=bank)
+    assert bank.num_renders == num_keys + 1
+
+
+def test_bank_matches_numpy_backend():
+    note = get_note("A", 4)
+    y = Sox.render_audio(notes=[note], duration=.5, fade=0, bits=16, backend=NumpyBackend(seed=3))
+    y_bank = Sox.render_audio(notes=[note], duration=.5, fade=0, bits=16, backend=NoteBank(NumpyBackend(seed=3)))
+    assert np.abs(y - y_bank).max() < 1e-3
+
+
+def test_bank_scale_and_song():
+    bank = NoteBank(backend=NumpyBackend(seed=0))
+    y = MajorScale(get_note("C", 4)).render(dpn=.1, backend=bank)
+    assert len(y) == int(round(.7 * 44100))
+
+    song = SoxSong([SoxChord(triad.MajorTriad(get_note(name, 4)).notes, duration=.2) for name in ["C", "G"]])
+    y = song.generate("", backend=bank)
+    assert len(y) == int(round(.4 * 44100))
@@ -0,0 +1,83 @@
+import os
+import tempfile
+
+import numpy as np
+
+from sox_chords.music.chords import triad
+from sox_chords.music.utils import get_note
+from sox_chords.util.cache import RenderCache
+from sox_chords.util.sox import Sox, WhiteNoise
+from sox_chords.util.synth import NumpyBackend
+
+
+class CountingBackend(NumpyBackend):
+
+    def __init__(self):
+        super(CountingBackend, self).__init__(seed=0)
+        self.renders = 0
+
+    def render(self, builder):
+        self.renders += 1
+        return super(CountingBackend, self).render(builder)
+
+
+def test_render_cache_hits_and_misses():
+    cache = RenderCache(tempfile.mkdtemp())
+    backend = CountingBackend()
+    chord = triad.MajorTriad(get_note("C", 4))
+
+    y = chord.render(duration=.25, bits=16, backend=backend, cache=cache)
+    y_cached = chord.render(duration=.25, bits=16, backend=backend, cache=cache)
+    assert backend.renders == 1
+    assert np.array_equal(y, y_cached)
+
+    # only the changed variant is rendered
+    chord.render(duration=.25, bits=16, noise=WhiteNoise(), backend=backend, cache=cache)
+    chord.render(duration=.25, bits=16, freq_shift=.5, backend=backend, cache=cache)
+    chord.render(duration=.25, bits=16, backend=backend, cache=cache)
+    assert backend.renders == 3
+
+    output = chord.generate(output_dir=tempfile.mkdtemp(), duration=.25, backend=backend, cache=cache)
+    assert os.path.exists(output)
+    assert backend.renders == 3
+
+
+def test_render_cache_evicts_least_recently_used():
+    cache = RenderCache(tempfile.mkdtemp(), max_size=3500)
+    keys = ["a", "b", "c"]
+    for key in keys:
+        cache.put(key, np.zeros(500, dtype=np.float32), bits=16)
+        os.utime(os.path.join(cache.cache_dir, key + ".npy"), (keys.index(key), keys.index(key)))
+
+    assert cache.get("a") is not None
+    cache.put("d", np.zeros(500, dtype=np.float32), bits=16)
+
+    assert cache.size <= 3500
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("d") is not None
+
+
+def test_render_cache_tolerates_renders_evicted_by_another_process(monkeypatch):
+    cache = RenderCache(tempfile.mkdtemp(), max_size=3500)
+    for key in ["a", "b", "c"]:
+        cache.put(key, np.zeros(500, dtype=np.float32), bits=16)
+    # another process sharing the directory removes renders between listing and removing them
+    files = cache._files()
+    for path in files[:2]:
+        os.remove(path)
+    monkeypatch.setattr(cache, "_files", lambda: files + [os.path.join(cache.cache_dir, "gone.npy")])
+    cache._evict()
+    assert cache.size <= 3500
+
+    monkeypatch.undo()
+    cache.put("d", np.zeros(500, dtype=np.float32), bits=16)
+    assert cache.get("d") is not None
+
+
+def test_render_cache_separates_backend_seeds():
+    cache = RenderCache(tempfile.mkdtemp())
+    chord = triad.MajorTriad(get_note("C", 4))
+    y = chord.render(duration=.25, bits=16, backend=NumpyBackend(seed=0), cache=cache)
+    other = chord.render(duration=.25, bits=16, backend=NumpyBackend(seed=1), cache=cache)
+    assert not np.array_equal(y, other)
+    assert np.array_equal(other, chord.render(duration=.25, bits=16, backend=NumpyBackend(seed=1)))
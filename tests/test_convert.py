@@ -0,0 +1,49 @@
+import os
+import tempfile
+from os.path import join
+
+from sox_chords.util.convert import SoxPipeline, SIGNATURE_FILE
+
+
+def test_pipeline_builds_single_call():
+    pipeline = SoxPipeline([("trim", 0, 1.5), ("rate", 22050)]).channels(1).bits(16).gain(-3).fade(.1, 1.5, .1).norm()
+    assert pipeline.build("in.wav", "out.wav") == [
+        "sox", "in.wav", "-b", "16", "out.wav", "trim", "0", "1.5", "rate", "22050", "channels", "1",
+        "gain", "-3", "fade", "0.1", "1.5", "0.1", "norm", "-1.0"]
+
+
+def test_convert_dir_skips_up_to_date_files():
+    in_dir, out_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    for name in ["a.wav", "b.wav", "c.txt"]:
+        open(join(in_dir, name), "w").close()
+    open(join(out_dir, "a.wav"), "w").close()
+    os.utime(join(in_dir, "a.wav"), (0, 0))
+    os.utime(join(in_dir, "b.wav"), (0, 0))
+    pipeline = SoxPipeline().rate(16000)
+    with open(join(out_dir, SIGNATURE_FILE), "w") as handler:
+        handler.write(pipeline.signature)
+
+    status = pipeline.convert_dir(in_dir, out_dir, jobs=2)
+    assert list(status.keys()) == [join(in_dir, "a.wav"), join(in_dir, "b.wav")]
+    assert status[join(in_dir, "a.wav")] == "skipped"
+    # b has no output yet, it is converted (or fails if sox is missing)
+    assert status[join(in_dir, "b.wav")] in ["converted", "failed"]
+
+
+def test_convert_dir_converts_again_with_other_operations():
+    in_dir, out_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    open(join(in_dir, "a.wav"), "w").close()
+    open(join(out_dir, "a.wav"), "w").close()
+    os.utime(join(in_dir, "a.wav"), (0, 0))
+    with open(join(out_dir, SIGNATURE_FILE), "w") as handler:
+        handler.write(SoxPipeline().rate(16000).signature)
+
+    pipeline = SoxPipeline().rate(22050).bits(16)
+    status = pipeline.convert_dir(in_dir, out_dir, jobs=1)
+    # the up to date output of other operations is not skipped
+    assert status[join(in_dir, "a.wav")] in ["converted", "failed"]
+    if status[join(in_dir, "a.wav")] == "converted":
+        with open(join(out_dir, SIGNATURE_FILE)) as handler:
+            assert handler.read() == pipeline.signature
+    else:
+        assert not os.path.exists(join(out_dir, SIGNATURE_FILE))
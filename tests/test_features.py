@@ -0,0 +1,99 @@
+import librosa
+import numpy as np
+
+from sox_chords.music.chords import triad
+from sox_chords.music.utils import get_note
+from sox_chords.util import features, visualize
+from sox_chords.util.generators import AudioFrameGenerator
+from sox_chords.util.synth import NumpyBackend
+
+
+def _chord(sr=22050):
+    return triad.MajorTriad(get_note("C", 4)).render(duration=1., sr=sr, bits=16, backend="numpy")
+
+
+def test_stft_matches_librosa():
+    y = _chord()
+    assert np.allclose(features.stft(y), librosa.stft(y), atol=1e-3)
+    d = np.abs(librosa.stft(y)) ** 2
+    assert np.allclose(features.power_spectrogram_db(y), librosa.amplitude_to_db(d, ref=np.max), atol=1e-3)
+
+
+def test_symlog_axis_maps_bins_to_rows():
+    data = np.tile(np.arange(128.)[:, np.newaxis], (1, 10))
+    pixels = features.to_pixels(data, "mel", 22050, (20, 64))
+    assert pixels.shape == (64, 20)
+    # highest bin on top, every column the same
+    assert pixels[0, 0] > 120 and pixels[-1, 0] == 0
+    assert np.all(np.diff(pixels[:, 0]) <= 0)
+    assert np.all(pixels == pixels[:, :1])
+
+
+def test_get_visual_data_without_plotting():
+    y = _chord()
+    for v_func in [visualize.power_spectrogram, visualize.mel_power_spectrogram, visualize.chromagram]:
+        gray = visualize.get_visual_data(y=y, sr=22050, size=(9.6, 6.4), v_func=v_func, bw=True, hide_axes=True)
+        assert gray.shape == (64, 96) and gray.dtype == np.float32
+        assert 0 <= gray.min() and gray.max() <= 255
+
+        rgb = visualize.get_visual_data(y=y, sr=22050, size=(9.6, 6.4), v_func=v_func, bw=False, hide_axes=True)
+        assert rgb.shape == (64, 96, 3) and rgb.dtype == np.uint8
+
+
+def test_batch_matches_single_frames():
+    y = _chord()
+    frames = np.stack([y[:11025], y[5000:16025], np.zeros(11025, dtype=np.float32) + y[:11025] * .5])
+    for v_func in [visualize.power_spectrogram, visualize.mel_power_spectrogram]:
+        for bw in [True, False]:
+            batch = visualize.get_visual_batch(frames, sr=22050, size=(9.6, 6.4), v_func=v_func, bw=bw)
+            assert batch.shape[:3] == (3, 64, 96)
+            for frame, image in zip(frames, batch):
+                single = visualize.get_visual_data(y=frame, sr=22050, size=(9.6, 6.4), v_func=v_func, bw=bw)
+                assert np.abs(single.astype(np.float32) - image).max() <= 1.
+
+
+def test_cached_matrices_are_shared_and_read_only():
+    features.clear_cache()
+    y = _chord()
+    visualize.get_visual_data(y=y, sr=22050, size=(9.6, 6.4), v_func=visualize.mel_power_spectrogram)
+    visualize.get_visual_data(y=y[::-1].copy(), sr=22050, size=(9.6, 6.4), v_func=visualize.mel_power_spectrogram)
+    assert features.get_mel_basis.cache_info().hits >= 1
+    assert features.get_pixel_rows.cache_info().misses == 1
+
+    mel_basis = features.get_mel_basis(22050)
+    assert mel_basis is features.get_mel_basis(22050)
+    assert not mel_basis.flags.writeable
+    assert not features.get_window().flags.writeable
+    assert np.allclose(mel_basis, librosa.filters.mel(sr=22050, n_fft=2048, n_mels=128))
+
+
+def test_chroma_matches_librosa():
+    y = _chord()
+    cqt = librosa.pseudo_cqt(librosa.effects.hpss(y)[0], sr=22050, n_bins=252, bins_per_octave=36, tuning=0.)
+    assert np.allclose(features.pseudo_cqt(librosa.effects.hpss(y)[0], 22050), cqt, atol=1e-5)
+    expected = librosa.feature.chroma_cqt(C=cqt, sr=22050, bins_per_octave=36)
+    assert np.allclose(features.chroma(y, 22050), expected, atol=1e-5)
+
+    # the filters are built once
+    features.chroma(y[::-1].copy(), 22050)
+    assert features.get_cqt_basis.cache_info().hits >= 1
+
+
+def test_fast_chroma_finds_chord_notes():
+    backend = NumpyBackend(seed=0)
+    for chord in [triad.MajorTriad(get_note("C", 4)), triad.MinorTriad(get_note("A", 3))]:
+        y = chord.render(duration=1., sr=22050, bits=16, backend=backend)
+        fast = features.chroma(y, 22050, mode="stft", hpss=False).mean(axis=-1)
+        reference = features.chroma(y, 22050).mean(axis=-1)
+
+        assert set(np.argsort(fast)[-3:]) == set(semi_tone % 12 for semi_tone in chord.get_semi_tones())
+        assert np.dot(fast, reference) / (np.linalg.norm(fast) * np.linalg.norm(reference)) > .8
+
+    image = visualize.get_visual_data(y=y, sr=22050, size=(9.6, 6.4), v_func=visualize.fast_chromagram)
+    assert image.shape == (64, 96)
+
+
+def test_frame_generator_separates_harmonic_once():
+    y = _chord()
+    generator = AudioFrameGenerator("chord", sr=22050, y=y, harmonic=True)
+    assert np.allclose(generator.y, librosa.effects.harmonic(y))
@@ -0,0 +1,99 @@
+import os
+import tempfile
+from os.path import join
+
+import numpy as np
+import pytest
+import soundfile
+
+from sox_chords.util.generators import AudioFrameGenerator, FileFrameSampler
+from sox_chords.values import Values
+
+
+def _wav(duration=3., sr=22050):
+    path = join(tempfile.mkdtemp(), "mix.wav")
+    t = np.arange(int(duration * sr)) / float(sr)
+    soundfile.write(path, (.5 * np.sin(2 * np.pi * 440. * t)).astype(np.float32), sr)
+    return path
+
+
+def test_samples_are_cached_memory_mapped():
+    path, cache_dir = _wav(), tempfile.mkdtemp()
+    loaded = AudioFrameGenerator(path, sr=22050, load_duration=2., cache_dir=cache_dir)
+    assert not isinstance(loaded.y, np.memmap)
+    assert len(os.listdir(cache_dir)) == 1
+
+    cached = AudioFrameGenerator(path, sr=22050, load_duration=2., cache_dir=cache_dir)
+    assert isinstance(cached.y, np.memmap) and cached.duration == 2.
+    assert np.array_equal(cached.y, loaded.y)
+    frame = cached.get_frames(frame_length=.5, num_frames=1)[0]
+    assert frame.base is not None and len(frame) == 11025
+
+    # another duration is cached next to it instead of replacing it
+    AudioFrameGenerator(path, sr=22050, load_duration=1., cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+    assert isinstance(AudioFrameGenerator(path, sr=22050, load_duration=2., cache_dir=cache_dir).y, np.memmap)
+
+
+def test_modified_files_are_reloaded():
+    path, cache_dir = _wav(), tempfile.mkdtemp()
+    AudioFrameGenerator(path, sr=22050, load_duration=1., cache_dir=cache_dir)
+    os.utime(path, (0, 0))
+    reloaded = AudioFrameGenerator(path, sr=22050, load_duration=1., cache_dir=cache_dir)
+    assert not isinstance(reloaded.y, np.memmap)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_use_pkl_is_an_alias_of_the_audio_cache():
+    path, cache_dir = _wav(), tempfile.mkdtemp()
+    with pytest.warns(DeprecationWarning):
+        Values.USE_PKL = False
+    try:
+        assert not Values.USE_AUDIO_CACHE
+        AudioFrameGenerator(path, sr=22050, load_duration=1., cache_dir=cache_dir)
+        assert not os.listdir(cache_dir)
+    finally:
+        Values.USE_AUDIO_CACHE = True
+    with pytest.warns(DeprecationWarning):
+        assert Values.USE_PKL
+
+
+def test_frames_array_is_a_strided_view():
+    y = np.arange(10000, dtype=np.float32)
+    generator = AudioFrameGenerator("samples", sr=1000, y=y)
+
+    frames = generator.get_frames_array(frame_length=2.)
+    assert frames.shape == (5, 2000) and np.shares_memory(frames, y)
+    assert np.array_equal(frames[:, 0], [0, 2000, 4000, 6000, 8000])
+
+    # overlapping frames, only complete frames are returned
+    frames = generator.get_frames_array(frame_length=2., hop_length=.5)
+    assert frames.shape == (17, 2000) and frames[-1, -1] == 9999
+    assert generator.get_num_frames(frame_length=2., hop_length=.5) == 17
+
+    frames = generator.get_frames_array(frame_length=2., index=np.array([4, 0, 4]))
+    assert np.array_equal(frames[:, 0], [8000, 0, 8000])
+
+    frames = generator.get_frames_array(frame_length=3., num_frames=5)
+    assert np.array_equal(frames[:, 0], [0, 3000, 6000, 0, 3000])
+
+    np.random.seed(0)
+    frames = generator.get_frames_array(frame_length=2., num_frames=64, randomize=True)
+    assert frames.shape == (64, 2000) and set(frames[:, 0]) == {0, 2000, 4000, 6000, 8000}
+    assert all(len(frame) == 2000 for frame in generator.get_frames(frame_length=2., num_frames=3, randomize=True))
+
+
+def test_file_frame_sampler_reads_windows_of_the_whole_file():
+    path = _wav(duration=30.)
+    loaded = AudioFrameGenerator(path, sr=22050, load_duration=30., cache_dir=tempfile.mkdtemp())
+    sampler = FileFrameSampler(path, sr=22050)
+    assert sampler.duration == 30. and sampler.get_num_frames(frame_length=2.) == 15
+
+    index = np.array([14, 3, 0])
+    frames = sampler.get_frames_array(frame_length=2., index=index)
+    assert frames.shape == (3, 44100)
+    assert np.allclose(frames, loaded.get_frames_array(frame_length=2., index=index), atol=1e-4)
+
+    # resampled while reading
+    frames = FileFrameSampler(path, sr=11025).get_frames_array(frame_length=2., num_frames=4, randomize=True)
+    assert frames.shape == (4, 22050) and np.abs(frames).max() > .4
@@ -0,0 +1,91 @@
+import multiprocessing
+import tempfile
+from os.path import join
+
+import numpy as np
+import soundfile
+
+from sox_chords.music.chords import triad
+from sox_chords.music.utils import get_note
+from sox_chords.util.loader import PrefetchLoader
+from sox_chords.util.processors import ChordProcessor
+from sox_chords.util.synth import NumpyBackend
+
+
+def _processor(backend="numpy", mix_dir=None):
+    chords = [triad.MajorTriad(get_note("C", 4)), triad.MinorTriad(get_note("A", 3))]
+    return ChordProcessor(chords, mix_dir, frame_length=.5, sr=22050, in_memory=True, backend=backend, jobs=1,
+                          shift_range=[1.0], v_size=(48, 32), mld=1.)
+
+
+def _mix_dir(count=3, sr=22050):
+    mix_dir = tempfile.mkdtemp()
+    rng = np.random.RandomState(0)
+    for i in range(count):
+        soundfile.write(join(mix_dir, "mix%d.wav" % i), rng.uniform(-.5, .5, 2 * sr).astype(np.float32), sr)
+    return mix_dir
+
+
+def test_workers_make_the_batches_in_order():
+    cp = _processor(NumpyBackend(seed=0), mix_dir=_mix_dir())
+    # four frames of every render to sample from
+    cp.frame_length = .125
+    kwargs = dict(batch_size=4, n_batches=6, n_mixed_files=2, rand_chord_sample=True, rand_mix_sample=True, seed=0)
+    expected = list(cp.batch_iterator(workers=1, **kwargs))
+    batches = list(cp.batch_iterator(workers=2, prefetch=2, **kwargs))
+    assert len(batches) == 6
+    # every batch is made of other frames, a batch of the wrong position or seed would not match
+    assert not any(np.array_equal(expected[0][0], x) for x, _ in expected[1:])
+    for (x, y), (expected_x, expected_y) in zip(batches, expected):
+        assert np.array_equal(x, expected_x) and np.array_equal(y, expected_y)
+
+
+def test_seeded_workers_are_reproducible_and_independent():
+    cp = _processor()
+    first = [y for _, y in cp.batch_iterator(batch_size=16, n_batches=4, workers=2, seed=1)]
+    second = [y for _, y in cp.batch_iterator(batch_size=16, n_batches=4, workers=2, seed=1)]
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+    # the workers do not draw the same chords
+    assert not np.array_equal(first[0], first[1])
+
+
+def test_closing_the_loader_stops_the_workers():
+    loader = PrefetchLoader(_processor(), n_batches=100, batch_size=4, workers=2, copy=False)
+    batches = iter(loader)
+    x, y = next(batches)
+    assert x.shape == (4, 32, 48) and y.shape == (4, 2)
+    batches.close()
+    assert not multiprocessing.active_children()
+
+
+def test_workers_resume_from_the_state_of_the_processor():
+    # the resumed processor renders the same chords
+    cp = _processor(NumpyBackend(seed=0))
+    expected = list(cp.batch_iterator(batch_size=4, n_batches=4, workers=2))
+    state = cp.state_dict()
+
+    cp = _processor(NumpyBackend(seed=0)).load_state_dict(dict(state, position=0))
+    batches = list(cp.batch_iterator(batch_size=4, n_batches=2, workers=1))
+    batches += list(cp.batch_iterator(batch_size=4, n_batches=2, workers=2))
+    assert cp.state_dict()["position"] == state["position"] == 16
+    for (x, y), (expected_x, expected_y) in zip(batches, expected):
+        assert np.array_equal(x, expected_x) and np.array_equal(y, expected_y)
+
+
+def test_single_slot_without_copy_does_not_block():
+    cp = _processor()
+    with PrefetchLoader(cp, n_batches=3, batch_size=2, workers=1, prefetch=1, copy=False, seed=0) as loader:
+        batches = [(x.copy(), y.copy()) for x, y in loader]
+    assert len(batches) == 3
+    assert [x.shape for x, _ in batches] == [(2, 32, 48)] * 3
+    assert cp.get_batch_specs(2)[0][0] == (2, 32, 48)
+
+
+def test_integer_labels_are_not_truncated():
+    cp = _processor()
+    # the labels of a processor with more classes than uint8 holds
+    cp.sampler.labels = cp.sampler.labels + 300
+    assert cp.get_batch_specs(8, one_hot=False)[1] == ((8,), np.dtype(np.int64))
+    for workers in [0, 2]:
+        _, y = next(cp.batch_iterator(batch_size=8, n_batches=1, one_hot=False, workers=workers, seed=0))
+        assert y.dtype == np.int64 and set(y) <= {300, 301}
@@ -0,0 +1,147 @@
+import os
+import pickle
+import tempfile
+import time
+from os.path import join
+
+import numpy as np
+import soundfile
+
+from sox_chords.music.chords import triad
+from sox_chords.music.utils import get_note
+from sox_chords.util.generators import AudioFrameGenerator
+from sox_chords.util.mix import MixPool, mix
+from sox_chords.util.processors import ChordProcessor
+from sox_chords.util.synth import NumpyBackend
+
+
+def _mix_dir(count=4, duration=3., sr=22050):
+    mix_dir = tempfile.mkdtemp()
+    for i in range(count):
+        # every file has its own constant level
+        soundfile.write(join(mix_dir, "mix%d.wav" % i), np.full(int(duration * sr), .1 * (i + 1), dtype=np.float32),
+                        sr, subtype="FLOAT")
+    return mix_dir
+
+
+def test_pool_samples_frames_of_its_segments():
+    mix_dir = _mix_dir()
+    files = [join(mix_dir, "mix%d.wav" % i) for i in range(4)]
+    pool = MixPool(files, sr=22050, segment_duration=2., n_segments=3, seed=0)
+    assert pool.segments.shape == (3, 44100) and all(length == 44100 for length in pool.lengths)
+
+    frames = pool.sample(frame_length=.5, num_frames=16)
+    assert frames.shape == (16, 11025) and frames.dtype == np.float32
+    # a frame is taken from one segment
+    assert np.allclose(frames, frames[:, :1])
+
+    # the memory limit bounds the number of segments
+    assert len(MixPool(files, sr=22050, segment_duration=2., n_segments=3, max_bytes=44100 * 4 * 2)) == 2
+
+
+def test_pool_reads_the_start_of_files_through_the_sample_cache(monkeypatch):
+    mix_dir, cache_dir = _mix_dir(count=2), tempfile.mkdtemp()
+    files = [join(mix_dir, "mix%d.wav" % i) for i in range(2)]
+    pool = MixPool(files, sr=22050, segment_duration=1., n_segments=4, whole_file=False,
+                   seed=0, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == len(set(pool.files))
+
+    # refreshed segments of cached files are not decoded again
+    monkeypatch.setattr(AudioFrameGenerator, "_load_file_raw", lambda self, cache_file=None: 1 / 0)
+    for _ in range(4):
+        pool.refresh()
+    assert np.allclose(pool.segments, .1 * (1 + np.array([files.index(f) for f in pool.files]))[:, np.newaxis])
+
+
+def test_pool_replaces_the_oldest_segment():
+    mix_dir = _mix_dir()
+    files = [join(mix_dir, "mix%d.wav" % i) for i in range(4)]
+    pool = MixPool(files, sr=22050, segment_duration=1., n_segments=2, seed=0)
+    assert pool.numbers == [0, 1]
+    pool.refresh()
+    assert pool.numbers == [2, 1] and pool.refreshes == 1
+
+    # the background thread decodes the next segments in advance
+    pool.start()
+    time.sleep(.5)
+    assert sorted(pool._decoded) == [3, 4]
+    pool.seek(3)
+    pool.stop()
+    assert pool._thread is None
+    assert pool.numbers == [4, 3] and set(pool.files) <= set(files)
+
+    # the segments only depend on the seed and the number of replacements
+    other = MixPool(files, sr=22050, segment_duration=1., n_segments=2, seed=0).seek(3)
+    assert other.files == pool.files and np.array_equal(other.segments, pool.segments)
+    # going back decodes the replaced segments again
+    assert other.seek(1).numbers == [2, 1]
+
+
+def test_mix_scales_every_mix_frame_to_the_snr():
+    rng = np.random.RandomState(0)
+    frames = np.sin(np.linspace(0, 200 * np.pi, 4000, dtype=np.float32))[np.newaxis].repeat(3, axis=0)
+    mix_frames = rng.randn(3, 2, 4000).astype(np.float32) * np.array([[1.], [10.]], dtype=np.float32)
+    mix_frames[2, 1] = 0.
+
+    # unscaled, negative samples are kept
+    mixed = mix(frames, mix_frames)
+    assert mixed.dtype == np.float32 and np.allclose(mixed, frames + mix_frames.sum(axis=1), atol=1e-5)
+
+    mixed = mix(frames, mix_frames, snr_range=(10., 10.), rng=rng)
+    assert mixed.dtype == np.float32 and mixed.shape == (3, 4000)
+    signal_power = np.mean(frames[2] ** 2)
+    # the silent mix frame of the last chord frame adds nothing
+    assert np.isclose(signal_power / np.mean((mixed[2] - frames[2]) ** 2), 10., rtol=1e-3)
+    noise = mixed[0] - frames[0]
+    assert 10 * np.log10(signal_power / np.mean(noise ** 2)) < 10.
+
+
+def test_chord_processor_mixes_with_the_pool():
+    chords = [triad.MajorTriad(get_note("C", 4)), triad.MinorTriad(get_note("A", 3))]
+    cp = ChordProcessor(chords, _mix_dir(), frame_length=.5, sr=22050, in_memory=True, backend="numpy", jobs=1,
+                        mld=2., n_load=3, seek_mix=True, v_size=(48, 32), snr_range=(0., 20.))
+    try:
+        assert len(cp.fgs[1]) == 3
+        x, y = next(cp.batch_iterator(batch_size=4, n_batches=1, n_mixed_files=2))
+        assert x.shape == (4, 32, 48) and y.shape == (4, 2)
+    finally:
+        cp.close()
+
+
+def test_pool_state_restores_segments_and_seed():
+    files = [join(_mix_dir(), "mix%d.wav" % i) for i in range(4)]
+    pool = MixPool(files, sr=22050, segment_duration=1., n_segments=2, seed=0)
+    state = pool.state_dict()
+    pool.refresh()
+    expected = pool.sample(frame_length=.5, num_frames=8, rng=np.random.default_rng(1))
+
+    other = MixPool(files, sr=22050, segment_duration=1., n_segments=2, seed=1)
+    other.load_state_dict(state).refresh()
+    assert other.files == pool.files and other.numbers == pool.numbers
+    assert np.array_equal(other.sample(frame_length=.5, num_frames=8, rng=np.random.default_rng(1)), expected)
+
+
+def test_chord_processor_resumes_bit_identical():
+    chords = [triad.MajorTriad(get_note("C", 4)), triad.MinorTriad(get_note("A", 3))]
+    mix_dir = _mix_dir()
+
+    def processor(seed):
+        # the resumed processor renders the same chords, a mix segment is replaced after every batch
+        return ChordProcessor(chords, mix_dir, frame_length=.5, sr=22050, in_memory=True, backend=NumpyBackend(0),
+                              jobs=1, mld=2., n_load=3, seek_mix=True, v_size=(48, 32), snr_range=(0., 20.),
+                              shift_range=[1.0], mix_refresh=1, seed=seed)
+
+    kwargs = dict(batch_size=4, n_batches=6, n_mixed_files=2, balanced=True)
+    expected = list(processor(5).batch_iterator(**kwargs))
+
+    interrupted = processor(5)
+    batches = interrupted.batch_iterator(**kwargs)
+    first = [next(batches) for _ in range(2)]
+    state = pickle.loads(pickle.dumps(interrupted.state_dict()))
+    assert state["position"] == 8
+
+    # the state replaces the seed, the sampler and the mix pool of another processor
+    resumed = processor(9).load_state_dict(state)
+    rest = list(resumed.batch_iterator(**dict(kwargs, n_batches=4)))
+    for (x, y), (expected_x, expected_y) in zip(first + rest, expected):
+        assert np.array_equal(x, expected_x) and np.array_equal(y, expected_y)
@@ -0,0 +1,32 @@
+import numpy as np
+
+from sox_chords.music.chords import triad
+from sox_chords.music.utils import get_note
+from sox_chords.util.processors import ChordProcessor
+
+
+def test_chord_processor_in_memory():
+    chords = [triad.MajorTriad(get_note("C", 4)), triad.MinorTriad(get_note("A", 3))]
+    cp = ChordProcessor(chords, None, frame_length=.5, in_memory=True, backend="numpy", shift_range=[1.0], jobs=1)
+
+    assert cp.get_num_classes() == 2
+    assert all(isinstance(y, np.ndarray) for ys in cp._chords.values() for y in ys)
+    assert len(cp.fgs[0]) == 4
+
+    key, fg = cp.fgs[0][0]
+    frames = fg.get_frames(frame_length=.5, num_frames=1)
+    assert len(frames[0]) == 22050
+
+
+def test_enharmonic_chords_are_rendered_once():
+    chords = [triad.MajorTriad(get_note("B", 4)), triad.MajorTriad(get_note("Cb", 4)),
+              triad.MinorTriad(get_note("C", 4))]
+    mapping = ChordProcessor.get_all_chord_modifications(chords, None, [], [], duration=.25, in_memory=True, jobs=1,
+                                                         backend="numpy")
+
+    assert mapping["B"][0] is mapping["Cb"][0]
+    assert mapping["Cm"][0] is not mapping["B"][0]
+
+    mapping = ChordProcessor.get_all_chord_modifications(chords, None, [], [], duration=.25, in_memory=True, jobs=1,
+                                                         backend="numpy", dedup=False)
+    assert mapping["B"][0] is not mapping["Cb"][0]
@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+from sox_chords.music.chords import triad
+from sox_chords.music.chord import Chord
+from sox_chords.music.utils import get_note
+from sox_chords.util.render import render_many, get_variants
+from sox_chords.util.sox import WhiteNoise
+
+
+class BrokenChord(Chord):
+    name = "broken"
+
+    def generate(self, *args, **kwargs):
+        raise RuntimeError("cannot render")
+
+
+def test_get_variants_order():
+    variants = get_variants([WhiteNoise()], [.5])
+    assert [v.extension for v in variants] == [".wav", "WhiteNoise-.wav", "-shift0.500000.wav",
+                                               "-WhiteNoise-shift0.500000.wav"]
+
+
+def test_render_many_parallel():
+    root = get_note("C", 4)
+    chords = [triad.MajorTriad(root), BrokenChord(root, [root]), triad.MinorTriad(root)]
+    variants = get_variants([WhiteNoise()], [.5])
+    output_dir = tempfile.mkdtemp()
+
+    mapping = render_many(chords, variants, output_dir=output_dir, duration=.25, backend="numpy", jobs=2,
+                          max_in_flight=2)
+
+    assert list(mapping.keys()) == ["C", "Cbroken", "Cm"]
+    assert mapping["Cbroken"] == []
+    assert mapping["C"] == [os.path.join(output_dir, "C" + v.extension) for v in variants]
+    assert all(os.path.exists(path) for path in mapping["C"] + mapping["Cm"])
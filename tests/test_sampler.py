@@ -0,0 +1,54 @@
+from collections import Counter
+
+import numpy as np
+
+from sox_chords.music.chords import triad
+from sox_chords.music.utils import get_note
+from sox_chords.util.processors import ChordProcessor
+from sox_chords.util.sampler import EpochSampler
+
+# 2 classes: class 0 with 2 clean and 4 noise generators, class 1 with 1 clean and 1 noise generator
+LABELS = [0, 0, 0, 0, 0, 0, 1, 1]
+STRATA = ["clean", "clean", "noise", "noise", "noise", "noise", "clean", "noise"]
+
+
+def test_epoch_is_balanced_over_classes_and_variant_types():
+    sampler = EpochSampler(LABELS, STRATA, seed=0)
+    epoch = sampler.get_epoch(0)
+    assert len(epoch) == sampler.epoch_size == 2 * 2 * 4
+
+    labels = np.asarray(LABELS)[epoch]
+    assert Counter(labels.tolist()) == {0: 8, 1: 8}
+    for label in (0, 1):
+        strata = Counter(STRATA[i] for i in epoch[labels == label])
+        assert strata == {"clean": 4, "noise": 4}
+    # the largest group is drawn without replacement
+    assert sorted(i for i in epoch if STRATA[i] == "noise" and LABELS[i] == 0) == [2, 3, 4, 5]
+
+
+def test_epochs_are_reproducible_and_differ():
+    sampler = EpochSampler(LABELS, STRATA, seed=3)
+    first, second = sampler.get_epoch(0).copy(), sampler.get_epoch(1).copy()
+    assert not np.array_equal(first, second)
+    assert np.array_equal(EpochSampler(LABELS, STRATA, seed=3).get_epoch(1), second)
+    assert np.array_equal(sampler.get_epoch(0), first)
+
+
+def test_indices_cross_epochs():
+    sampler = EpochSampler(LABELS, STRATA, seed=1)
+    size = sampler.epoch_size
+    indices = sampler.get_indices(size - 3, 6)
+    assert np.array_equal(indices[:3], sampler.get_epoch(0)[-3:])
+    assert np.array_equal(indices[3:], sampler.get_epoch(1)[:3])
+
+
+def test_processor_balanced_batches():
+    chords = [triad.MajorTriad(get_note("C", 4)), triad.MinorTriad(get_note("A", 3))]
+    cp = ChordProcessor(chords, None, frame_length=.5, sr=22050, in_memory=True, backend="numpy", jobs=1,
+                        shift_range=[1.0], v_size=(48, 32), seed=0)
+    batch_size = cp.sampler.epoch_size
+    assert cp.batches_per_epoch(batch_size) == 1
+
+    _, y = next(cp.batch_iterator(batch_size=batch_size, n_batches=1, one_hot=False, balanced=True))
+    assert Counter(y.tolist()) == {0: batch_size // 2, 1: batch_size // 2}
+    assert np.array_equal(y, cp.sampler.labels[cp.sampler.get_epoch(0)])
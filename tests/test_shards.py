@@ -0,0 +1,79 @@
+import os
+import tempfile
+from os.path import join
+
+import numpy as np
+
+from sox_chords.music.chords import triad
+from sox_chords.music.utils import get_note
+from sox_chords.util.processors import ChordProcessor
+from sox_chords.util.shards import export_shards, ShardReader
+
+
+def _processor():
+    chords = [triad.MajorTriad(get_note("C", 4)), triad.MinorTriad(get_note("A", 3))]
+    return ChordProcessor(chords, None, frame_length=.5, sr=22050, in_memory=True, backend="numpy", jobs=1,
+                          shift_range=[1.0], v_size=(48, 32))
+
+
+def _load(out_dir, shard):
+    return [np.load(join(out_dir, "shard-%05d-%s.npy" % (shard, part))) for part in "xy"]
+
+
+def test_export_is_resumable_and_parallel():
+    cp = _processor()
+    out_dir = tempfile.mkdtemp()
+    index = export_shards(cp, out_dir, n_shards=3, shard_size=10, batch_size=4, seed=1)
+    assert sorted(index["shards"]) == ["0", "1", "2"] and index["params"]["classes"] == ["C", "Am"]
+    x, y = _load(out_dir, 1)
+    assert x.shape == (10, 32, 48) and x.dtype == np.uint8 and y.dtype == np.int64
+
+    # an interrupted export only writes the missing shards
+    os.remove(join(out_dir, "shard-00001-y.npy"))
+    mtime = os.path.getmtime(join(out_dir, "shard-00000-x.npy"))
+    export_shards(cp, out_dir, n_shards=3, shard_size=10, batch_size=4, seed=1)
+    assert os.path.getmtime(join(out_dir, "shard-00000-x.npy")) == mtime
+    assert all(np.array_equal(a, b) for a, b in zip(_load(out_dir, 1), (x, y)))
+
+    parallel_dir = tempfile.mkdtemp()
+    export_shards(cp, parallel_dir, n_shards=3, shard_size=10, batch_size=4, seed=1, jobs=2)
+    for shard in range(3):
+        assert all(np.array_equal(a, b) for a, b in zip(_load(out_dir, shard), _load(parallel_dir, shard)))
+
+
+def test_reader_streams_every_sample_once_per_epoch():
+    out_dir = tempfile.mkdtemp()
+    export_shards(_processor(), out_dir, n_shards=3, shard_size=10, batch_size=4, seed=0, rand_chord=False)
+    labels = np.concatenate([_load(out_dir, shard)[1] for shard in range(3)])
+
+    ordered = list(ShardReader(out_dir, batch_size=8, shuffle=False, one_hot=False))
+    assert [len(y) for _, y in ordered] == [8, 8, 8, 6]
+    assert np.array_equal(np.concatenate([y for _, y in ordered]), labels)
+
+    reader = ShardReader(out_dir, batch_size=8, buffer_size=12, epochs=2, drop_last=True, seed=0)
+    batches = list(reader)
+    assert len(reader) == 30 and len(batches) == 6
+    x, y = batches[0]
+    assert x.shape == (8, 32, 48) and y.shape == (8, 2)
+
+    images = [x for x, _ in ShardReader(out_dir, batch_size=8, buffer_size=12, seed=1)]
+    expected = np.concatenate([_load(out_dir, shard)[0] for shard in range(3)])
+    assert sorted(map(bytes, np.concatenate(images))) == sorted(map(bytes, expected))
+
+
+def test_reader_resumes_with_the_same_batches():
+    out_dir = tempfile.mkdtemp()
+    export_shards(_processor(), out_dir, n_shards=3, shard_size=10, batch_size=4, seed=0)
+    batches = list(ShardReader(out_dir, batch_size=8, buffer_size=12, epochs=2, one_hot=False, seed=3))
+
+    reader = ShardReader(out_dir, batch_size=8, buffer_size=12, epochs=2, one_hot=False, seed=3)
+    iterator = iter(reader)
+    for _ in range(5):
+        next(iterator)
+    state = reader.state_dict()
+    assert state["epoch"] == 1 and state["batch"] == 1
+
+    resumed = ShardReader(out_dir, batch_size=8, buffer_size=12, epochs=2, one_hot=False, seed=7)
+    rest = list(resumed.load_state_dict(state))
+    assert len(rest) == len(batches) - 5
+    assert all(np.array_equal(a, b) for batch, other in zip(batches[5:], rest) for a, b in zip(batch, other))
@@ -1,8 +1,12 @@
+import numpy as np
+
 from sox_chords.music.song import SoxChord, SoxSong
 from sox_chords.music.chords import get_note
 from sox_chords.music.chords import triad
 import tempfile
 from sox_chords.music.spezial_chords import major_chord_progression, minor_chord_progression
+from sox_chords.util.bank import NoteBank
+from sox_chords.util.synth import NumpyBackend
 
 def test_create_sox_song():
 
@@ -26,4 +30,19 @@ def test_create_song_from_chord_progression():
     
     output = tempfile.mktemp(suffix='.wav')
     song.generate(output)
-    print ("creating song %s" % output)
\ No newline at end of file
+    print ("creating song %s" % output)
+
+
+def test_stream_song_matches_full_render():
+    progression = [triad.MajorTriad(get_note(name)) for name in ["C", "F", "G", "C"]]
+    song = SoxSong(list(map(lambda chord: SoxChord(chord.notes, duration=.5), progression)))
+    bank = NoteBank(NumpyBackend(seed=0))
+
+    y = song.generate("", bits=32, backend=bank)
+    chunks = list(song.stream(window=.3, overlap=.02, note_length=2.0, backend=bank))
+
+    assert all(len(chunk) == int(round(.3 * 44100)) for chunk in chunks[:-1])
+    assert np.abs(np.concatenate(chunks) - y).max() < 1e-4
+
+    output = tempfile.mktemp(suffix='.wav')
+    assert song.generate_streaming(output, window=.3, backend=bank) == output
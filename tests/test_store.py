@@ -0,0 +1,57 @@
+import tempfile
+from os.path import getmtime
+
+import numpy as np
+
+from sox_chords.music.chords import triad
+from sox_chords.music.utils import get_note
+from sox_chords.util.processors import ChordProcessor
+from sox_chords.util.store import FeatureStore
+from sox_chords.util.synth import NumpyBackend
+from sox_chords.util.visualize import get_visual_batch, mel_power_spectrogram
+
+
+def _processor(store_dir, v_size=(96, 64), **kwargs):
+    chords = [triad.MajorTriad(get_note("C", 4)), triad.MinorTriad(get_note("A", 3))]
+    kwargs.setdefault("backend", "numpy")
+    return ChordProcessor(chords, None, frame_length=.5, sr=22050, in_memory=True, shift_range=[1.0], jobs=1,
+                          v_size=v_size, v_func=mel_power_spectrogram, store_dir=store_dir, **kwargs)
+
+
+def test_store_holds_the_image_of_every_frame():
+    store_dir = tempfile.mkdtemp()
+    cp = _processor(store_dir)
+    store = cp.get_feature_store()
+
+    assert len(store) == 4 and store.features.shape == (4, 64, 96)
+    assert isinstance(store.features, np.memmap)
+    assert list(store.labels) == [0, 0, 1, 1]
+    assert [entry["variant"]["freq_shift"] for entry in store.entries] == [0, 1.0, 0, 1.0]
+
+    frames = np.stack([fg.y[:11025] for _, fg in cp.fgs[0]])
+    expected = np.array(get_visual_batch(frames, 22050, cp.v_size, cp.v_func, cp.bw), dtype=np.uint8)
+    assert np.array_equal(store.features, expected)
+
+    x, y = next(cp.batch_iterator(batch_size=3, n_batches=1, rand_chord=False))
+    assert np.array_equal(x, expected[:3])
+    assert np.array_equal(y, [[1, 0], [1, 0], [0, 1]])
+
+
+def test_store_is_rebuilt_when_parameters_change():
+    store_dir = tempfile.mkdtemp()
+    store = _processor(store_dir).get_feature_store()
+    mtime = getmtime(store.features_path)
+
+    # same parameters and sources, the images are not computed again
+    _processor(store_dir).get_feature_store()
+    assert getmtime(store.features_path) == mtime
+
+    store = _processor(store_dir, v_size=(48, 32)).get_feature_store()
+    assert store.features.shape == (4, 32, 48)
+    assert not FeatureStore(store_dir, mel_power_spectrogram, (9.6, 6.4), True, 22050, .5).is_valid()
+
+    # the audio of the chords changed
+    for kwargs in [{"bits": 8}, {"harmonic": True}, {"backend": NumpyBackend(seed=0)}]:
+        mtime = getmtime(store.features_path)
+        store = _processor(store_dir, v_size=(48, 32), **kwargs).get_feature_store()
+        assert getmtime(store.features_path) > mtime
@@ -0,0 +1,97 @@
+import tempfile
+import wave
+
+import numpy as np
+
+from sox_chords.music.chords import triad
+from sox_chords.music.utils import get_note, note_to_freq, note_name_to_freq
+from sox_chords.util.bank import NoteBank
+from sox_chords.util.sox import Sox, WhiteNoise
+from sox_chords.util.synth import get_backend, compare_sampling_rates, NumpyBackend
+
+
+def test_numpy_pluck_pitch():
+    note = get_note("A", 4)
+    y = Sox.create_audio(notes=[note], sr=44100, duration=1.0, fade=0, bits=16, backend=NumpyBackend(seed=0))
+
+    assert y.dtype == np.float32
+    assert len(y) == 44100
+    assert np.isclose(np.abs(y).max(), 10 ** (-1 / 20.), atol=1e-3)
+
+    spectrum = np.abs(np.fft.rfft(y))
+    peak = np.fft.rfftfreq(len(y), 1. / 44100)[np.argmax(spectrum)]
+    harmonic = peak / 440.
+    assert abs(harmonic - round(harmonic)) < .01
+
+
+def test_note_to_freq():
+    assert np.isclose(note_to_freq(get_note("A", 4)), 440.)
+    assert np.isclose(note_to_freq(get_note("C", 4)), 261.6256, atol=1e-4)
+    # shifted notes are played around the frequency sox plays for the note name
+    for name, octave in [("C", 1), ("Eb", 3), ("B", 7)]:
+        note = get_note(name, octave)
+        assert np.isclose(note_to_freq(note), note_name_to_freq(note))
+
+
+def test_numpy_backend_writes_chord():
+    chord = triad.MajorTriad(get_note("C", 4))
+    output = chord.generate(output_dir=tempfile.mkdtemp(), duration=.5, bits=16, noise=WhiteNoise(), backend="numpy")
+
+    handler = wave.open(output, "rb")
+    assert handler.getframerate() == 44100
+    assert handler.getsampwidth() == 2
+    assert handler.getnframes() == 22050
+    handler.close()
+
+
+def test_get_backend():
+    assert get_backend("numpy").name == "numpy"
+    assert get_backend("sox").name == "sox"
+    backend = NumpyBackend(seed=1)
+    assert get_backend(backend) is backend
+
+
+def test_chord_render_in_memory():
+    chord = triad.MinorTriad(get_note("A", 3))
+    y = chord.render(duration=.25, sr=44100, bits=16, backend="numpy")
+    assert y.dtype == np.float32
+    assert y.shape == (11025,)
+
+
+def test_builder_raw_output():
+    builder = Sox.get_builder(notes=[get_note("C", 4)], sr=44100, bits=16)
+    args = builder.build(raw=True)
+    assert args[args.index("-t"):args.index("-t") + 3] == ["-t", "f32", "-"]
+    assert "-b" not in args
+
+
+class SeedingBackend(NumpyBackend):
+    """ a new but deterministic excitation on every render """
+
+    def render(self, builder):
+        self.seed += 1
+        return super(SeedingBackend, self).render(builder)
+
+
+def test_render_at_training_sampling_rate():
+    chord = triad.MajorTriad(get_note("C", 4))
+    y = chord.render(duration=.25, sr=16000, bits=16, backend="numpy")
+    assert y.shape == (4000,)
+
+    builder = Sox.get_builder(notes=chord.get_notes(), sr=22050, duration=1, bits=16)
+    assert compare_sampling_rates(builder, SeedingBackend(seed=0), repeats=8) < 3.
+
+    # the upper harmonics of high notes do not fit into 8k
+    builder = Sox.get_builder(notes=triad.MajorTriad(get_note("C", 6)).get_notes(), sr=8000, duration=1, bits=16)
+    assert compare_sampling_rates(builder, SeedingBackend(seed=0), repeats=8) > 5.
+
+
+def test_render_high_chord_at_8k():
+    # G7 and B7 are above sr / 2.5, D8 is above the Nyquist frequency
+    chord = triad.MajorTriad(get_note("G", 7))
+    for backend in [NumpyBackend(seed=0), NoteBank(NumpyBackend(seed=0))]:
+        y = chord.render(duration=.25, sr=8000, bits=16, backend=backend)
+        assert y.shape == (2000,) and np.all(np.isfinite(y))
+        assert np.isclose(np.abs(y).max(), 10 ** (-1 / 20.), atol=1e-3)
+        y = chord.render(duration=.25, sr=8000, bits=16, freq_shift=.5, backend=backend)
+        assert y.shape == (2000,) and np.all(np.isfinite(y))
@@ -1,9 +1,12 @@
 from __future__ import print_function
 import tempfile
 from sox_chords.util import visualize
+from sox_chords.util.image import figure_pool
+from sox_chords.util.utils import parallize
 from sox_chords.music.chords import triad
 from sox_chords.music import utils
 import librosa
+import numpy as np
 
 
 def test_spectrograms():
@@ -18,5 +21,34 @@ def test_spectrograms():
     data = visualize.get_visual_data(y=y, sr=sr, v_func=visualize.chromagram, bw=False, size=(25.6, 25.6), hide_axes=True)
 
 
+def _frames(count=4, sr=22050):
+    chords = [triad.MajorTriad(utils.get_note(name, 4)) for name in ["C", "D", "E", "F"]]
+    return [chord.render(duration=1., sr=sr, bits=16, backend="numpy") for chord in chords[:count]]
+
+
+def test_plotted_data_matches_features():
+    y = _frames(1)[0]
+    for v_func in [visualize.power_spectrogram, visualize.mel_power_spectrogram]:
+        for bw in [True, False]:
+            plotted = visualize.get_visual_data(y=y, sr=22050, size=(9.6, 6.4), v_func=v_func, bw=bw, fast=False)
+            computed = visualize.get_visual_data(y=y, sr=22050, size=(9.6, 6.4), v_func=v_func, bw=bw, fast=True)
+            assert plotted.shape == computed.shape
+            assert np.abs(plotted.astype(np.float64) - computed).mean() < 2.
+
+
+def test_pooled_figures_plot_concurrently():
+    frames = _frames()
+    args = [(y, 22050, (9.6, 6.4), visualize.mel_power_spectrogram, "", True, True, False) for y in frames]
+    sequential = [visualize.get_visual_data(*arg) for arg in args]
+    # reused figures are cleared, threads borrow their own figure
+    threaded = parallize(visualize.get_visual_data, args)
+    assert all(np.array_equal(a, b) for a, b in zip(sequential, threaded))
+    assert not np.array_equal(sequential[0], sequential[1])
+
+    ax = figure_pool.acquire(size=(9.6, 6.4), dpi=visualize.dpi, bw=True)
+    assert not ax.images and not ax.collections
+    figure_pool.release(ax, size=(9.6, 6.4), dpi=visualize.dpi, bw=True)
+
+
 if __name__ == "__main__":
     test_spectrograms()